@@ -0,0 +1,120 @@
+"""
+Shared async client for the DB service.
+
+Every router goes through `db` instead of calling `requests` directly, so calls reuse
+pooled keep-alive connections and never block a threadpool worker while waiting on the DB service.
+"""
+
+import os
+import re
+import json
+import time
+import aiohttp
+from dotenv import load_dotenv
+from schemas import DB_SERVICE_URL
+from services.telemetry import registry, span
+
+load_dotenv()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "100"))  # max open connections to the DB service
+DB_KEEPALIVE_TIMEOUT = float(os.getenv("DB_KEEPALIVE_TIMEOUT", "30"))  # seconds an idle connection is kept for reuse
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "30"))
+
+DB_REQUEST_SECONDS = registry.histogram("db_request_duration_seconds", "DB service calls from the gateway, until the body is read", ("method", "endpoint", "status"))
+ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_label(url: str) -> str:
+    """/sessions/42?user_id=7 -> /sessions/{id}, so metrics have one series per endpoint."""
+    return ID_SEGMENT.sub("/{id}", url.split("?", 1)[0])
+
+
+class DBResponse:
+    """
+    Fully read DB service response, exposing the parts of the `requests.Response` API the routers use.
+    """
+
+    def __init__(self, status_code: int, body: bytes):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class DBClient:
+    """
+    Thin wrapper around a lazily created `aiohttp.ClientSession`.
+
+    The session is created on first use (inside the running event loop) and recreated
+    if it was closed, e.g. between app restarts under `reload=True`.
+    """
+
+    def __init__(self, base_url: str, pool_size: int, keepalive_timeout: float, connect_timeout: float, timeout: float):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(base_url=self.base_url, connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method: str, url: str, **kwargs) -> DBResponse:
+        endpoint = endpoint_label(url)
+        status = "error"
+        start = time.perf_counter()
+        try:
+            with span(f"db {method} {endpoint}") as recorded:
+                if recorded is not None:
+                    kwargs["headers"] = {**kwargs.get("headers", {}), "traceparent": recorded.traceparent()}
+                async with self.session.request(method, url, **kwargs) as response:
+                    status = response.status
+                    return DBResponse(response.status, await response.read())
+        finally:
+            DB_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, endpoint=endpoint, status=status)
+
+    async def get(self, url: str, **kwargs) -> DBResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def get_body(self, url: str, **kwargs) -> bytes | None:
+        """Raw body of a successful GET, or None if the DB service returned an error."""
+        response = await self.get(url, **kwargs)
+        return response.body if response.status_code == 200 else None
+
+    async def open_stream(self, url: str, **kwargs) -> aiohttp.ClientResponse:
+        """
+        GET whose body is left unread, to be consumed with `response.content.iter_chunked()`.
+        The caller must `release()` the response. Timed until the headers arrive.
+        """
+        endpoint = endpoint_label(url)
+        status = "error"
+        start = time.perf_counter()
+        try:
+            response = await self.session.get(url, **kwargs)
+            status = response.status
+            return response
+        finally:
+            DB_REQUEST_SECONDS.observe(time.perf_counter() - start, method="GET", endpoint=endpoint, status=status)
+
+    async def post(self, url: str, **kwargs) -> DBResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> DBResponse:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> DBResponse:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+db = DBClient(DB_SERVICE_URL, DB_POOL_SIZE, DB_KEEPALIVE_TIMEOUT, DB_CONNECT_TIMEOUT, DB_TIMEOUT)
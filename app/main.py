@@ -1,9 +1,29 @@
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from routers import user, session, chat
+from db_client import db
+from read_cache import read_cache
+from token_cache import token_cache
+from write_behind import chat_writer
+from services.telemetry import registry, configure_tracing, MetricsMiddleware, CONTENT_TYPE
+from services.logs import setup_logging, stop_logging
 
-app = FastAPI()
+setup_logging("gateway")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_tracing("gateway")
+    yield
+    # write out batched chats and session updates, then release pooled DB service connections
+    await chat_writer.close()
+    await db.aclose()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
 #Allowed addresses
 origins = [
@@ -19,10 +39,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(user.router)
 app.include_router(session.router)
 app.include_router(chat.router)
 
+
+@app.get("/cache/stats", tags=["cache"])
+async def cache_stats():
+    return {"reads": read_cache.stats(), "tokens": token_cache.stats(), "writes": chat_writer.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
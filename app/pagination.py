@@ -0,0 +1,177 @@
+"""
+Keyset pagination, field projection and NDJSON streaming for list routes.
+
+The DB service's JSON array is read incrementally and parsed one element at a time, so
+the gateway never holds more than one chunk plus the current page (or, for NDJSON, the
+current element), however long a user's history is. `after` and `limit` are forwarded to
+the DB service so it can do the work itself, and are also applied here, so results are
+correct against a DB service that ignores them. Keyset cursors assume the DB service
+lists items in ascending id order.
+"""
+
+import os
+import re
+import json
+import codecs
+from typing import Optional
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from db_client import db
+
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+DB_STREAM_CHUNK = int(os.getenv("DB_STREAM_CHUNK", "65536"))  # bytes read from the DB service at a time
+
+SEPARATORS = re.compile(r"[\s,]*")
+decoder = json.JSONDecoder()
+
+
+class ListParams:
+    """Query parameters shared by the list routes; used as `params: ListParams = Depends()`."""
+
+    def __init__(
+        self,
+        after: Optional[int] = Query(None, description="return items with an id greater than this cursor"),
+        limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX, description="page size; the response becomes {items, next_cursor}"),
+        fields: Optional[str] = Query(None, description="comma-separated fields to return for each item"),
+        output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    ):
+        self.after = after
+        self.limit = limit
+        self.fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        self.format = output_format
+
+    @property
+    def plain(self) -> bool:
+        """True for a request for the whole list as JSON, which the read cache serves."""
+        return self.after is None and self.limit is None and self.fields is None and self.format == "json"
+
+
+async def iter_json_array(chunks):
+    """Yields the elements of a JSON array that arrives as an async iterable of byte chunks."""
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, position = "", 0
+    started = finished = False
+    async for chunk in chunks:
+        buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+        while not finished:
+            position = SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("DB service response is not a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                finished = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            if not isinstance(item, (dict, list)) and (end == len(buffer) or buffer[end] not in ",] \t\r\n"):
+                break  # a number may continue in the next chunk ("1" of "1.5")
+            position = end
+            yield item
+        if finished:
+            return
+    raise ValueError("DB service response ended before the JSON array did")
+
+
+def bad_gateway(error: ValueError) -> HTTPException:
+    return HTTPException(status_code=502, detail=f"Invalid response from the DB service: {error}")
+
+
+def project(item: dict, fields: list | None) -> dict:
+    return item if fields is None else {field: item[field] for field in fields if field in item}
+
+
+async def list_response(url: str, id_field: str, params: ListParams, error: str):
+    """
+    GET url from the DB service, applying params: a page as {items, next_cursor} when
+    limit is set, NDJSON lines when format=ndjson (followed by a {"next_cursor": ...} line
+    with limit), otherwise the (projected) list. Bodies that are not arrays of objects are
+    answered with 502.
+    """
+    query = []
+    if params.after is not None:
+        query.append(f"after={params.after}")
+    if params.limit is not None:
+        query.append(f"limit={params.limit + 1}")  # one more than the page tells us whether there is a next one
+    if query:
+        url += ("&" if "?" in url else "?") + "&".join(query)
+    response = await db.open_stream(url)
+    if response.status != 200:
+        response.release()
+        return {"error": error}
+
+    async def items():
+        try:
+            async for item in iter_json_array(response.content.iter_chunked(DB_STREAM_CHUNK)):
+                if not isinstance(item, dict):
+                    raise ValueError("DB service list item is not a JSON object")
+                if params.after is None or item.get(id_field, 0) > params.after:
+                    yield item
+        finally:
+            response.release()  # also closes the connection if the rest of the body is left unread
+
+    if params.format == "ndjson":
+        # the first item is read before the response starts, so a body that is not an array
+        # is still a 502; a later parse error can only cut the stream short
+        stream = items()
+        try:
+            first = [await anext(stream)]
+        except StopAsyncIteration:
+            first = []
+        except ValueError as e:
+            await stream.aclose()
+            raise bad_gateway(e) from None
+
+        async def rest():
+            for item in first:
+                yield item
+            async for item in stream:
+                yield item
+
+        async def lines():
+            count, pending, pending_size = 0, [], 0
+            last_id, next_cursor = None, None
+            try:
+                async for item in rest():
+                    if params.limit is not None and count == params.limit:
+                        next_cursor = last_id  # there is at least one more item
+                        break
+                    line = json.dumps(project(item, params.fields)) + "\n"
+                    pending.append(line)
+                    pending_size += len(line)
+                    if pending_size >= DB_STREAM_CHUNK:  # one write per chunk rather than per line
+                        yield "".join(pending)
+                        pending, pending_size = [], 0
+                    count += 1
+                    last_id = item.get(id_field)
+            finally:
+                await stream.aclose()
+            if params.limit is not None:  # a page ends with its cursor, null on the last page
+                pending.append(json.dumps({"next_cursor": next_cursor}) + "\n")
+            if pending:
+                yield "".join(pending)
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    page, next_cursor = [], None
+    stream = items()
+    try:
+        async for item in stream:
+            if params.limit is not None and len(page) == params.limit:
+                next_cursor = page[-1][id_field]
+                break
+            page.append(item)
+    except ValueError as e:
+        raise bad_gateway(e) from None
+    finally:
+        await stream.aclose()
+    page = [project(item, params.fields) for item in page]
+    if params.limit is None:
+        return JSONResponse(page)
+    return JSONResponse({"items": page, "next_cursor": next_cursor})
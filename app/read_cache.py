@@ -0,0 +1,132 @@
+"""
+Per-user read-through cache for DB service reads in the gateway.
+
+Responses are cached by (user_id, path) as the raw JSON bytes from the DB service, with
+an ETag derived from their content, so unchanged lists are answered from memory (or with
+304 Not Modified) without touching the DB service. Routers that write invalidate exactly
+the paths their write changes. Concurrent misses for the same path share one DB call,
+and a load that raced with a write for the same user is not stored.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from fastapi import Request, Response
+from dotenv import load_dotenv
+
+load_dotenv()
+
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "10000"))  # entries across all users; 0 disables
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "60"))  # bounds staleness from writes that bypass the gateway
+
+
+class CacheEntry:
+    def __init__(self, body: bytes, ttl: float):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.expires = time.monotonic() + ttl
+
+
+class ReadCache:
+    def __init__(self, max_size: int = READ_CACHE_SIZE, ttl: float = READ_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (user_id, path) -> CacheEntry
+        self.generations = {}  # user_id -> count of invalidations, to spot loads that raced a write
+        self.inflight = {}  # (user_id, path) -> Future of the load in progress
+        self.hits = 0
+        self.misses = 0  # reads that went to the DB service
+        self.coalesced = 0  # misses that waited for another request's DB read instead
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int, path: str) -> CacheEntry | None:
+        key = (user_id, path)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, user_id: int, path: str, body: bytes) -> CacheEntry:
+        entry = CacheEntry(body, self.ttl)
+        if self.max_size > 0:
+            self.entries[(user_id, path)] = entry
+            self.entries.move_to_end((user_id, path))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id: int, *paths: str):
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        for path in paths:
+            self.invalidations += self.entries.pop((user_id, path), None) is not None
+            self.inflight.pop((user_id, path), None)  # later readers start a fresh load
+
+    async def fetch(self, user_id: int, path: str, load) -> CacheEntry | None:
+        """
+        The cached entry for path, loading it with `await load()` on a miss. load returns
+        the body bytes, or None for a failed read, which is not cached.
+        """
+        entry = self.get(user_id, path)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        key = (user_id, path)
+        if key in self.inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self.inflight[key])
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())  # don't warn if nobody joined
+        self.inflight[key] = future
+        generation = self.generations.get(user_id, 0)
+        try:
+            body = await load()
+            entry = None
+            if body is not None:
+                if self.generations.get(user_id, 0) == generation:
+                    entry = self.put(user_id, path, body)
+                else:
+                    entry = CacheEntry(body, self.ttl)  # answer this request, but don't keep it
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.coalesced + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+        }
+
+
+read_cache = ReadCache()
+
+
+def cached_response(request: Request, entry: CacheEntry) -> Response:
+    """The entry as a JSON response, or 304 when the client already has this version."""
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if entry.etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")):
+        read_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
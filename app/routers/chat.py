@@ -1,23 +1,29 @@
-from fastapi import APIRouter, Depends;
-from schemas import Chat, DB_SERVICE_URL
-from .session import update_session
-import requests
+from fastapi import APIRouter, Depends, Request;
+from schemas import Chat
+from db_client import db
+from read_cache import read_cache, cached_response
+from write_behind import chat_writer, CHAT_AWAIT_SESSION_UPDATE
+from pagination import ListParams, list_response
 from .user import get_current_user 
 
 router = APIRouter()
 
 @router.get("/chats", tags=["chats"])
-def read_chats(current_user: int = Depends(get_current_user)):
-    response = requests.get(f"{DB_SERVICE_URL}/chats?user_id={current_user}")
-    if response.status_code != 200:
+async def read_chats(request: Request, params: ListParams = Depends(), current_user: int = Depends(get_current_user)):
+    if not params.plain:
+        return await list_response(f"/chats?user_id={current_user}", "chats_id", params, "DB SERVICE ERROR: Failed to fetch chats")
+    entry = await read_cache.fetch(current_user, "/chats", lambda: db.get_body(f"/chats?user_id={current_user}"))
+    if entry is None:
         return {"error": "DB SERVICE ERROR: Failed to fetch chats"}
-    return response.json()
+    return cached_response(request, entry)
 
 @router.post("/chats", tags=["chats"])
-def create_chat(chat: Chat, current_user: int = Depends(get_current_user)):
+async def create_chat(chat: Chat, current_user: int = Depends(get_current_user)):
     chat.sender = current_user
-    response = requests.post(f"{DB_SERVICE_URL}/chats?user_id={current_user}", json=chat.model_dump())
-    if response.status_code != 200:
+    created = await chat_writer.create_chat(current_user, chat.model_dump())
+    if created is None:
         return {"error": "DB SERVICE ERROR: Failed to create chat"}
-    update_session(chat.session_id, {"message": chat.message}, current_user)
-    return response.json()
+    session_updated = chat_writer.update_session(current_user, chat.session_id, {"message": chat.message})
+    if CHAT_AWAIT_SESSION_UPDATE and not await session_updated:
+        return {"error": "DB SERVICE ERROR: Failed to update session"}
+    return created
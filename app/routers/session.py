@@ -1,59 +1,72 @@
-from fastapi import APIRouter, Depends, Query;
-from schemas import Session, DB_SERVICE_URL
-import requests
+from fastapi import APIRouter, Depends, Query, Request;
+from schemas import Session
+from db_client import db
+from read_cache import read_cache, cached_response
+from pagination import ListParams, list_response
 from typing import Optional
 from .user import get_current_user
 
 router = APIRouter()
 
 @router.get("/sessions", tags=["sessions"])
-def read_sessions(current_user: int = Depends(get_current_user)): # Gets all sessions
+async def read_sessions(request: Request, params: ListParams = Depends(), current_user: int = Depends(get_current_user)): # Gets all sessions
     response = None
+    if not params.plain: # paged, projected or streamed
+        url = f"/sessions?user_id={current_user}" if current_user else "/sessions"
+        return await list_response(url, "session_id", params, "DB SERVICE ERROR: Failed to fetch sessions")
     if current_user:
-        response = requests.get(f"{DB_SERVICE_URL}/sessions?user_id={current_user}")
+        entry = await read_cache.fetch(current_user, "/sessions", lambda: db.get_body(f"/sessions?user_id={current_user}"))
+        if entry is None:
+            return {"error": "DB SERVICE ERROR: Failed to fetch sessions"}
+        return cached_response(request, entry)
     else:
-        response = requests.get(f"{DB_SERVICE_URL}/sessions")
+        response = await db.get("/sessions")
     if response.status_code != 200:
         return {"error": "DB SERVICE ERROR: Failed to fetch sessions"}
     return response.json()
 
 @router.get("/sessions/{session_id}", tags=["sessions"])
-def read_session(session_id: int, current_user: int = Depends(get_current_user)): # Gets session matching the given session_id
+async def read_session(session_id: int, request: Request, current_user: int = Depends(get_current_user)): # Gets session matching the given session_id
     response = None
     if current_user:
-        print(f"{DB_SERVICE_URL}/sessions/{session_id}?user_id={current_user}")
-        response = requests.get(f"{DB_SERVICE_URL}/sessions/{session_id}?user_id={current_user}")
+        entry = await read_cache.fetch(current_user, f"/sessions/{session_id}", lambda: db.get_body(f"/sessions/{session_id}?user_id={current_user}"))
+        if entry is None:
+            return {"error": "DB SERVICE ERROR: Failed to fetch requested session."}
+        return cached_response(request, entry)
     else:
-        response = requests.get(f"{DB_SERVICE_URL}/sessions/{session_id}")
+        response = await db.get(f"/sessions/{session_id}")
     if response.status_code != 200:
         return {"error": "DB SERVICE ERROR: Failed to fetch requested session."}
     return response.json()
 
 @router.post("/sessions", tags=["sessions"])
-def create_session(session: Session, current_user: int = Depends(get_current_user)):
-    response = requests.post(f"{DB_SERVICE_URL}/sessions?user_id={current_user}", json=session.model_dump())
+async def create_session(session: Session, current_user: int = Depends(get_current_user)):
+    response = await db.post(f"/sessions?user_id={current_user}", json=session.model_dump())
+    read_cache.invalidate(current_user, "/sessions")
     if response.status_code != 200:
         return {"error": "DB SERVICE ERROR: Failed to create session."}
     return response.json()
 
 @router.patch("/sessions/{session_id}", tags=["sessions"])
-def update_session(session_id: int, new_session_data: dict, current_user: int = Depends(get_current_user)):
+async def update_session(session_id: int, new_session_data: dict, current_user: int = Depends(get_current_user)):
     response = None
     if current_user:
-        response = requests.patch(f"{DB_SERVICE_URL}/sessions/{session_id}?user_id={current_user}", json=new_session_data)
+        response = await db.patch(f"/sessions/{session_id}?user_id={current_user}", json=new_session_data)
+        read_cache.invalidate(current_user, "/sessions", f"/sessions/{session_id}")
     else:   
-        response = requests.patch(f"{DB_SERVICE_URL}/sessions/{session_id}", json=new_session_data)
+        response = await db.patch(f"/sessions/{session_id}", json=new_session_data)
     if response.status_code != 200:
         return {"error": "DB SERVICE ERROR: Failed to update session."}
     return response.json()
 
 @router.delete("/sessions/{session_id}", tags=["sessions"])
-def delete_session(session_id: int, current_user: int = Depends(get_current_user)):
+async def delete_session(session_id: int, current_user: int = Depends(get_current_user)):
     response = None
     if current_user:
-        response = requests.delete(f"{DB_SERVICE_URL}/sessions/{session_id}?user_id={current_user}")
+        response = await db.delete(f"/sessions/{session_id}?user_id={current_user}")
+        read_cache.invalidate(current_user, "/sessions", f"/sessions/{session_id}")
     else:
-        response = requests.delete(f"{DB_SERVICE_URL}/sessions/{session_id}")
+        response = await db.delete(f"/sessions/{session_id}")
     if response.status_code != 200:
        return {"error": "DB SERVICE ERROR: Failed to delete session."}
     return response.json()
@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-import requests
 import jwt
 from datetime import datetime, timedelta
-from schemas import User, DB_SERVICE_URL
+from schemas import User
+from db_client import db
+from token_cache import token_cache
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
+import logging
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class LoginRequest(BaseModel):
     email: str
     password: str
@@ -22,12 +26,19 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+  # tokens verified earlier skip the signature check until they expire or are revoked
+  user_id = token_cache.get(token)
+  if user_id is not None:
+    return user_id
+  if token_cache.revoked(token):
+    raise HTTPException(status_code=401, detail="Token has been revoked")
   try:
     payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     user_id: str = payload.get("sub")
     if user_id is None:
       raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.put(token, int(user_id), payload.get("exp"))
     return int(user_id)
   except jwt.PyJWTError:
     raise HTTPException(status_code=401, detail="Could not validate credentials")
@@ -39,32 +50,38 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
   return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 # @router.get("/users", tags=["users"])
-# def read_users(current_user: int = Depends(get_current_user)):
-#   response = requests.get(f"{DB_SERVICE_URL}/users")
+# async def read_users(current_user: int = Depends(get_current_user)):
+#   response = await db.get("/users")
 #   if response.status_code != 200:
 #     return {"error": "DB SERVICE ERROR: Failed to fetch users"}
 #   return response.json()
 
 @router.post("/auth/signup", tags=["users"])
-def create_user(user: User):
-  response = requests.post(f"{DB_SERVICE_URL}/users", json=user.model_dump())
+async def create_user(user: User):
+  response = await db.post("/users", json=user.model_dump())
   if response.status_code != 200:
     raise HTTPException(status_code=400, detail="Email already registered")
   user_data = response.json()
   access_token = create_access_token(data={"sub": str(user_data["id"])}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-  print(access_token)
+  logger.info("User signed up", extra={"user_id": user_data["id"]})
   return {"access_token": access_token, "user_id": user_data["id"], "token_type": "bearer"}
 
 @router.post("/auth/login", tags=["auth"])
-def login(form_data: LoginRequest):
-  print(form_data)
-  response = requests.post(
-    f"{DB_SERVICE_URL}/auth/login",
+async def login(form_data: LoginRequest):
+  response = await db.post(
+    "/auth/login",
     json={"email": form_data.email, "password": form_data.password}
   )
   if response.status_code != 200:
     raise HTTPException(status_code=400, detail="Incorrect email or password")
   user_data = response.json()
   access_token = create_access_token(data={"sub": str(user_data["id"])}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-  print(access_token)
-  return {"access_token": access_token, "user_id": user_data["id"], "token_type": "bearer"}
\ No newline at end of file
+  logger.info("User logged in", extra={"user_id": user_data["id"]})
+  return {"access_token": access_token, "user_id": user_data["id"], "token_type": "bearer"}
+
+@router.post("/auth/logout", tags=["auth"])
+async def logout(token: str = Depends(oauth2_scheme), current_user: int = Depends(get_current_user)):
+  # already verified by get_current_user; only the expiry is needed to know how long to remember it
+  exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+  token_cache.revoke(token, exp)
+  return {"message": "Logged out"}
@@ -1,7 +1,11 @@
 from pydantic import BaseModel
 from typing import Optional
+import os
+from dotenv import load_dotenv
 
-DB_SERVICE_URL = "http://localhost:9000"
+load_dotenv()
+
+DB_SERVICE_URL = os.getenv("DB_SERVICE_URL", "http://localhost:9000")
 
 # Creating objects to be used int other
 class User(BaseModel):
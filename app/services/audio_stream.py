@@ -0,0 +1,201 @@
+"""
+Binary audio frames for the WebSocket, and the buffers they are decoded into.
+
+Every binary message is one frame: a 12-byte little-endian header followed by the payload.
+
+    offset  size  field
+    0       1     version      PROTOCOL_VERSION
+    1       1     codec        CODEC_PCM16 (interleaved 16-bit samples) or CODEC_OPUS (one packet)
+    2       1     channels     1 or 2; stereo is mixed down to mono
+    3       1     flags        FLAG_END_OF_UTTERANCE closes the current utterance
+    4       4     sample_rate  Hz; resampled to the recognizer's rate
+    8       4     sequence     increasing per connection; gaps are counted as lost frames
+
+Payloads are read through memoryview/NumPy views of the received message. Samples are
+copied once, into a preallocated per-connection AudioRingBuffer, and VAD, chunking and
+pre-roll all work on views of that buffer, so ingestion does not allocate per frame.
+"""
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+HEADER = struct.Struct("<BBBBII")
+PROTOCOL_VERSION = 1
+CODEC_PCM16 = 0
+CODEC_OPUS = 1
+FLAG_END_OF_UTTERANCE = 1
+MAX_OPUS_FRAME_MS = 120
+PCM16 = np.dtype("<i2")
+
+AudioFrame = namedtuple("AudioFrame", ["codec", "channels", "flags", "sample_rate", "sequence", "payload"])
+
+
+class AudioFormatError(ValueError):
+    pass
+
+
+def encode_frame(payload: bytes, sample_rate: int, sequence: int, codec: int = CODEC_PCM16, channels: int = 1, flags: int = 0) -> bytes:
+    """Builds a frame as a client sends it."""
+    return HEADER.pack(PROTOCOL_VERSION, codec, channels, flags, sample_rate, sequence) + payload
+
+
+def parse_frame(data: bytes) -> AudioFrame:
+    if len(data) < HEADER.size:
+        raise AudioFormatError("audio frame shorter than its header")
+    version, codec, channels, flags, sample_rate, sequence = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise AudioFormatError(f"unsupported audio protocol version {version}")
+    if codec not in (CODEC_PCM16, CODEC_OPUS):
+        raise AudioFormatError(f"unknown audio codec {codec}")
+    if channels not in (1, 2) or not 8000 <= sample_rate <= 48000:
+        raise AudioFormatError(f"unsupported audio format: {channels} channels at {sample_rate} Hz")
+    return AudioFrame(codec, channels, flags, sample_rate, sequence, memoryview(data)[HEADER.size:])
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size int16 sample buffer addressed by absolute sample position. Data stays
+    readable until overwritten, so consumers can look back (pre-roll) without keeping copies.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=np.int16)
+        self.written = 0  # absolute position after the newest sample
+
+    def write(self, samples: np.ndarray):
+        if len(samples) > self.capacity:
+            raise ValueError("write larger than the ring buffer")
+        start = self.written % self.capacity
+        end = start + len(samples)
+        if end <= self.capacity:
+            self.samples[start:end] = samples
+        else:
+            first = self.capacity - start
+            self.samples[start:] = samples[:first]
+            self.samples[:end - self.capacity] = samples[first:]
+        self.written += len(samples)
+
+    def views(self, start: int, end: int) -> tuple:
+        """One or two views covering absolute positions [start, end); two when it wraps."""
+        if start < self.written - self.capacity or end > self.written:
+            raise IndexError("range is not in the ring buffer")
+        begin = start % self.capacity
+        if begin + (end - start) <= self.capacity:
+            return (self.samples[begin:begin + end - start],)
+        return self.samples[begin:], self.samples[:end - start - (self.capacity - begin)]
+
+    def bytes(self, start: int, end: int) -> bytes:
+        return b"".join(view.data for view in self.views(start, end))
+
+
+class AudioDecoder:
+    """
+    Turns one connection's frames into mono int16 samples at target_rate. Mixing and
+    resampling write into preallocated scratch arrays; the result is a view that is only
+    valid until the next decode() call.
+    """
+
+    def __init__(self, target_rate: int, max_frame_ms: int = MAX_OPUS_FRAME_MS):
+        self.target_rate = target_rate
+        self.max_frame_ms = max_frame_ms
+        self.expected_sequence = None
+        self.lost_frames = 0
+        self._opus = None
+        self._opus_format = None
+        self._carry = np.zeros(8, dtype=np.int16)  # samples left over from a downsampling step
+        self._carried = 0
+        # scratch arrays grow to the connection's frame size on its first frames, then are reused
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self._mixed = np.zeros(0, dtype=np.int16)
+        self._out = np.zeros(0, dtype=np.int16)
+
+    def _reserve(self, samples: int, rate: int):
+        if samples + 1 > len(self._scratch):
+            self._scratch = np.zeros(samples + 1, dtype=np.float32)
+            self._mixed = np.zeros(samples + 1, dtype=np.int16)
+        resampled = samples * self.target_rate // rate + 2
+        if resampled > len(self._out):
+            self._out = np.zeros(resampled, dtype=np.int16)
+
+    def decode(self, frame: AudioFrame) -> np.ndarray:
+        if self.expected_sequence is not None and frame.sequence > self.expected_sequence:
+            self.lost_frames += frame.sequence - self.expected_sequence
+        self.expected_sequence = frame.sequence + 1
+
+        interleaved = self._pcm(frame)
+        samples = len(interleaved) // frame.channels
+        if samples > frame.sample_rate * self.max_frame_ms // 1000:
+            raise AudioFormatError(f"audio frame longer than {self.max_frame_ms} ms")
+        self._reserve(samples, frame.sample_rate)
+        mono = self._mono(interleaved, frame.channels)
+        return self._resample(mono, frame.sample_rate)
+
+    def _pcm(self, frame: AudioFrame) -> np.ndarray:
+        if frame.codec == CODEC_PCM16:
+            if len(frame.payload) % (2 * frame.channels):
+                raise AudioFormatError("PCM16 payload is not a whole number of samples")
+            return np.frombuffer(frame.payload, dtype=PCM16)
+        if self._opus_format != (frame.sample_rate, frame.channels):
+            import opuslib  # optional; only needed by clients that send Opus
+            self._opus = opuslib.Decoder(frame.sample_rate, frame.channels)
+            self._opus_format = (frame.sample_rate, frame.channels)
+        pcm = self._opus.decode(bytes(frame.payload), frame.sample_rate * self.max_frame_ms // 1000)
+        return np.frombuffer(pcm, dtype=PCM16)
+
+    def _mono(self, samples: np.ndarray, channels: int) -> np.ndarray:
+        if channels == 1:
+            return samples
+        count = len(samples) // 2
+        stereo = samples[:count * 2].reshape(count, 2)
+        scratch = self._scratch[:count]
+        np.add(stereo[:, 0], stereo[:, 1], out=scratch, dtype=np.float32)
+        scratch *= 0.5
+        mono = self._mixed[:count]
+        np.copyto(mono, scratch, casting="unsafe")
+        return mono
+
+    def _resample(self, samples: np.ndarray, rate: int) -> np.ndarray:
+        if rate == self.target_rate:
+            return samples
+        if rate % self.target_rate == 0:
+            return self._downsample(samples, rate // self.target_rate)
+        # uncommon rate pairs fall back to linear interpolation, which allocates
+        count = len(samples) * self.target_rate // rate
+        positions = np.arange(count, dtype=np.float32) * (rate / self.target_rate)
+        out = self._out[:count]
+        np.copyto(out, np.interp(positions, np.arange(len(samples)), samples), casting="unsafe")
+        return out
+
+    def _downsample(self, samples: np.ndarray, factor: int) -> np.ndarray:
+        """Average each group of `factor` samples (a box filter against aliasing)."""
+        if self._carried + len(samples) < factor:
+            self._carry[self._carried:self._carried + len(samples)] = samples
+            self._carried += len(samples)
+            return self._out[:0]
+        if self._carried:
+            need = factor - self._carried
+            self._carry[self._carried:factor] = samples[:need]
+            head = self._carry[:factor]
+            samples = samples[need:]
+        else:
+            head = None
+        count = len(samples) // factor
+        offset = 0 if head is None else 1
+        scratch = self._scratch[:count + offset]
+        if head is not None:
+            scratch[0] = float(head.sum())
+        # summing strided views is much cheaper than a reduce over a (count, factor) reshape
+        used = count * factor
+        body = scratch[offset:]
+        np.add(samples[0:used:factor], samples[1:used:factor], out=body, dtype=np.float32)
+        for phase in range(2, factor):
+            np.add(body, samples[phase:used:factor], out=body)
+        rest = len(samples) - used
+        self._carry[:rest] = samples[used:]
+        self._carried = rest
+        out = self._out[:count + offset]
+        np.multiply(scratch, 1 / factor, out=out, casting="unsafe")
+        return out
@@ -0,0 +1,36 @@
+"""
+Caller identity for the WebSocket service.
+
+DB sessions (numeric session ids) belong to a user, so a connection or /chat_history
+request may only use one after proving who it is with an access token issued by the
+gateway (POST /auth/login). The token is checked with the gateway's SECRET_KEY and
+ALGORITHM, and its "sub" claim is the user id.
+"""
+
+import os
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM")
+
+
+def bearer_token(headers, query_params) -> str | None:
+    """The access token from an "Authorization: Bearer" header, or a ?token= parameter for browser WebSockets."""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return query_params.get("token")
+
+
+def verify_token(token: str | None) -> int | None:
+    """The user id of a valid, unexpired access token, None otherwise."""
+    if not token or not SECRET_KEY or not ALGORITHM:
+        return None
+    try:
+        user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        return int(user_id) if user_id is not None else None
+    except (jwt.PyJWTError, ValueError, TypeError):
+        return None
@@ -0,0 +1,119 @@
+"""
+Local fast-path classifier for dictated input.
+
+Decides whether an utterance is a text-editing command or normal speech without a model
+round trip, using keyword/regex rules and (optionally) a small scikit-learn style model.
+Only inputs it is not confident about are left for the remote LLM classifier.
+"""
+
+import os
+import re
+import pickle
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COMMAND_THRESHOLD = float(os.getenv("COMMAND_DETECTOR_HIGH", "0.85"))  # score at or above -> command
+SPEECH_THRESHOLD = float(os.getenv("COMMAND_DETECTOR_LOW", "0.2"))  # score at or below -> speech
+COMMAND_MODEL_PATH = os.getenv("COMMAND_MODEL_PATH")  # optional pickled classifier with predict_proba()
+
+# polite lead-ins stripped before matching ("okay, please delete that" -> "delete that")
+LEAD_IN = re.compile(r"^(?:(?:ok(?:ay)?|hey|um+|uh+|hmm+|actually|so|and|now|please|can you|could you|would you|i want you to|let's|lets)[\s,]+)+")
+
+# imperative editing instructions at the start of an utterance
+COMMAND_PATTERNS = [re.compile(p) for p in (
+    r"^(?:delete|remove|erase|cut|drop|get rid of)\b",
+    r"^(?:undo|redo)\b",
+    r"^(?:scratch|strike) that\b",
+    r"^(?:replace|change|swap|switch)\b.*\b(?:with|to|into|for)\b",
+    r"^(?:make|turn)\s+(?:it|this|that|these|those|the|everything|all|them)\b",
+    r"^(?:rewrite|rephrase|reword|paraphrase|summari[sz]e|shorten|expand|simplify|translate|proofread|reformat)\b",
+    r"^(?:capitali[sz]e|uppercase|lowercase|bold|italici[sz]e|underline|highlight|indent|format)\b",
+    r"^(?:fix|correct)\s+(?:the\s+|any\s+|all\s+)?(?:spelling|grammar|typos?|punctuation|formatting|capitali[sz]ation)",
+    r"^(?:add|insert|put)\s+(?:a\s+|an\s+|the\s+|some\s+)?(?:heading|title|bullet|list|new line|line break|paragraph break|comma|period|full stop|colon|semicolon|quotes?)\b",
+    r"^(?:move|merge|split|swap)\s+(?:the|this|that|it)\b",
+    r"^(?:new paragraph|new line|next line|clear (?:all|everything|the document))\b",
+    r"^(?:change|set|use)\s+(?:the\s+)?tone\b",
+)]
+
+# references to parts of the document, common in commands but also possible in speech
+REFERENCE_PATTERN = re.compile(
+    r"\b(?:the|this|that)\s+(?:last|previous|first|second|third|next|above|whole|entire|final)?\s*"
+    r"(?:sentence|paragraph|line|word|heading|title|bullet|list|section|document|text)\b"
+)
+
+# editing verbs that appear mid-sentence ("I think we should delete ...")
+EDIT_VERB_PATTERN = re.compile(r"\b(?:delete|remove|erase|replace|swap|rewrite|rephrase|reword|undo|redo|capitali[sz]e|bold|italici[sz]e|move|fix|shorten|get rid of)\b")
+
+
+class CommandDetector:
+    """
+    Scores utterances in [0, 1] (1 = command) and only decides when the score is
+    outside the ambiguous band between SPEECH_THRESHOLD and COMMAND_THRESHOLD.
+    """
+
+    def __init__(self, command_threshold: float = COMMAND_THRESHOLD, speech_threshold: float = SPEECH_THRESHOLD, model=None):
+        self.command_threshold = command_threshold
+        self.speech_threshold = speech_threshold
+        self.model = model
+        self.stats = {"command": 0, "speech": 0, "fallback": 0}
+        self._lock = threading.Lock()
+
+    def rule_score(self, text: str) -> float:
+        text = LEAD_IN.sub("", text.lower().strip(" .!?")).strip()
+        if not text:
+            return 0.0
+        if any(pattern.search(text) for pattern in COMMAND_PATTERNS):
+            return 0.95
+
+        score = 0.1
+        if REFERENCE_PATTERN.search(text):
+            score += 0.35
+        if EDIT_VERB_PATTERN.search(text):
+            score += 0.25
+        if len(text.split()) > 25:  # long utterances are almost always dictation
+            score -= 0.1
+        return max(0.0, min(score, 1.0))
+
+    def score(self, text: str) -> float:
+        """Probability-like score that text is a command."""
+        score = self.rule_score(text)
+        if self.model is not None and self.speech_threshold < score < self.command_threshold:
+            # the rules are unsure, let the model break the tie
+            classes = list(self.model.classes_)
+            score = float(self.model.predict_proba([text])[0][classes.index("command")])
+        return score
+
+    def classify(self, text: str) -> str | None:
+        """
+        Return 'command' or 'speech' if the local stage is confident, otherwise None
+        so the caller falls back to the remote classifier.
+        """
+        score = self.score(text)
+        if score >= self.command_threshold:
+            label = "command"
+        elif score <= self.speech_threshold:
+            label = "speech"
+        else:
+            label = None
+        with self._lock:
+            self.stats[label or "fallback"] += 1
+        return label
+
+    def hit_rate(self) -> float:
+        """Fraction of classified inputs answered without the remote classifier."""
+        with self._lock:
+            total = sum(self.stats.values())
+            return (total - self.stats["fallback"]) / total if total else 0.0
+
+
+def load_model(path: str | None = COMMAND_MODEL_PATH):
+    """Load an optional pickled text classifier (e.g. a scikit-learn TF-IDF + LogisticRegression pipeline)."""
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+detector = CommandDetector(model=load_model())
@@ -0,0 +1,332 @@
+"""
+Concurrency control for the WebSocket LLM path.
+
+- llm_executor: dedicated worker threads for the remaining blocking LLM calls (Mistral),
+  so they do not compete with everything else on the default executor. Gemini and
+  Vertex calls are async (see llm_http.py) and need no thread.
+- BackendLimiter: per-backend cap on concurrent calls plus a token bucket for the
+  request rate, shared by all connections, with slot() for threads and aslot() for
+  coroutines. Calls that would wait longer than LLM_QUEUE_TIMEOUT raise BackendBusy
+  instead of piling up.
+- turn_slots: global limit on turns being processed at once across all connections.
+- UtteranceQueue: per-connection queue that merges consecutive pending speech
+  utterances into one LLM call and refuses new input once too much is pending.
+- STAGE_SECONDS, LLM_TOKENS: per-stage latency and token metrics recorded along the
+  dictation path (see telemetry.py).
+- Speculative, SpeculativeStream: model calls started as tasks before it is known
+  whether they are needed, within a SpeculationBudget of SPECULATION_PER_MINUTE calls.
+- session_locks: one lock per session, held from reading a session's state to writing
+  it back, so concurrent turns and /chat_history updates of a session do not overwrite
+  each other.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from command_detector import detector
+from telemetry import registry
+
+load_dotenv()
+
+LLM_WORKER_THREADS = int(os.getenv("LLM_WORKER_THREADS", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))  # max seconds to wait for a backend slot
+LLM_MAX_PENDING_CHARS = int(os.getenv("LLM_MAX_PENDING_CHARS", "2000"))  # per-connection backlog before "busy"
+LLM_MAX_INFLIGHT_TURNS = int(os.getenv("LLM_MAX_INFLIGHT_TURNS", "64"))
+SPECULATION_PER_MINUTE = float(os.getenv("SPECULATION_PER_MINUTE", "0"))  # speculative model calls allowed; 0 disables
+
+# per-backend defaults, overridable with LLM_MAX_CONCURRENCY_<BACKEND> and LLM_RATE_<BACKEND> (requests/second)
+BACKEND_DEFAULTS = {
+    "gemini": {"concurrency": 16, "rate": 10.0},
+    "vertex": {"concurrency": 8, "rate": 5.0},
+    "mistral": {"concurrency": 4, "rate": 2.0},
+}
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKER_THREADS, thread_name_prefix="llm")
+turn_slots = asyncio.Semaphore(LLM_MAX_INFLIGHT_TURNS)
+
+STAGE_SECONDS = registry.histogram("dictation_stage_seconds", "Time spent in each dictation stage, per backend", ("stage", "backend"))
+LLM_TOKENS = registry.counter("llm_tokens_total", "Tokens billed by model backends (cache hits use none)", ("backend", "kind"))
+PENDING_UTTERANCES = registry.gauge("utterances_pending", "Utterances queued across all connections")
+SPECULATIONS = registry.counter("speculative_calls_total", "Model calls started before they were known to be needed", ("outcome",))
+
+
+def record_tokens(backend: str, prompt: int | None, completion: int | None):
+    if prompt:
+        LLM_TOKENS.inc(prompt, backend=backend, kind="prompt")
+    if completion:
+        LLM_TOKENS.inc(completion, backend=backend, kind="completion")
+
+
+class BackendBusy(Exception):
+    """Raised when a backend has no free slot within the queue timeout."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() returns how long the caller must wait for its token."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > timeout:
+                raise BackendBusy(f"rate limit would delay the call by {wait:.1f}s")
+            self.tokens -= 1
+            return wait
+
+
+class BackendLimiter:
+    """
+    Caps concurrent calls and request rate per backend. Used from worker threads:
+
+        with backend_limiter.slot("mistral"):
+            ...call the model...
+
+    or from coroutines with `async with backend_limiter.aslot("gemini")`. A backend is
+    expected to be used from one side only; the two have separate semaphores.
+    """
+
+    def __init__(self, defaults: dict = BACKEND_DEFAULTS, timeout: float = LLM_QUEUE_TIMEOUT):
+        self.timeout = timeout
+        self.semaphores = {}
+        self.async_semaphores = {}
+        self.buckets = {}
+        self.in_flight = {}
+        for backend, config in defaults.items():
+            concurrency = int(os.getenv(f"LLM_MAX_CONCURRENCY_{backend.upper()}", config["concurrency"]))
+            rate = float(os.getenv(f"LLM_RATE_{backend.upper()}", config["rate"]))
+            self.semaphores[backend] = threading.BoundedSemaphore(concurrency)
+            self.async_semaphores[backend] = asyncio.Semaphore(concurrency)
+            self.buckets[backend] = TokenBucket(rate, burst=max(1.0, rate))
+            self.in_flight[backend] = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, backend: str):
+        start = time.monotonic()
+        if not self.semaphores[backend].acquire(timeout=self.timeout):
+            raise BackendBusy(f"no free {backend} slot after {self.timeout}s")
+        try:
+            time.sleep(self.buckets[backend].reserve(self.timeout - (time.monotonic() - start)))
+            with self._lock:
+                self.in_flight[backend] += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight[backend] -= 1
+        finally:
+            self.semaphores[backend].release()
+
+    @asynccontextmanager
+    async def aslot(self, backend: str):
+        start = time.monotonic()
+        semaphore = self.async_semaphores[backend]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except TimeoutError:
+            raise BackendBusy(f"no free {backend} slot after {self.timeout}s") from None
+        try:
+            await asyncio.sleep(self.buckets[backend].reserve(self.timeout - (time.monotonic() - start)))
+            with self._lock:
+                self.in_flight[backend] += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight[backend] -= 1
+        finally:
+            semaphore.release()
+
+
+backend_limiter = BackendLimiter()
+registry.gauge("llm_calls_in_flight", "Model calls holding a backend slot", ("backend",), function=lambda: {(backend,): count for backend, count in backend_limiter.in_flight.items()})
+
+
+class SpeculationBudget:
+    """Caps speculative calls to per_minute (bursts of a tenth of that); they cost as much as real ones."""
+
+    def __init__(self, per_minute: float = SPECULATION_PER_MINUTE):
+        self.bucket = TokenBucket(per_minute / 60, burst=max(1.0, per_minute / 10)) if per_minute > 0 else None
+
+    def allow(self) -> bool:
+        if self.bucket is None:
+            return False
+        try:
+            self.bucket.reserve(0)
+        except BackendBusy:
+            SPECULATIONS.inc(outcome="over_budget")
+            return False
+        return True
+
+
+class Speculative:
+    """
+    A coroutine started as a task ahead of time. result() awaits it; drop() cancels it,
+    which also aborts its HTTP request.
+    """
+
+    def __init__(self, coroutine):
+        self.task = asyncio.ensure_future(coroutine)
+
+    async def result(self):
+        SPECULATIONS.inc(outcome="hit")
+        return await self.task
+
+    def drop(self):
+        SPECULATIONS.inc(outcome="miss")
+        self.task.cancel()
+
+
+class SpeculativeStream:
+    """
+    Streaming counterpart of Speculative: an async chunk generator pulled by a task ahead
+    of time into a buffer. Iterating yields the buffered and remaining chunks; drop()
+    cancels the task, which closes the model stream.
+    """
+
+    _done = object()
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.error = None
+        self._buffer = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.chunks:
+                self._buffer.put_nowait(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            await self.chunks.aclose()
+            self._buffer.put_nowait(self._done)
+
+    async def __aiter__(self):
+        SPECULATIONS.inc(outcome="hit")
+        try:
+            while (chunk := await self._buffer.get()) is not self._done:
+                yield chunk
+        finally:
+            self.task.cancel()  # no-op once the stream is complete; the consumer may stop early
+        if self.error is not None:
+            raise self.error
+
+    def drop(self):
+        SPECULATIONS.inc(outcome="miss")
+        self.task.cancel()
+
+
+class Utterance:
+    def __init__(self, content: str, tone: str, stream: bool = False):
+        self.content = content
+        self.tone = tone
+        self.stream = stream
+        self.received = time.monotonic()
+        self.speech = detector.score(content) <= detector.speech_threshold  # confidently not a command
+
+    def mergeable(self, other: "Utterance") -> bool:
+        return self.speech and other.speech and self.tone == other.tone and self.stream == other.stream
+
+    def merge(self, other: "Utterance"):
+        self.content = f"{self.content} {other.content}"
+
+
+class UtteranceQueue:
+    """
+    Pending utterances of one connection. get() returns the oldest utterance merged
+    with the speech that followed it, so a client talking faster than the model
+    answers produces fewer, larger LLM calls instead of a growing backlog.
+    """
+
+    def __init__(self, max_chars: int = LLM_MAX_PENDING_CHARS):
+        self.max_chars = max_chars
+        self.merged = 0
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def pending_chars(self) -> int:
+        return sum(len(item.content) for item in self._items)
+
+    def put(self, utterance: Utterance) -> bool:
+        """Queue an utterance; returns False (and drops it) if the backlog is full."""
+        if self._items and self.pending_chars + len(utterance.content) > self.max_chars:
+            return False
+        self._items.append(utterance)
+        self._ready.set()
+        PENDING_UTTERANCES.inc()
+        return True
+
+    def requeue(self, utterance: Utterance):
+        """Put an utterance back at the front, e.g. after a backend was busy."""
+        self._items.appendleft(utterance)
+        self._ready.set()
+        PENDING_UTTERANCES.inc()
+
+    async def get(self) -> Utterance:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        utterance = self._items.popleft()
+        PENDING_UTTERANCES.dec()
+        while self._items and utterance.mergeable(self._items[0]):
+            utterance.merge(self._items.popleft())
+            PENDING_UTTERANCES.dec()
+            self.merged += 1
+        return utterance
+
+    def clear(self):
+        """Drops what is still pending, e.g. when the connection closes."""
+        PENDING_UTTERANCES.dec(len(self._items))
+        self._items.clear()
+
+
+class SessionLocks:
+    """
+    asyncio.Lock per session id, dropped once nobody holds or waits for it. Only
+    serializes updates within one process (enough for the in-memory session store).
+    """
+
+    def __init__(self):
+        self._locks = {}  # session_id -> (lock, holders and waiters)
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def __call__(self, session_id: str):
+        lock, users = self._locks.get(session_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[session_id]
+            if users == 1:
+                del self._locks[session_id]
+            else:
+                self._locks[session_id] = (lock, users - 1)
+
+
+session_locks = SessionLocks()
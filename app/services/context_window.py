@@ -0,0 +1,204 @@
+"""
+Bounded context for LLM editing calls.
+
+Rather than sending the whole document with every utterance, each call gets a window
+of it plus a short summary of everything else, and the model output is spliced back
+into the full document locally:
+
+- speech_context(): the tail of the document, which new dictation is appended to.
+- command_context(): the paragraphs a command refers to ("the last sentence", quoted
+  or repeated words, "the title", ...), or the whole text for document-wide commands.
+  The model returns its window in full, so no window is longer than the edit call's
+  output budget (WHOLE_DOCUMENT_CHARS) can hold.
+- splice(): replaces the window in the full document with the model output.
+
+Per-turn prompt size therefore stays roughly flat as the document grows.
+"""
+
+import os
+import re
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPEECH_WINDOW_CHARS = int(os.getenv("SPEECH_WINDOW_CHARS", "2000"))  # tail sent with dictated speech
+COMMAND_WINDOW_CHARS = int(os.getenv("COMMAND_WINDOW_CHARS", "4000"))  # paragraphs sent with a command
+SUMMARY_CHARS = int(os.getenv("SUMMARY_CHARS", "1000"))  # summary of the text outside the window
+COMMAND_OUTPUT_TOKENS = int(os.getenv("COMMAND_OUTPUT_TOKENS", "2048"))  # maxOutputTokens of edit calls
+# largest command window: its edited version must fit in COMMAND_OUTPUT_TOKENS (about 3 chars per token, with room for additions)
+WHOLE_DOCUMENT_CHARS = int(os.getenv("WHOLE_DOCUMENT_CHARS", str(COMMAND_OUTPUT_TOKENS * 3)))
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"[a-z0-9']+")
+
+WHOLE_DOCUMENT = re.compile(r"\b(?:whole|entire|everything|all of it|throughout|the document|the text)\b")
+TAIL_REFERENCE = re.compile(r"\b(?:last|previous|latest|recent|that|this|above|undo|redo|scratch)\b")
+HEAD_REFERENCE = re.compile(r"\b(?:first|beginning|start|top|title|heading|intro(?:duction)?|opening)\b")
+
+# words that say what to do rather than where, ignored when matching a command to paragraphs
+STOPWORDS = frozenset("""
+a an the and or but of to in on at for with from by into onto as is are was were be it its this that these those
+please can could would you your i me my we our make change replace delete remove rewrite rephrase add insert put
+move fix correct capitalize capitalise bold italicize underline shorten expand summarize summarise translate swap
+undo redo word words sentence sentences paragraph paragraphs line lines text more less so just also then
+""".split())
+
+
+class Context:
+    """
+    The part of the document sent to the model: document[start:end], plus a summary
+    of the rest for reference.
+    """
+
+    def __init__(self, document: str, start: int, end: int, summary: str = ""):
+        self.document = document
+        self.start = start
+        self.end = end
+        self.summary = summary
+
+    @property
+    def window(self) -> str:
+        return self.document[self.start:self.end]
+
+    def shifted(self, chars: int) -> "Context":
+        """The same context with the first `chars` characters of the window moved to the prefix."""
+        return Context(self.document, min(self.end, self.start + chars), self.end, self.summary) if chars else self
+
+    @property
+    def prefix(self) -> str:
+        """Text before the window, kept as is."""
+        return self.document[:self.start]
+
+    @property
+    def suffix(self) -> str:
+        """Text after the window, including the paragraph break that separated them."""
+        tail = self.document[self.end:]
+        if not tail:
+            return ""
+        window = self.window
+        return window[len(window.rstrip()):] + tail
+
+
+def paragraph_spans(text: str) -> list:
+    """(start, end) of every paragraph; each span includes the break that follows it."""
+    spans = []
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        spans.append((start, match.end()))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+@lru_cache(maxsize=4096)
+def lead_sentence(paragraph: str, limit: int = 160) -> str:
+    sentence = SENTENCE_END.split(paragraph.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def summarize(text: str, limit: int = SUMMARY_CHARS) -> str:
+    """
+    Extractive summary: the lead sentence of each paragraph. Leads are memoized per
+    paragraph, so re-summarizing a document that only grew at the end is cheap. When
+    over the limit, the opening paragraph and the most recent ones are kept.
+    """
+    leads = [lead_sentence(text[start:end]) for start, end in paragraph_spans(text)]
+    leads = [lead for lead in leads if lead]
+    if not leads:
+        return ""
+    summary = leads[:1]
+    used = len(leads[0])
+    recent = []
+    for lead in reversed(leads[1:]):
+        if used + len(lead) > limit:
+            summary.append("...")
+            break
+        recent.append(lead)
+        used += len(lead)
+    return "\n".join(summary + recent[::-1])
+
+
+def tail_start(text: str, limit: int) -> int:
+    """Start of the shortest run of whole paragraphs at the end of text covering `limit` characters."""
+    if len(text) <= limit:
+        return 0
+    for start, _ in reversed(paragraph_spans(text)):
+        if len(text) - start >= limit:
+            if len(text) - start <= limit * 2:
+                return start
+            break
+    # the last paragraph alone is too long: cut at a sentence boundary instead
+    cut = len(text) - limit
+    match = SENTENCE_END.search(text, cut)
+    return match.end() if match and match.end() < len(text) else cut
+
+
+def build_context(document: str, start: int, end: int) -> Context:
+    rest = document[:start] + document[end:]
+    return Context(document, start, end, summarize(rest) if rest.strip() else "")
+
+
+def speech_context(document: str, limit: int = SPEECH_WINDOW_CHARS) -> Context:
+    """Window for appending dictated speech: the end of the document."""
+    return build_context(document, tail_start(document, limit), len(document))
+
+
+def clamp(document: str, start: int, end: int, limit: int) -> tuple:
+    """The end of document[start:end], at most limit characters, cut at a sentence boundary."""
+    if end - start <= limit:
+        return start, end
+    cut = end - limit
+    match = SENTENCE_END.search(document, cut, end)
+    return (match.end() if match and match.end() < end else cut), end
+
+
+def command_context(document: str, command: str, limit: int = COMMAND_WINDOW_CHARS, max_chars: int = WHOLE_DOCUMENT_CHARS) -> Context:
+    """
+    Window for an editing command: the paragraphs it most likely targets, at most
+    max_chars. Document-wide commands get the whole document when it fits in max_chars,
+    and otherwise a max_chars window chosen like any other command's.
+    """
+    command = command.lower()
+    if WHOLE_DOCUMENT.search(command):
+        limit = max(limit, max_chars)
+    if len(document) <= min(limit, max_chars):
+        return Context(document, 0, len(document))
+
+    spans = paragraph_spans(document)
+    keywords = set(WORD.findall(command)) - STOPWORDS
+    scores = [0] * len(spans)
+    if keywords:
+        lowered = document.lower()
+        for i, (start, end) in enumerate(spans):
+            paragraph = lowered[start:end]
+            if any(keyword in paragraph for keyword in keywords):  # cheap substring check first
+                scores[i] = len(keywords & set(WORD.findall(paragraph)))
+
+    if max(scores, default=0) > 0:
+        best = max(range(len(spans)), key=lambda i: (scores[i], i))  # ties go to the most recent paragraph
+    elif HEAD_REFERENCE.search(command) and not TAIL_REFERENCE.search(command):
+        best = 0
+    else:
+        return build_context(document, *clamp(document, tail_start(document, limit), len(document), max_chars))
+
+    # grow the window around the best paragraph while it fits
+    first = last = best
+    while True:
+        size = spans[last][1] - spans[first][0]
+        grow_before = first > 0 and size + spans[first - 1][1] - spans[first - 1][0] <= limit
+        grow_after = last < len(spans) - 1 and size + spans[last + 1][1] - spans[last + 1][0] <= limit
+        if grow_after:
+            last += 1
+        elif grow_before:
+            first -= 1
+        else:
+            break
+    return build_context(document, *clamp(document, spans[first][0], spans[last][1], max_chars))
+
+
+def splice(context: Context, output: str) -> str:
+    """Put the model's version of the window back into the full document."""
+    return context.prefix + output + context.suffix
@@ -0,0 +1,102 @@
+"""
+Multi-turn DialoGPT-style conversations with KV-cache reuse.
+
+The model's KV cache for earlier turns is kept between calls, so each turn only runs the
+model over its own new tokens instead of re-encoding the whole conversation. History is a
+sliding window of whole turns: when it would outgrow max_history_tokens the oldest turns
+are dropped and what remains is re-encoded once, so per-turn cost stays flat however long
+the conversation runs.
+
+Works with any Hugging Face causal LM that separates turns with its end-of-sequence token.
+"""
+
+import torch
+
+# after a trim the history fills at most this share of the window, so re-encoding is rare
+TRIM_TARGET = 0.75
+
+
+class ConversationEngine:
+    def __init__(
+            self,
+            model,
+            tokenizer,
+            max_history_tokens: int = 512,
+            max_new_tokens: int = 100,
+            num_threads: int | None = None,
+        ):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        max_positions = getattr(model.config, "n_positions", None) or getattr(model.config, "max_position_embeddings", 1024)
+        self.max_history_tokens = min(max_history_tokens, max_positions)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.turns = []  # token ids of each user input and reply, each ending in end-of-sequence
+        self.prefills = 0  # times the window had to be re-encoded from scratch, for benchmarks
+        self._past = None  # KV cache for the first self._cached tokens of the history
+        self._cached = 0
+
+    @property
+    def history_length(self) -> int:
+        return sum(len(turn) for turn in self.turns)
+
+    def reset(self):
+        self.turns = []
+        self._past = None
+        self._cached = 0
+
+    @torch.inference_mode()
+    def respond(self, text: str) -> str:
+        """Add a user turn, generate the reply (greedy) and return its text."""
+        eos = self.tokenizer.eos_token_id
+        # an input too long for the window keeps its end, leaving room for the reply
+        user_ids = (self.tokenizer.encode(text) + [eos])[-(self.max_history_tokens - self.max_new_tokens):]
+        self.turns.append(user_ids)
+        self._trim()
+        try:
+            reply_ids = self._generate()
+        except Exception:
+            # the cache may have been updated in place part way through; rebuild it next turn
+            self.turns.pop()
+            self._past = None
+            self._cached = 0
+            raise
+        self.turns.append(reply_ids)
+        return self.tokenizer.decode(reply_ids, skip_special_tokens=True)
+
+    def _trim(self):
+        """Drop the oldest turns once history plus a full reply would overflow the window."""
+        if self.history_length + self.max_new_tokens <= self.max_history_tokens:
+            return
+        budget = int(self.max_history_tokens * TRIM_TARGET) - self.max_new_tokens
+        while len(self.turns) > 1 and self.history_length > budget:
+            self.turns.pop(0)
+        # position embeddings are baked into the cached keys, so the kept turns are re-encoded
+        self._past = None
+        self._cached = 0
+
+    def _generate(self) -> list:
+        eos = self.tokenizer.eos_token_id
+        history = [token for turn in self.turns for token in turn]
+        if self._past is None:
+            self.prefills += 1
+        input_ids = torch.tensor([history[self._cached:]])
+        past = self._past
+        fed = self._cached
+        reply = []
+        for _ in range(self.max_new_tokens):
+            output = self.model(input_ids=input_ids, past_key_values=past, use_cache=True)
+            past = output.past_key_values
+            fed += input_ids.shape[1]
+            token = int(output.logits[0, -1].argmax())
+            reply.append(token)
+            if token == eos:
+                break
+            input_ids = torch.tensor([[token]])
+        if reply[-1] != eos:
+            reply.append(eos)  # cut off at max_new_tokens; still close the turn
+        self._past = past
+        self._cached = fed  # the reply's last token is fed with the next user turn
+        return reply
@@ -0,0 +1,113 @@
+"""
+Versioned document model for a dictation session.
+
+Instead of sending the whole chat history after every turn, the WebSocket service sends
+the edit operations that turn the client's copy (at version N) into the new text (N + 1):
+
+    {"type": "ops", "base": 4, "version": 5, "ops": [{"op": "insert", "pos": 120, "text": " More text."}]}
+
+Positions are offsets into the base version; ops are sorted by position and do not overlap,
+so clients apply them back to front. A client that misses a version asks for a full
+snapshot with {"type": "resync"}.
+"""
+
+from difflib import SequenceMatcher
+
+# changed regions larger than this are split into line-level ops instead of one big replace
+LINE_DIFF_THRESHOLD = 2048
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """Length of the common prefix, found by binary search over slice comparisons (done in C)."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix, not extending past `limit` characters."""
+    low, high = 0, min(len(a), len(b), limit)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def make_op(start: int, end: int, text: str) -> dict:
+    if start == end:
+        return {"op": "insert", "pos": start, "text": text}
+    return {"op": "replace", "start": start, "end": end, "text": text}
+
+
+def diff_ops(old: str, new: str) -> list:
+    """Compute the edit ops that turn old into new."""
+    if old == new:
+        return []
+    prefix = common_prefix_length(old, new)
+    suffix = common_suffix_length(old, new, min(len(old), len(new)) - prefix)
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+
+    if len(old_mid) < LINE_DIFF_THRESHOLD or len(new_mid) < LINE_DIFF_THRESHOLD:
+        return [make_op(prefix, prefix + len(old_mid), new_mid)]
+
+    # large rewrite, e.g. a command touching several paragraphs: only send changed lines
+    old_lines = old_mid.splitlines(keepends=True)
+    new_lines = new_mid.splitlines(keepends=True)
+    old_offsets = [prefix]
+    for line in old_lines:
+        old_offsets.append(old_offsets[-1] + len(line))
+
+    ops = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            ops.append(make_op(old_offsets[i1], old_offsets[i2], "".join(new_lines[j1:j2])))
+    return ops
+
+
+def apply_ops(text: str, ops: list) -> str:
+    """Apply ops produced by diff_ops (the client-side algorithm, used for checking)."""
+    for op in reversed(ops):
+        start = op["pos"] if op["op"] == "insert" else op["start"]
+        end = op["pos"] if op["op"] == "insert" else op["end"]
+        text = text[:start] + op["text"] + text[end:]
+    return text
+
+
+class Document:
+    """
+    The text of one session plus a version number that increases on every change.
+    """
+
+    def __init__(self, text: str = "", version: int = 0):
+        self.text = text
+        self.version = version
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Document":
+        return cls(state.get("history", ""), state.get("version", 0))
+
+    def to_state(self) -> dict:
+        return {"history": self.text, "version": self.version}
+
+    def update(self, new_text: str) -> dict | None:
+        """Replace the text, returning the ops message for the change (None if nothing changed)."""
+        ops = diff_ops(self.text, new_text)
+        if not ops:
+            return None
+        base = self.version
+        self.text = new_text
+        self.version += 1
+        return {"type": "ops", "base": base, "version": self.version, "ops": ops}
+
+    def snapshot(self) -> dict:
+        return {"type": "snapshot", "version": self.version, "data": self.text}
@@ -0,0 +1,32 @@
+import threading
+
+
+class Lazy:
+    """
+    A value built by factory on first get() and shared by every thread afterwards.
+    Keeps heavy imports, model downloads and credential lookups out of module import time.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+        return self._value
+
+    def reset(self):
+        """Drop the value so the next get() builds a fresh one."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
@@ -0,0 +1,218 @@
+"""
+Content-hashed response cache for LLM calls.
+
+Identical requests (same backend, prompt template, tone, input and file content) are
+served from an in-memory LRU and, optionally, an on-disk SQLite tier instead of making
+another paid model call. Caching is opt-in per backend through LLM_CACHE_BACKENDS so
+sampling backends (Mistral with do_sample=True, Vertex edit commands at temperature=1)
+bypass it by default.
+
+Only successful results are cached: wrapped functions must raise on failure.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import inspect
+import threading
+import functools
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_BACKENDS = set(filter(None, os.getenv("LLM_CACHE_BACKENDS", "gemini").split(",")))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # SQLite file for the disk tier, disabled if unset
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+
+def cache_key(backend: str, payload) -> str:
+    """sha256 over the backend name and the JSON-encoded request."""
+    encoded = json.dumps([backend, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class DiskCache:
+    """SQLite-backed second tier, shared by processes using the same file."""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            self.writes += 1
+            if self.writes % 100 == 0:  # prune occasionally, not on every write
+                self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+            self._db.commit()
+
+
+class ResponseCache:
+    """
+    In-memory LRU bounded by entry count, total size and TTL, with an optional disk tier.
+    """
+
+    def __init__(
+            self,
+            backends: set = LLM_CACHE_BACKENDS,
+            max_entries: int = LLM_CACHE_MAX_ENTRIES,
+            max_bytes: int = LLM_CACHE_MAX_BYTES,
+            ttl: float = LLM_CACHE_TTL_SECONDS,
+            disk_path: str | None = LLM_CACHE_PATH,
+        ):
+        self.backends = backends
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = DiskCache(disk_path, ttl, LLM_CACHE_DISK_MAX_ENTRIES) if disk_path else None
+        self.total_bytes = 0
+        self.metrics = {}  # backend -> {"hits", "disk_hits", "misses", "bypassed"}
+        self._entries = OrderedDict()  # key -> (value, stored_at, size)
+        self._lock = threading.Lock()
+        self._disk_writes = set()  # background disk writes of async callers, referenced until done
+
+    def enabled(self, backend: str) -> bool:
+        return backend in self.backends
+
+    def count(self, backend: str, metric: str):
+        with self._lock:
+            counters = self.metrics.setdefault(backend, {"hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+            counters[metric] += 1
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                self._remove(key)
+        return None
+
+    def set(self, key: str, value):
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self.total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def lookup(self, backend: str, key: str):
+        """Memory, then disk. Returns None on a miss and records hit/miss metrics."""
+        value = self.get(key)
+        if value is not None:
+            self.count(backend, "hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.set(key, value)  # promote to memory
+                self.count(backend, "disk_hits")
+                return value
+        self.count(backend, "misses")
+        return None
+
+    def store(self, key: str, value):
+        self.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def alookup(self, backend: str, key: str):
+        """lookup() for the event loop: the disk tier is read in a worker thread."""
+        value = self.get(key)
+        if value is not None:
+            self.count(backend, "hits")
+            return value
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.set(key, value)
+                self.count(backend, "disk_hits")
+                return value
+        self.count(backend, "misses")
+        return None
+
+    def astore(self, key: str, value):
+        """store() for the event loop: the disk write (and its commit) runs in the background."""
+        self.set(key, value)
+        if self.disk is not None:
+            task = asyncio.ensure_future(asyncio.to_thread(self.disk.set, key, value))
+            self._disk_writes.add(task)
+            task.add_done_callback(self._disk_writes.discard)
+
+    def cached(self, backend: str, key=None):
+        """
+        Decorator caching a function's (or coroutine function's) result under a hash of its arguments.
+        `key` maps the call arguments to the cache payload (defaults to all arguments).
+        """
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled(backend):
+                        self.count(backend, "bypassed")
+                        return await func(*args, **kwargs)
+                    payload = key(*args, **kwargs) if key else [func.__name__, args, kwargs]
+                    digest = cache_key(backend, payload)
+                    value = await self.alookup(backend, digest)
+                    if value is None:
+                        value = await func(*args, **kwargs)
+                        self.astore(digest, value)
+                    return value
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled(backend):
+                    self.count(backend, "bypassed")
+                    return func(*args, **kwargs)
+                payload = key(*args, **kwargs) if key else [func.__name__, args, kwargs]
+                digest = cache_key(backend, payload)
+                value = self.lookup(backend, digest)
+                if value is None:
+                    value = func(*args, **kwargs)
+                    self.store(digest, value)
+                return value
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "backends": {backend: dict(counters) for backend, counters in self.metrics.items()},
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,218 @@
+"""
+Shared async HTTP layer for the Gemini and Vertex backends.
+
+- One pooled client per process keeps connections to the model APIs alive
+  (LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_KEEPALIVE); LLM_HTTP2=1 switches to HTTP/2 over httpx
+  when the optional `h2` package is installed, so many concurrent calls share a few
+  connections.
+- GoogleAuth hands out OAuth tokens for Vertex and refreshes them in a background task
+  GOOGLE_TOKEN_REFRESH_MARGIN seconds before they expire, so no call waits on a refresh
+  (or is sent with an expired token).
+- Every call has a deadline (LLM_CALL_TIMEOUT unless the caller passes one, shortened to
+  what is left of the turn's deadline, see router.turn_deadline); a call over it raises
+  DeadlineExceeded.
+
+Calls run on the event loop, so the number of concurrent model calls is bounded by the
+backend limits, not by worker threads.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+import contextvars
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_KEEPALIVE = float(os.getenv("LLM_HTTP_KEEPALIVE", "60"))  # seconds an idle connection is kept
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "0") == "1"  # needs httpx with the h2 package, falls back to HTTP/1.1 without it
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))  # default deadline of one model call, seconds
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+GOOGLE_ACCESS_TOKEN = os.getenv("GOOGLE_ACCESS_TOKEN")  # fixed token (e.g. for local stand-ins), skips credential refresh
+
+
+# time.monotonic() by which model calls made in the current context must finish, if any
+deadline_at = contextvars.ContextVar("llm_deadline_at", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call did not complete within its deadline."""
+
+
+def time_left(limit: float = LLM_CALL_TIMEOUT) -> float:
+    """Seconds a model call started now may take: limit, or less if the context's deadline is nearer."""
+    at = deadline_at.get()
+    return limit if at is None else min(limit, at - time.monotonic())
+
+
+class LLMHttpError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.status = status
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class LLMHttpClient:
+    """
+    Pooled client for JSON and server-sent-event model APIs; opened on first use. HTTP/1.1
+    goes through an aiohttp session like the DB client; HTTP/2 needs httpx with h2.
+    """
+
+    def __init__(self, max_connections: int = LLM_HTTP_MAX_CONNECTIONS, keepalive: float = LLM_HTTP_KEEPALIVE, http2: bool = LLM_HTTP2):
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logger.info("h2 is not installed, model API calls use HTTP/1.1")
+        self._client = None
+
+    @property
+    def client(self):
+        if self.http2:
+            if self._client is None:
+                import httpx
+                self._client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections, keepalive_expiry=self.keepalive),
+                    timeout=httpx.Timeout(None, connect=LLM_CONNECT_TIMEOUT),
+                )
+        elif self._client is None or self._client.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive)
+            self._client = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None, connect=LLM_CONNECT_TIMEOUT))
+        return self._client
+
+    @asynccontextmanager
+    async def _post(self, url: str, payload: dict, headers: dict | None):
+        """Yields the status and the body lines (str, without line breaks) of a POST."""
+        if self.http2:
+            async with self.client.stream("POST", url, json=payload, headers=headers) as response:
+                yield response.status_code, response.aiter_lines()
+        else:
+            async with self.client.post(url, json=payload, headers=headers) as response:
+                yield response.status, (line.decode().rstrip("\r\n") async for line in response.content)
+
+    async def post_json(self, url: str, payload: dict, headers: dict | None = None, deadline: float | None = None) -> dict:
+        """POSTs payload and returns the decoded JSON response; raises LLMHttpError on non-2xx."""
+        deadline = deadline or time_left()
+        try:
+            async with asyncio.timeout(deadline):
+                async with self._post(url, payload, headers) as (status, lines):
+                    body = "\n".join([line async for line in lines])
+        except TimeoutError:
+            raise DeadlineExceeded(f"no response from {url.split('?')[0]} within {deadline:.1f}s") from None
+        if status >= 300:
+            raise LLMHttpError(status, body)
+        return json.loads(body)
+
+    async def stream_events(self, url: str, payload: dict, headers: dict | None = None, deadline: float | None = None):
+        """
+        POSTs payload and yields the JSON data of each server-sent event. The deadline covers
+        the whole stream; closing the generator early closes the connection's stream.
+        """
+        deadline = deadline or time_left()
+        expires = time.monotonic() + deadline
+        async with self._post(url, payload, headers) as (status, lines):
+            if status >= 300:
+                raise LLMHttpError(status, "\n".join([line async for line in lines]))
+            while True:
+                try:
+                    async with asyncio.timeout(max(0.0, expires - time.monotonic())):
+                        line = await anext(lines)
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    raise DeadlineExceeded(f"stream from {url.split('?')[0]} exceeded {deadline:.1f}s") from None
+                if line.startswith("data:"):
+                    yield json.loads(line[len("data:"):])
+
+    async def aclose(self):
+        if self._client is not None:
+            await (self._client.aclose() if self.http2 else self._client.close())
+            self._client = None
+
+
+class GoogleAuth:
+    """
+    Application-default Google credentials with a background refresh. token() only waits
+    for a refresh when there is no valid token at all (first call, or the refresher failed).
+    """
+
+    def __init__(self, margin: float = GOOGLE_TOKEN_REFRESH_MARGIN, scopes: tuple = ("https://www.googleapis.com/auth/cloud-platform",), static_token: str | None = GOOGLE_ACCESS_TOKEN):
+        self.margin = margin
+        self.static_token = static_token
+        self.scopes = list(scopes)
+        self.refreshes = 0
+        self._credentials = None
+        self._lock = None
+        self._task = None
+
+    def _refresh_blocking(self):
+        # google-auth is synchronous; this runs in a thread about once an hour, never per call
+        import google.auth
+        from google.auth.transport.requests import Request
+        if self._credentials is None:
+            self._credentials = google.auth.default(scopes=self.scopes)[0]
+        self._credentials.refresh(Request())
+        self.refreshes += 1
+
+    def _expires_in(self) -> float:
+        if self._credentials is None or not self._credentials.token:
+            return 0.0
+        expiry = self._credentials.expiry  # naive UTC datetime, None if it does not expire
+        if expiry is None:
+            return float("inf")
+        return (expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+    async def refresh(self):
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if self._expires_in() <= self.margin:
+                await asyncio.to_thread(self._refresh_blocking)
+
+    async def token(self) -> str:
+        if self.static_token:
+            return self.static_token
+        if self._expires_in() <= 0:
+            await self.refresh()
+        self.start()
+        return self._credentials.token
+
+    def start(self):
+        """Starts the background refresher on the running loop, if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_forever())
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = max(1.0, self._expires_in() - self.margin)
+            except Exception as e:
+                logger.warning("Google credential refresh failed: %s", e)
+                delay = 10.0
+            await asyncio.sleep(min(delay, 3600))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+llm_http = LLMHttpClient()
+google_auth = GoogleAuth()
@@ -0,0 +1,298 @@
+"""
+Local CPU inference with continuous batching.
+
+A single scheduler thread owns the model. Prompts submitted from any number of sessions
+are prefilled as they arrive and then join the running batch, so every decoding step is
+one forward pass over all active sequences. Each sequence leaves the batch as soon as it
+finishes, and its tokens are streamed back to its caller as they are produced.
+
+Prompts submitted with a `prefix` (the static start of a prompt template, see prompts.py)
+reuse the KV cache computed for that prefix, so only the rest of the prompt is prefilled.
+
+Works with any Hugging Face causal LM whose KV cache can be expressed in the legacy
+(key, value)-per-layer format (GPT-2, Llama, Mistral, Qwen, ...).
+"""
+
+import queue
+import threading
+from collections import OrderedDict
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # older transformers only have legacy tuple caches
+    DynamicCache = None
+
+
+class ByteTokenizer:
+    """
+    Minimal tokenizer (one token per byte, 256 = end of sequence) for running the
+    batcher offline with a tiny randomly initialised model.
+    """
+
+    eos_token_id = 256
+    vocab_size = 257
+
+    def encode(self, text: str, **kwargs) -> list:
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids, skip_special_tokens: bool = True, **kwargs) -> str:
+        return bytes(i for i in ids if i < 256).decode("utf-8", errors="ignore")
+
+
+def tiny_model(n_layer: int = 2, n_embd: int = 64, n_positions: int = 1024):
+    """Randomly initialised GPT-2 sized for ByteTokenizer; needs no download."""
+    from transformers import GPT2Config, GPT2LMHeadModel
+    config = GPT2Config(n_layer=n_layer, n_head=max(1, n_embd // 32), n_embd=n_embd, vocab_size=ByteTokenizer.vocab_size,
+                        n_positions=n_positions, bos_token_id=ByteTokenizer.eos_token_id, eos_token_id=ByteTokenizer.eos_token_id)
+    return GPT2LMHeadModel(config).eval()
+
+
+class GenerationRequest:
+    """One prompt in the batcher. Tokens are pushed to `tokens` as they are generated; None marks the end."""
+
+    def __init__(self, prompt_ids: list, max_new_tokens: int, prefix_length: int = 0):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.prefix_length = prefix_length  # leading prompt_ids whose KV cache may be shared
+        self.generated = []
+        self.tokens = queue.Queue()
+        self.error = None
+
+
+def to_legacy(past):
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+def left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+class ContinuousBatcher:
+    def __init__(
+            self,
+            model,
+            tokenizer,
+            max_batch_size: int = 8,
+            max_new_tokens: int = 100,
+            temperature: float = 0.7,
+            do_sample: bool = True,
+            num_threads: int | None = None,
+            prefix_cache_size: int = 16,
+        ):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.do_sample = do_sample
+        self.max_positions = getattr(model.config, "n_positions", None) or getattr(model.config, "max_position_embeddings", 2048)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.steps = 0  # forward passes over the running batch, for benchmarks
+        self.prompt_tokens = 0  # totals over finished requests, only updated by the scheduler thread
+        self.generated_tokens = 0
+        self.prefix_hits = 0  # prompts prefilled from a cached prefix
+        self.prefix_tokens_reused = 0
+        self.prefix_cache_size = prefix_cache_size
+        self._prefix_ids = {}  # prefix text -> token ids, filled by callers
+        self._prefix_cache = OrderedDict()  # tuple of prefix ids -> legacy cache, only used by the scheduler thread
+        self._waiting = queue.Queue()
+        self._active = []  # requests in the running batch, row i of the batch tensors
+        self._past = None  # legacy cache: per layer (key, value) of shape [batch, heads, seq, dim]
+        self._mask = None  # [batch, seq] attention mask, 0 for left padding
+        self._positions = None  # [batch] position id of the next token
+        self._next_tokens = None  # [batch] last sampled token, fed in the next step
+        self._cache_type = None
+        self._thread = threading.Thread(target=self._run, name="continuous-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, max_new_tokens: int | None = None, prefix: str = "") -> GenerationRequest:
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        if prefix and len(prompt) > len(prefix) and prompt.startswith(prefix):
+            # tokenized separately so the prefix always has the same ids, whatever follows it
+            prefix_ids = self._prefix_ids.get(prefix)
+            if prefix_ids is None:
+                if len(self._prefix_ids) >= self.prefix_cache_size * 4:
+                    self._prefix_ids.clear()
+                prefix_ids = self._prefix_ids[prefix] = self.tokenizer.encode(prefix)
+            prompt_ids = prefix_ids + self.tokenizer.encode(prompt[len(prefix):], add_special_tokens=False)
+            prefix_length = len(prefix_ids)
+        else:
+            prompt_ids = self.tokenizer.encode(prompt)
+            prefix_length = 0
+        # keep the end of over-long prompts so prompt + output fits the model's positions
+        limit = self.max_positions - max_new_tokens
+        if len(prompt_ids) > limit:
+            prompt_ids, prefix_length = prompt_ids[-limit:], 0
+        request = GenerationRequest(prompt_ids, max_new_tokens, prefix_length)
+        self._waiting.put(request)
+        return request
+
+    def stream(self, prompt: str, max_new_tokens: int | None = None, prefix: str = ""):
+        """Yield text pieces as tokens for this prompt are generated."""
+        request = self.submit(prompt, max_new_tokens, prefix)
+        text = ""
+        ids = []
+        while (token := request.tokens.get()) is not None:
+            ids.append(token)
+            decoded = self.tokenizer.decode(ids, skip_special_tokens=True)
+            if len(decoded) > len(text):  # incomplete multi-byte characters decode to nothing yet
+                yield decoded[len(text):]
+                text = decoded
+        if request.error is not None:
+            raise request.error
+
+    def generate(self, prompt: str, max_new_tokens: int | None = None, prefix: str = "") -> str:
+        return "".join(self.stream(prompt, max_new_tokens, prefix))
+
+    def _run(self):
+        while True:
+            if not self._active:
+                self._admit(self._waiting.get())  # idle: block until work arrives
+            while len(self._active) < self.max_batch_size and not self._waiting.empty():
+                self._admit(self._waiting.get_nowait())
+            if self._active:
+                try:
+                    self._step()
+                except Exception as e:
+                    self._fail_all(e)
+
+    def _sample(self, logits: torch.Tensor) -> torch.Tensor:
+        if not self.do_sample:
+            return logits.argmax(dim=-1)
+        probabilities = torch.softmax(logits / self.temperature, dim=-1)
+        return torch.multinomial(probabilities, num_samples=1).squeeze(-1)
+
+    def _cache_input(self, past=None):
+        past = self._past if past is None else past
+        if self._cache_type is not None and DynamicCache is not None and issubclass(self._cache_type, DynamicCache):
+            return DynamicCache.from_legacy_cache(past)
+        return past
+
+    def _prefix_past(self, prefix_ids: list):
+        """Legacy cache for prefix_ids, computed on a miss and kept in a small LRU."""
+        key = tuple(prefix_ids)
+        past = self._prefix_cache.get(key)
+        if past is not None:
+            self._prefix_cache.move_to_end(key)
+            self.prefix_hits += 1
+            self.prefix_tokens_reused += len(prefix_ids)
+            return past
+        output = self.model(input_ids=torch.tensor([prefix_ids]), use_cache=True)
+        self._cache_type = type(output.past_key_values)
+        past = self._prefix_cache[key] = to_legacy(output.past_key_values)
+        if len(self._prefix_cache) > self.prefix_cache_size:
+            self._prefix_cache.popitem(last=False)
+        return past
+
+    def _prefill(self, request: GenerationRequest):
+        if not request.prefix_length:
+            return self.model(input_ids=torch.tensor([request.prompt_ids]), use_cache=True)
+        # the model extends a copy of the cache, so the cached prefix itself is never modified
+        past = self._cache_input(self._prefix_past(request.prompt_ids[:request.prefix_length]))
+        return self.model(
+            input_ids=torch.tensor([request.prompt_ids[request.prefix_length:]]),
+            attention_mask=torch.ones(1, len(request.prompt_ids), dtype=torch.long),
+            past_key_values=past,
+            use_cache=True,
+        )
+
+    @torch.inference_mode()
+    def _admit(self, request: GenerationRequest):
+        """Prefill a new prompt on its own and merge its cache into the running batch."""
+        try:
+            output = self._prefill(request)
+        except Exception as e:
+            request.error = e
+            request.tokens.put(None)
+            return
+        self._cache_type = type(output.past_key_values)
+        past = to_legacy(output.past_key_values)
+        length = len(request.prompt_ids)
+        mask = torch.ones(1, length, dtype=torch.long)
+        token = self._sample(output.logits[:, -1, :])
+
+        if not self._active:
+            self._past, self._mask = past, mask
+            self._positions = torch.tensor([length])
+            self._next_tokens = token
+        else:
+            width = max(self._mask.shape[1], length)
+            self._past = tuple(
+                (torch.cat([left_pad(k, width, 2), left_pad(nk, width, 2)]), torch.cat([left_pad(v, width, 2), left_pad(nv, width, 2)]))
+                for (k, v), (nk, nv) in zip(self._past, past)
+            )
+            self._mask = torch.cat([left_pad(self._mask, width, 1), left_pad(mask, width, 1)])
+            self._positions = torch.cat([self._positions, torch.tensor([length])])
+            self._next_tokens = torch.cat([self._next_tokens, token])
+        self._active.append(request)
+        self._emit([token.item()], [request])
+        self._retire()
+
+    @torch.inference_mode()
+    def _step(self):
+        """Decode one token for every active sequence in a single forward pass."""
+        self._mask = torch.cat([self._mask, torch.ones(len(self._active), 1, dtype=torch.long)], dim=1)
+        output = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=self._mask,
+            position_ids=self._positions.unsqueeze(-1),
+            past_key_values=self._cache_input(),
+            use_cache=True,
+        )
+        self.steps += 1
+        self._past = to_legacy(output.past_key_values)
+        self._positions = self._positions + 1
+        self._next_tokens = self._sample(output.logits[:, -1, :])
+        self._emit(self._next_tokens.tolist(), self._active)
+        self._retire()
+
+    def _emit(self, tokens: list, requests: list):
+        for token, request in zip(tokens, requests):
+            request.generated.append(token)
+            if token != self.tokenizer.eos_token_id:
+                request.tokens.put(token)
+
+    def _finished(self, request: GenerationRequest) -> bool:
+        return (
+            request.generated[-1] == self.tokenizer.eos_token_id
+            or len(request.generated) >= request.max_new_tokens
+            or len(request.prompt_ids) + len(request.generated) >= self.max_positions
+        )
+
+    def _retire(self):
+        """Drop finished sequences from the batch and trim padding columns nobody needs any more."""
+        keep = [i for i, request in enumerate(self._active) if not self._finished(request)]
+        if len(keep) == len(self._active):
+            return
+        for i, request in enumerate(self._active):
+            if i not in keep:
+                self.prompt_tokens += len(request.prompt_ids)
+                self.generated_tokens += len(request.generated)
+                request.tokens.put(None)
+        self._active = [self._active[i] for i in keep]
+        if not keep:
+            self._past = self._mask = self._positions = self._next_tokens = None
+            return
+        index = torch.tensor(keep)
+        self._mask = self._mask.index_select(0, index)
+        self._positions = self._positions.index_select(0, index)
+        self._next_tokens = self._next_tokens.index_select(0, index)
+        # columns that are padding for every remaining row can go
+        start = int((self._mask.sum(dim=0) == 0).long().cumprod(dim=0).sum())
+        self._mask = self._mask[:, start:]
+        self._past = tuple((k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:]) for k, v in self._past)
+
+    def _fail_all(self, error: Exception):
+        for request in self._active:
+            request.error = error
+            request.tokens.put(None)
+        self._active = []
+        self._past = self._mask = self._positions = self._next_tokens = None
@@ -0,0 +1,199 @@
+"""
+Structured logging for the gateway and the WebSocket service.
+
+Modules log through the standard `logging` module (`logger = logging.getLogger(__name__)`).
+`setup_logging()` routes every record through a bounded queue to a listener thread that
+formats it as one JSON object per line and does the actual I/O, so a slow stdout or disk
+never blocks the event loop. The calling thread only filters the record and enqueues it:
+
+- Throttling: records with the same logger and message template share a token bucket
+  (LOG_RATE_PER_SECOND, bursts of LOG_BURST); records over the rate are dropped and the
+  next one that passes carries `"suppressed": n`. Debug/info records are additionally
+  sampled at LOG_SAMPLE_RATE. Set `extra={"throttle": False}` for records that must pass.
+- Redaction: `password`, `token`, `secret` and `authorization` fields, bearer tokens and
+  JWTs in messages are replaced with "[REDACTED]" before a record is written.
+- Overflow: when the queue is full (LOG_QUEUE_SIZE) records are dropped, never waited on.
+
+Errors also go to ERROR_LOG_FILE (one JSON object per line) when it is set.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_PER_SECOND = float(os.getenv("LOG_RATE_PER_SECOND", "20"))  # per logger and message template
+LOG_BURST = float(os.getenv("LOG_BURST", "50"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # share of debug/info records kept
+ERROR_LOG_FILE = os.getenv("ERROR_LOG_FILE", "error.log")  # empty: errors only go to stdout
+
+REDACTED = "[REDACTED]"
+SENSITIVE_KEY = re.compile(r"pass(word)?|token|secret|authorization|api_?key|credential", re.IGNORECASE)
+SENSITIVE_TEXT = [
+    re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+"),  # JWT
+    re.compile(r"(?i)(bearer\s+)[\w.~+/-]+=*"),
+    re.compile(r"(?i)((?:password|token|secret|api_?key)\s*[=:]\s*['\"]?)[^\s'\",)]+"),
+]
+# attributes every LogRecord has; anything else was passed in `extra`
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "throttle"}
+
+
+def redact_text(text: str) -> str:
+    for pattern in SENSITIVE_TEXT:
+        text = pattern.sub(lambda match: (match.group(1) if match.groups() else "") + REDACTED, text)
+    return text
+
+
+def redact(value, key: str = ""):
+    if key and SENSITIVE_KEY.search(key):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return redact_text(str(value))
+
+
+class JsonFormatter(logging.Formatter):
+    """One redacted JSON object per record; runs on the listener thread."""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "service": self.service,
+            "logger": record.name,
+            "message": redact_text(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS:
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            entry["traceback"] = redact_text("".join(traceback.format_exception(*record.exc_info)))
+        elif record.exc_text:
+            entry["traceback"] = redact_text(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class Throttle(logging.Filter):
+    """Per-template token bucket plus sampling of debug/info records, applied before enqueueing."""
+
+    def __init__(self, rate: float = LOG_RATE_PER_SECOND, burst: float = LOG_BURST, sample_rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_rate = sample_rate
+        self.buckets = {}  # (logger, template) -> [tokens, updated, suppressed]
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "throttle", True) is False:
+            return True
+        if record.levelno <= logging.INFO and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) > 10000:  # templates are code, but don't grow without bound
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: a full queue drops the record."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # like QueueHandler.prepare, but leave formatting (and redaction) to the listener thread;
+        # args are resolved here because they may change after the call returns
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+
+listener = None
+handler = None
+
+
+def setup_logging(service: str, stream=None, error_file: str = ERROR_LOG_FILE, level: str = LOG_LEVEL, throttle: Throttle | None = None):
+    """Installs the queue pipeline on the root logger; later calls are no-ops."""
+    global listener, handler
+    if listener is not None:
+        return
+    formatter = JsonFormatter(service)
+    outputs = [logging.StreamHandler(stream or sys.stdout)]
+    if error_file:
+        errors = logging.FileHandler(error_file, delay=True)
+        errors.setLevel(logging.ERROR)
+        outputs.append(errors)
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(throttle or Throttle())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    listener = QueueListener(log_queue, *outputs, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes out what is still queued; call on shutdown."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def stats() -> dict:
+    if handler is None:
+        return {}
+    throttle = next((f for f in handler.filters if isinstance(f, Throttle)), None)
+    return {"queued": handler.queue.qsize(), "dropped": handler.dropped, "suppressed": throttle.suppressed if throttle else 0}
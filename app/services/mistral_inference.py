@@ -1,6 +1,15 @@
 import os
-from huggingface_hub import InferenceClient
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
+from lazy import Lazy
+from llm_cache import response_cache
+from concurrency import backend_limiter, STAGE_SECONDS
+from telemetry import registry, timed
+from prompts import prompts, Prompt, MISTRAL_EDIT
+from llm_http import LLM_CALL_TIMEOUT
+
+if TYPE_CHECKING:
+    from huggingface_hub import InferenceClient
 
 # Load environment variables from .env file
 load_dotenv()
@@ -9,100 +18,169 @@ load_dotenv()
 repo_id = os.getenv("REPO_ID")
 hf_token = os.getenv("HF_TOKEN")
 
-llm_client = InferenceClient(
-    model=repo_id,
-    timeout=120,
-    token=hf_token
-)
+MISTRAL_BACKEND = os.getenv("MISTRAL_BACKEND", "remote")  # "remote" (HF Inference API) or "local" (CPU model)
+LOCAL_MODEL_ID = os.getenv("LOCAL_MODEL_ID", "Qwen/Qwen2.5-0.5B-Instruct")  # "tiny-random" runs offline
+LOCAL_MAX_BATCH_SIZE = int(os.getenv("LOCAL_MAX_BATCH_SIZE", "8"))
+LOCAL_INFERENCE_THREADS = int(os.getenv("LOCAL_INFERENCE_THREADS", "0")) or None  # torch default if unset
 
 
-# function to call Mistral
-def call_llm(inference_client: InferenceClient, prompt: str):
-    response = inference_client.text_generation(
-        prompt,
-        max_new_tokens=100,  # adjust as needed
-        do_sample=True,      # enables randomness in responses
-        temperature=0.7       # Controls creativity
+def load_llm_client():
+    from huggingface_hub import InferenceClient
+    return InferenceClient(
+        model=repo_id,
+        timeout=LLM_CALL_TIMEOUT,
+        token=hf_token
     )
+
+
+llm_client = Lazy(load_llm_client)
+
+
+# function to call Mistral
+# sampled output, so only cached when "mistral" is listed in LLM_CACHE_BACKENDS
+@response_cache.cached("mistral", key=lambda inference_client, prompt: [inference_client.model, prompt])
+def call_llm(inference_client: "InferenceClient", prompt: str):
+    with backend_limiter.slot("mistral"):
+        response = inference_client.text_generation(
+            prompt,
+            max_new_tokens=100,  # adjust as needed
+            do_sample=True,      # enables randomness in responses
+            temperature=0.7       # Controls creativity
+        )
     return response  # directly returns the text
 
 
+# function to stream Mistral tokens as they are generated
+def stream_llm(inference_client: "InferenceClient", prompt: str):
+    with backend_limiter.slot("mistral"):
+        yield from inference_client.text_generation(
+            prompt,
+            max_new_tokens=100,
+            do_sample=True,
+            temperature=0.7,
+            stream=True          # yields token strings instead of the full text
+        )
+
+
+class InferenceBackend:
+    """
+    Where generate_mistral_response sends its prompts. `prefix` is the static start of
+    prompt (see prompts.py), which backends with prefix caching reuse across prompts.
+    """
+
+    def generate(self, prompt: str, prefix: str = "") -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, prefix: str = ""):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Loads clients or weights so the first prompt does not pay for it."""
+
+
+class RemoteInferenceBackend(InferenceBackend):
+    """Hugging Face Inference API, one prompt per request."""
+
+    def __init__(self, inference_client: Lazy):
+        self.inference_client = inference_client
+
+    def generate(self, prompt: str, prefix: str = "") -> str:
+        return call_llm(self.inference_client.get(), prompt)
+
+    def stream(self, prompt: str, prefix: str = ""):
+        yield from stream_llm(self.inference_client.get(), prompt)
+
+    def warm_up(self):
+        self.inference_client.get()
+
+
+class LocalInferenceBackend(InferenceBackend):
+    """
+    Causal LM running on this machine. Prompts from all sessions share forward passes
+    through a ContinuousBatcher; the model is loaded on first use.
+    """
+
+    def __init__(self, model_id: str = LOCAL_MODEL_ID, max_batch_size: int = LOCAL_MAX_BATCH_SIZE, num_threads: int | None = LOCAL_INFERENCE_THREADS):
+        self.model_id = model_id
+        self.max_batch_size = max_batch_size
+        self.num_threads = num_threads
+        self._batcher = Lazy(self._load)
+        registry.counter("local_inference_tokens_total", "Tokens processed by the local model", ("kind",), function=self._token_counts)
+
+    @property
+    def batcher(self):
+        return self._batcher.get()
+
+    def _load(self):
+        from local_inference import ContinuousBatcher, ByteTokenizer, tiny_model
+        if self.model_id == "tiny-random":
+            model, tokenizer = tiny_model(), ByteTokenizer()
+        else:
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            model = AutoModelForCausalLM.from_pretrained(self.model_id, torch_dtype="auto")
+        batcher = ContinuousBatcher(model, tokenizer, max_batch_size=self.max_batch_size, num_threads=self.num_threads)
+        # count Mistral prompts with the model's own tokenizer and keep them within its positions
+        prompts.set_tokenizer("mistral", tokenizer, budget=batcher.max_positions - batcher.max_new_tokens)
+        return batcher
+
+    def _token_counts(self) -> dict:
+        if not self._batcher.loaded:
+            return {}
+        return {("prompt",): self.batcher.prompt_tokens, ("completion",): self.batcher.generated_tokens}
+
+    def generate(self, prompt: str, prefix: str = "") -> str:
+        return self.batcher.generate(prompt, prefix=prefix)
+
+    def stream(self, prompt: str, prefix: str = ""):
+        yield from self.batcher.stream(prompt, prefix=prefix)
+
+    def warm_up(self):
+        self._batcher.get()
+
+
+def create_inference_backend(name: str = MISTRAL_BACKEND) -> InferenceBackend:
+    if name == "local":
+        return LocalInferenceBackend()
+    return RemoteInferenceBackend(llm_client)
+
+
+inference_backend = create_inference_backend()
+
+
+def warm_up():
+    inference_backend.warm_up()
+
+
 def apply_prompt_template(
         chat_history: str,
         user_prompt: str, 
         tone: str = "friendly"  # default tone
-    ) -> str:
+    ) -> Prompt:
     """
     Convert a raw user prompt into a format that encourages the LLM to 
     consider chat_history and tone when generating its response.
+    The start of chat_history is trimmed if the prompt would not fit the token budget.
     """
-    
-    # Tone-specific instructions with more detailed formatting
-    tone_instructions = {
-        "friendly": {
-            "description": "warm, conversational, and approachable",
-            "style_guide": "Use casual language, contractions, and a personal touch. Write as if speaking to a friend.",
-            "example": "Hey there! I've put together some notes about the project we discussed."
-        },
-        "professional": {
-            "description": "formal, clear, and business-appropriate",
-            "style_guide": "Use precise language, complete sentences, and a structured format. Avoid contractions and colloquialisms.",
-            "example": "Please find below the key points regarding the project requirements."
-        },
-        "technical": {
-            "description": "analytical, detailed, and methodical",
-            "style_guide": "Use domain-specific terminology, logical structure, and precise descriptions. Include relevant technical details.",
-            "example": "The system architecture implements a three-tier model with the following components:"
-        },
-        "summary": {
-            "description": "concise, focused, and essential",
-            "style_guide": "Extract only key information, eliminate redundancy, and prioritize critical points.",
-            "example": "Main takeaways: 1) Project deadline extended to June 15, 2) Budget approved for additional resources."
-        }
-    }
-    
-    # Get the appropriate tone configuration or use default if not found
-    tone = tone.lower()
-    tone_config = tone_instructions.get(tone, tone_instructions["friendly"])
-    
-    # Build a more structured tone instruction
-    tone_instruction = f"""
-Apply a {tone_config['description']} tone to the response.
-Style guidelines:
-- {tone_config['style_guide']}
-- Maintain consistency with the context and content.
-- Preserve all factual information while adapting the presentation style.
-Example tone: "{tone_config['example']}"
-"""
-    
-    # Base Mistral instruction format with improved tone integration
-    prompt_template = f"""[INST] 
-You are a helpful assistant. Your task is to perform the user_prompt on chat_history if it is a command, otherwise just append it:
-
-CHAT HISTORY:
-{chat_history}
-
-USER PROMPT:
-{user_prompt}
-
-TONE INSTRUCTIONS:
-{tone_instruction}
-
-Just return the new chat_history without explanations, do not edit too much of the earlier chat_history. 
-Also do not include chat_history at the start of the returned text. Only have the contents of the chat_history after the command is executed or new text is appended.
-Do not alter the contents of the chat_history such that it can change context.
-[/INST]
-"""
-    
-    return prompt_template
+    return MISTRAL_EDIT.render(tone, chat_history=chat_history, user_prompt=user_prompt)
 
 
 def generate_mistral_response(chat_history: str, user_prompt: str, tone: str = "friendly") -> str:
     """
     Return the resultant chat history of performing user_prompt on chat_history
     """
-    formatted_prompt = apply_prompt_template(chat_history, user_prompt, tone)
-    return call_llm(llm_client, formatted_prompt)
+    prompt = apply_prompt_template(chat_history, user_prompt, tone)
+    with timed(STAGE_SECONDS, "generate", stage="generate", backend=MISTRAL_BACKEND):
+        return inference_backend.generate(prompt.text, prefix=prompt.prefix)
+
+
+def stream_mistral_response(chat_history: str, user_prompt: str, tone: str = "friendly"):
+    """
+    Yield the resultant chat history of performing user_prompt on chat_history, token by token
+    """
+    prompt = apply_prompt_template(chat_history, user_prompt, tone)
+    with timed(STAGE_SECONDS, "generate", stage="generate", backend=MISTRAL_BACKEND):
+        yield from inference_backend.stream(prompt.text, prefix=prompt.prefix)
 
 
 if __name__ == '__main__':
@@ -110,8 +188,8 @@ if __name__ == '__main__':
     chat_history = "Tasks: Submit report, update spreadsheet."
     user_prompt = "In brackets, write high priority after Submit report."
     prompt = apply_prompt_template(chat_history, user_prompt, "professional")
-    print(f"prompt: {prompt}")
-    response = call_llm(llm_client, prompt)
+    print(f"prompt ({prompt.tokens} tokens): {prompt.text}")
+    response = call_llm(llm_client.get(), prompt.text)
     print(f"response: {response}")
 
     # let pipeline do everything
@@ -0,0 +1,196 @@
+"""
+Append-only, memory-mapped log of document edits with periodic snapshots.
+
+Each accepted change to a session is appended as one record:
+
+    <length: u32> <crc32: u32> <JSON payload>
+
+with payloads {"t": "ops", "s": session, "b": base version, "v": version, "ops": [...]}
+(the edit operations of document.py), {"t": "set", "s": session, "state": {...}} for a
+whole state, and {"t": "del", "s": session}. The log file is preallocated in steps of
+SESSION_LOG_GROW_BYTES and written through a shared mmap, so an append is a memory copy:
+once it returns, the record survives a crash or restart of the process. The mapping is
+msync'ed every SESSION_LOG_SYNC_MS (0: after every append) against losing records to a
+machine crash.
+
+When a log grows past SESSION_LOG_COMPACT_BYTES, appends move to a new log file (the
+next generation) and the current state of every session is written as a snapshot of that
+generation. Recovery loads the newest snapshot and replays the logs from its generation
+on, stopping at the first torn or corrupt record.
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+from dotenv import load_dotenv
+
+from document import apply_ops
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_LOG_GROW_BYTES = int(os.getenv("SESSION_LOG_GROW_BYTES", str(8 * 1024 * 1024)))
+SESSION_LOG_COMPACT_BYTES = int(os.getenv("SESSION_LOG_COMPACT_BYTES", str(64 * 1024 * 1024)))
+SESSION_LOG_SYNC_MS = float(os.getenv("SESSION_LOG_SYNC_MS", "1000"))
+
+HEADER = struct.Struct("<II")
+
+
+def encode(record: dict) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(data, limit: int):
+    """Yields (record, end offset) for the intact records at the start of data[:limit]."""
+    offset = 0
+    while offset + HEADER.size <= limit:
+        length, crc = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if length == 0 or end > limit:
+            return
+        payload = data[offset + HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            logger.warning("Session log record at offset %d is corrupt, ignoring the rest of the log", offset)
+            return
+        yield json.loads(payload), end
+        offset = end
+
+
+def replay(states: dict, record: dict):
+    """Applies one log record to states (session id -> state)."""
+    session_id = record["s"]
+    if record["t"] == "set":
+        states[session_id] = record["state"]
+    elif record["t"] == "del":
+        states.pop(session_id, None)
+    else:
+        state = states.get(session_id, {})
+        if state.get("version", 0) != record["b"]:
+            logger.warning("Session %s is at version %s but the log continues from %s", session_id, state.get("version", 0), record["b"])
+            return
+        states[session_id] = {**state, "history": apply_ops(state.get("history", ""), record["ops"]), "version": record["v"]}
+
+
+class OpLog:
+    """
+    The log files (ops-<generation>.log) and snapshots (snapshot.json) in one directory.
+    Not thread-safe: appends come from the event loop; only write_snapshot() runs in a thread.
+    """
+
+    def __init__(self, directory: str, grow_bytes: int = SESSION_LOG_GROW_BYTES, compact_bytes: int = SESSION_LOG_COMPACT_BYTES, sync_ms: float = SESSION_LOG_SYNC_MS):
+        self.directory = directory
+        self.grow_bytes = grow_bytes
+        self.compact_bytes = compact_bytes
+        self.sync_interval = sync_ms / 1000
+        self.generation = 0
+        self.offset = 0
+        self.appends = 0
+        self.synced = time.monotonic()
+        self._file = None
+        self._map = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"ops-{generation:08d}.log")
+
+    def generations(self) -> list:
+        return sorted(int(name[4:-4]) for name in os.listdir(self.directory) if name.startswith("ops-") and name.endswith(".log"))
+
+    def recover(self) -> dict:
+        """
+        Rebuilds the state of every session from the snapshot and the logs after it, and
+        opens the newest log for appending after its last intact record.
+        """
+        start = time.perf_counter()
+        states, generation = {}, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            states, generation = snapshot["sessions"], snapshot["generation"]
+        records = 0
+        for log_generation in [g for g in self.generations() if g >= generation]:
+            with open(self.log_path(log_generation), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    end = 0
+                    for record, end in read_records(data, size):
+                        replay(states, record)
+                        records += 1
+            generation, self.offset = log_generation, end
+        self._open(generation)
+        logger.info("Recovered %d sessions from the session log (%d records) in %.1f ms", len(states), records, (time.perf_counter() - start) * 1000)
+        return states
+
+    def _open(self, generation: int):
+        self.close()
+        self.generation = generation
+        path = self.log_path(generation)
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.offset + self.grow_bytes // 2:
+            self._file.truncate(max(size, self.offset) + self.grow_bytes)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, record: dict):
+        data = encode(record)
+        if self.offset + len(data) + HEADER.size > len(self._map):
+            self._map.flush()
+            self._map.close()
+            self._file.truncate(self.offset + len(data) + self.grow_bytes)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[self.offset:self.offset + len(data)] = data
+        self.offset += len(data)
+        self.appends += 1
+        if time.monotonic() - self.synced >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._map is not None:
+            self._map.flush()
+        self.synced = time.monotonic()
+
+    def needs_compaction(self) -> bool:
+        return self.offset >= self.compact_bytes
+
+    def rotate(self) -> int:
+        """Moves appends to a new log file; returns the generation a snapshot of the current states should carry."""
+        self.sync()
+        self.offset = 0
+        self._open(self.generation + 1)
+        return self.generation
+
+    def write_snapshot(self, states: dict, generation: int):
+        """
+        Writes states as the snapshot of generation (atomically) and removes the logs it
+        makes redundant. Runs in a worker thread; states must not be changed meanwhile.
+        """
+        temporary = self.snapshot_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"generation": generation, "sessions": states}, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        for old in self.generations():
+            if old < generation:
+                os.remove(self.log_path(old))
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,256 @@
+"""
+Prompt templates shared by the LLM backends.
+
+Every prompt is a static prefix (instructions and tone guidelines, fixed per template
+and tone) followed by dynamic parts (document window, summary, user input). Prefixes are
+rendered once per tone and their token counts cached, so building a prompt only formats
+and counts the dynamic parts. Keeping the static text first also lets backends with
+prefix caching reuse it across calls: the local model keeps the prefix's KV cache, and
+Gemini's implicit caching matches on leading content.
+
+Token counts come from the backend's own tokenizer once one is registered (the local
+model registers its tokenizer when it loads), otherwise from a characters-per-token
+estimate. Each backend has a budget (PROMPT_TOKEN_BUDGET_<BACKEND>): a prompt over it
+has its trimmable field (the document text) cut from the start, and PromptTooLong is
+raised when even the rest does not fit.
+"""
+
+import os
+import re
+import math
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3.5"))  # estimate when no tokenizer is registered
+BUDGET_DEFAULTS = {"gemini": 16000, "vertex": 8000, "mistral": 4000}  # prompt tokens, leaving room for the output
+
+DEFAULT_TONE = "friendly"
+TONES = {
+    "friendly": {
+        "description": "warm, conversational, and approachable. Could be funny as well, if appropriate.",
+        "style_guide": "Use casual language, contractions, and a personal touch. Write as if speaking to a friend. It can look like a text message.",
+        "example": "Hey there! I've put together some notes about the project we discussed...want to take a look?"
+    },
+    "professional": {
+        "description": "formal, clear, and business-appropriate",
+        "style_guide": "Use precise language, complete sentences, and a structured format. Avoid contractions and colloquialisms. Use professional jargon and complex diction where appropriate.",
+        "example": "Please find below the key points regarding the project requirements. This refers to the aforementioned project."
+    },
+    "technical": {
+        "description": "analytical, detailed, and methodical",
+        "style_guide": "Use domain-specific terminology, logical structure, and precise descriptions. Include relevant technical details. Can use indentations to create list format if appropriate. Can break larger idea into smaller step like sections.",
+        "example": "The system architecture implements a three-tier model with the following components:\n      1) Presentation Layer: User Interface\n     2) Application Layer: Business Logic\n      3) Data Layer: Database Management."
+    },
+    "summary": {
+        "description": "concise, focused, and essential",
+        "style_guide": "Extract only key information, eliminate redundancy, and prioritize critical points.",
+        "example": "Main takeaways: 1) Project deadline extended to June 15, 2) Budget approved for additional resources."
+    }
+}
+
+WHITESPACE = re.compile(r"\s")
+
+
+class PromptTooLong(ValueError):
+    """The prompt does not fit its backend's token budget even with the trimmable field emptied."""
+
+
+def resolve_tone(tone: str | None) -> str:
+    """Known tone name for tone, falling back to DEFAULT_TONE."""
+    tone = (tone or DEFAULT_TONE).lower()
+    return tone if tone in TONES else DEFAULT_TONE
+
+
+class EstimatedCounter:
+    """Token count from text length, for backends whose tokenizer is not available locally."""
+
+    def __init__(self, chars_per_token: float = PROMPT_CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TokenizerCounter:
+    """Exact token count from a Hugging Face style tokenizer (anything with encode())."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False)) if text else 0
+
+
+class Prompt:
+    """A rendered prompt: the static prefix, the dynamic parts that follow it, and its size."""
+
+    def __init__(self, prefix: str, parts: list, tokens: int, trimmed: int = 0):
+        self.prefix = prefix
+        self.parts = parts
+        self.tokens = tokens
+        self.trimmed = trimmed  # characters cut from the start of the trimmable field
+
+    @property
+    def text(self) -> str:
+        return self.prefix + "".join(self.parts)
+
+    @property
+    def contents(self) -> list:
+        """Prefix and non-empty parts as separate items, for APIs that take a list of parts."""
+        return [self.prefix] + [part for part in self.parts if part]
+
+
+class PromptTemplate:
+    """
+    `prefix` is formatted with the tone's fields (tone, description, style_guide, example)
+    once per tone; `parts` are formatted with the fields passed to render(). `trim` names
+    the field that may be shortened (from the start) to fit the budget.
+    """
+
+    def __init__(self, name: str, backend: str, prefix: str, parts: list, trim: str | None = None):
+        self.name = name
+        self.backend = backend
+        self.prefix_format = prefix
+        self.part_formats = parts
+        self.trim = trim
+        self.registry = None
+        self._prefixes = {}  # tone -> (text, tokens or None until counted)
+
+    def prefix(self, tone: str | None = DEFAULT_TONE) -> str:
+        return self._prefix(resolve_tone(tone))[0]
+
+    def prefix_tokens(self, tone: str | None = DEFAULT_TONE) -> int:
+        return self._prefix(resolve_tone(tone))[1]
+
+    def _prefix(self, tone: str) -> tuple:
+        compiled = self._prefixes.get(tone)
+        if compiled is None or compiled[1] is None:
+            text = compiled[0] if compiled else self.prefix_format.format(tone=tone, **TONES[tone])
+            tokens = self.registry.counter(self.backend).count(text) if self.registry else None
+            compiled = self._prefixes[tone] = (text, tokens)
+        return compiled
+
+    def compile(self):
+        """Renders and counts the prefix for every tone ahead of the first call."""
+        for tone in TONES:
+            self._prefix(tone)
+
+    def forget_counts(self):
+        self._prefixes = {tone: (text, None) for tone, (text, _) in self._prefixes.items()}
+
+    def render(self, tone: str | None = DEFAULT_TONE, **fields) -> Prompt:
+        prefix, prefix_tokens = self._prefix(resolve_tone(tone))
+        counter = self.registry.counter(self.backend)
+        budget = self.registry.budget(self.backend)
+        parts = [part.format(**fields) for part in self.part_formats]
+        counts = [counter.count(part) for part in parts]
+        tokens = prefix_tokens + sum(counts)
+        if tokens <= budget:
+            return Prompt(prefix, parts, tokens)
+        if self.trim is None:
+            raise PromptTooLong(f"{self.name} prompt is {tokens} tokens, over the {self.backend} budget of {budget}")
+
+        # shorten the trimmable field from the start until the prompt fits
+        index = next(i for i, part in enumerate(self.part_formats) if "{" + self.trim + "}" in part)
+        value = fields[self.trim]
+        trimmed = 0
+        while tokens > budget:
+            if not value:
+                raise PromptTooLong(f"{self.name} prompt is over the {self.backend} budget of {budget} without any {self.trim}")
+            chars_per_token = len(value) / max(1, counter.count(value))
+            cut = min(len(value), max(1, int((tokens - budget) * chars_per_token)))
+            boundary = WHITESPACE.search(value, cut)  # keep whole words where possible
+            cut = boundary.end() if boundary and boundary.end() - cut < 64 else cut
+            value = value[cut:]
+            trimmed += cut
+            parts[index] = self.part_formats[index].format(**{**fields, self.trim: value})
+            tokens -= counts[index]
+            counts[index] = counter.count(parts[index])
+            tokens += counts[index]
+        return Prompt(prefix, parts, tokens, trimmed)
+
+
+class PromptRegistry:
+    """Templates by name, plus the token counter and budget of each backend."""
+
+    def __init__(self, budgets: dict = BUDGET_DEFAULTS):
+        self.templates = {}
+        self.budgets = {backend: int(os.getenv(f"PROMPT_TOKEN_BUDGET_{backend.upper()}", budget)) for backend, budget in budgets.items()}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        template.registry = self
+        template.compile()
+        self.templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self.templates[name]
+
+    def counter(self, backend: str):
+        return self.counters.get(backend) or self.counters.setdefault(backend, EstimatedCounter())
+
+    def budget(self, backend: str) -> int:
+        return self.budgets.get(backend, min(self.budgets.values()))
+
+    def set_tokenizer(self, backend: str, tokenizer, budget: int | None = None):
+        """Counts backend's prompts with tokenizer from now on; budget, if given, caps the backend's budget."""
+        with self._lock:
+            self.counters[backend] = TokenizerCounter(tokenizer)
+            if budget is not None:
+                self.budgets[backend] = min(self.budget(backend), budget)
+            for template in self.templates.values():
+                if template.backend == backend:
+                    template.forget_counts()
+
+
+prompts = PromptRegistry()
+
+TRANSCRIBE = prompts.register(PromptTemplate(
+    "transcribe", "gemini",
+    "You are a transcription assistant. Transcribe the incoming user input in a refined manner, ignoring natural mistakes such as 'sorry' or 'uh' or 'hmm' and "
+    "append it to the File content provided below, returning the updated text with no commentary. If you don't hear any speech, then return the File Content as it is.\n\n"
+    "Follow the following tone guidelines when transcribing new text or making any changes, paraphrase the new text to match the tone and tone guidelines:\n"
+    "Selected tone: {tone}\n"
+    "Tone description: {description}\n"
+    "Style guide: {style_guide}\n"
+    "Example: {example}\n\n",
+    ["{summary}", "File content: {file_content}", "User input: {user_input}"],
+    trim="file_content",
+))
+
+EDIT_COMMAND = prompts.register(PromptTemplate(
+    "edit_command", "vertex",
+    "Instruction: You are an advanced text-editing assistant. If the User input is a text-editing command, apply it to the File content provided below "
+    "and return the updated text (with no explanations and no commentary). If the command is not possible, leave the file content as is.\n\n",
+    ["{summary}", "File content: {file_content}", "User input: {user_input}"],
+    trim="file_content",
+))
+
+CLASSIFY = prompts.register(PromptTemplate(
+    "classify", "gemini",
+    "Determine if the following user input is a text-editing command or normal speech. "
+    "Return only one word: 'command' if it is a text-editing command, or 'speech' if it is normal speech.\n\n",
+    ["User input: {user_input}"],
+))
+
+MISTRAL_EDIT = prompts.register(PromptTemplate(
+    "mistral_edit", "mistral",
+    "[INST] \n"
+    "You are a helpful assistant. Your task is to perform the user_prompt on chat_history if it is a command, otherwise just append it.\n\n"
+    "TONE INSTRUCTIONS:\n"
+    "Apply a {description} tone to the response.\n"
+    "Style guidelines:\n"
+    "- {style_guide}\n"
+    "- Maintain consistency with the context and content.\n"
+    "- Preserve all factual information while adapting the presentation style.\n"
+    "Example tone: \"{example}\"\n\n"
+    "Just return the new chat_history without explanations, do not edit too much of the earlier chat_history. \n"
+    "Also do not include chat_history at the start of the returned text. Only have the contents of the chat_history after the command is executed or new text is appended.\n"
+    "Do not alter the contents of the chat_history such that it can change context.\n\n",
+    ["CHAT HISTORY:\n{chat_history}\n\nUSER PROMPT:\n{user_prompt}\n[/INST]\n"],
+    trim="chat_history",
+))
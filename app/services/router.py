@@ -0,0 +1,310 @@
+"""
+Routing of model calls across the Gemini, Vertex and Mistral backends.
+
+- Every route (transcribe, execute, classify) lists the backends that can serve it, in
+  order of preference (LLM_ROUTE_<ROUTE>, e.g. LLM_ROUTE_EXECUTE=vertex,gemini).
+  A call goes to the first backend whose circuit is closed and falls over to the next one
+  when it fails, is busy or runs out of time.
+- Each attempt gets at most LLM_ATTEMPT_TIMEOUT seconds, and all calls of a turn share the
+  turn's deadline (TURN_DEADLINE seconds, see turn_deadline()), so a slow backend costs a
+  bounded wait instead of the client's own timeout.
+- An attempt still running after its backend's HEDGE_PERCENTILE latency on that route
+  (over the last HEDGE_WINDOW calls) gets a hedged duplicate; the first answer wins and
+  the other call is cancelled. At most HEDGE_PER_MINUTE hedges are sent.
+- A CircuitBreaker per backend opens after BREAKER_FAILURES consecutive failures; calls
+  then skip that backend for BREAKER_COOLDOWN seconds, after which one probe call decides
+  whether it closes again.
+
+Everything runs on the event loop; the breakers and latency windows need no locks.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from concurrency import BackendBusy, TokenBucket
+from llm_http import DeadlineExceeded, deadline_at, time_left
+from telemetry import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "25"))  # seconds for all model calls of one turn
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "10"))  # per backend, hedge included
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # recent latencies kept per route and backend
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "3"))  # seconds, until HEDGE_MIN_SAMPLES are in
+HEDGE_PER_MINUTE = float(os.getenv("HEDGE_PER_MINUTE", "60"))  # 0 disables hedging
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# backends able to serve each route, in order of preference, overridable with LLM_ROUTE_<ROUTE>;
+# mistral is left out by default: its output budget (max_new_tokens) is far smaller than a window
+ROUTE_DEFAULTS = {
+    "transcribe": "gemini",
+    "execute": "vertex,gemini",
+    "classify": "gemini",
+}
+
+HEDGES = registry.counter("llm_hedged_calls_total", "Duplicate model calls sent after a slow first call, and how many answered first", ("backend", "outcome"))
+FAILOVERS = registry.counter("llm_failovers_total", "Model calls served by a backend after the preferred one failed or was skipped", ("route", "backend"))
+FAILURES = registry.counter("llm_call_failures_total", "Failed model call attempts", ("backend", "reason"))
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every backend of a route has an open circuit."""
+
+
+@contextmanager
+def turn_deadline(seconds: float = TURN_DEADLINE):
+    """Model calls made inside the block (and in tasks it starts) finish within seconds from now."""
+    token = deadline_at.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        deadline_at.reset(token)
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful calls; hedge_delay() is their `percentile`."""
+
+    def __init__(self, window: int = HEDGE_WINDOW, percentile: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES, default: float = HEDGE_DEFAULT_DELAY):
+        self.samples = deque(maxlen=window)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default = default
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> float:
+        if len(self.samples) < self.min_samples:
+            return self.default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through. open: after `failures` consecutive failures, calls are refused
+    for `cooldown` seconds. half-open: then one probe call is let through; its success
+    closes the circuit, its failure opens it for another cooldown.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened is None:
+            return "closed"
+        return "open" if self.probing or time.monotonic() - self.opened < self.cooldown else "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            self.probing = True
+        return state != "open"
+
+    def success(self):
+        self.consecutive = 0
+        self.opened = None
+        self.probing = False
+
+    def failure(self):
+        self.consecutive += 1
+        self.probing = False
+        if self.opened is not None or self.consecutive >= self.failures:
+            self.opened = time.monotonic()
+
+    def release(self):
+        """An allowed call ended without telling anything about the backend (cancelled, or busy here)."""
+        self.probing = False
+
+
+async def first_chunk(chunks):
+    """Waits for the first chunk of an async chunk generator; returns it with the generator."""
+    try:
+        return await anext(chunks), chunks
+    except StopAsyncIteration:
+        raise ValueError("stream ended without output") from None
+    except BaseException:
+        await chunks.aclose()
+        raise
+
+
+class BackendRouter:
+    """
+    Sends each call to the backends of its route (see ROUTE_DEFAULTS):
+
+        text = await router.call("execute", {"vertex": lambda: ..., "mistral": lambda: ...})
+
+    Each value is a function returning a new awaitable for one attempt; it may be called
+    twice when the attempt is hedged. Backends of the route missing from the dict are skipped.
+    """
+
+    def __init__(self, routes: dict = ROUTE_DEFAULTS, hedges_per_minute: float = HEDGE_PER_MINUTE, attempt_timeout: float = LLM_ATTEMPT_TIMEOUT, breaker_failures: int = BREAKER_FAILURES, breaker_cooldown: float = BREAKER_COOLDOWN):
+        self.routes = {
+            route: [backend.strip() for backend in os.getenv(f"LLM_ROUTE_{route.upper()}", backends).split(",") if backend.strip()]
+            for route, backends in routes.items()
+        }
+        self.attempt_timeout = attempt_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge_bucket = TokenBucket(hedges_per_minute / 60, burst=max(1.0, hedges_per_minute / 10)) if hedges_per_minute > 0 else None
+        self.breakers = {}
+        self.latencies = {}
+        registry.gauge("llm_circuit_open", "1 while a backend's circuit breaker keeps calls away from it", ("backend",), function=self._open_circuits)
+
+    def breaker(self, backend: str) -> CircuitBreaker:
+        if backend not in self.breakers:
+            self.breakers[backend] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown)
+        return self.breakers[backend]
+
+    def latency(self, key: str, backend: str) -> LatencyTracker:
+        if (key, backend) not in self.latencies:
+            self.latencies[key, backend] = LatencyTracker()
+        return self.latencies[key, backend]
+
+    def _open_circuits(self) -> dict:
+        return {(backend,): int(breaker.state != "closed") for backend, breaker in self.breakers.items()}
+
+    def _hedge_allowed(self) -> bool:
+        if self.hedge_bucket is None:
+            return False
+        try:
+            self.hedge_bucket.reserve(0)
+        except BackendBusy:
+            return False
+        return True
+
+    async def _hedged(self, key: str, backend: str, attempt, discard=None):
+        """
+        Runs attempt() within the attempt timeout and the turn's deadline, with a duplicate
+        after the hedge delay. Returns the first successful result; discard(result) is
+        called on a result that lost the race but completed anyway.
+        """
+        latency = self.latency(key, backend)
+        budget = min(self.attempt_timeout, time_left())
+        started = {asyncio.ensure_future(attempt()): time.monotonic()}
+        pending, error, winner = set(started), None, None
+        try:
+            async with asyncio.timeout(budget):
+                done, pending = await asyncio.wait(pending, timeout=min(latency.hedge_delay(), budget))
+                if not done and self._hedge_allowed():
+                    HEDGES.inc(backend=backend, outcome="sent")
+                    hedge = asyncio.ensure_future(attempt())
+                    started[hedge] = time.monotonic()
+                    pending.add(hedge)
+                while winner is None:
+                    for task in done:
+                        if task.exception() is None:
+                            winner = task
+                            break
+                        error = task.exception()
+                    if winner is None:
+                        if not pending:
+                            raise error
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        except DeadlineExceeded:
+            raise
+        except TimeoutError:
+            raise DeadlineExceeded(f"{backend} did not answer within {budget:.1f}s") from None
+        finally:
+            for task in started:
+                if task is winner:
+                    continue
+                task.cancel()
+                if discard is not None and task.done() and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+        latency.record(time.monotonic() - started[winner])
+        if winner is not next(iter(started)):
+            HEDGES.inc(backend=backend, outcome="won")
+        return winner.result()
+
+    async def _route(self, route: str, calls: dict, run):
+        """Tries run(backend, call) on the route's backends in order; returns (backend, result)."""
+        error = None
+        skipped = False
+        for backend in self.routes[route]:
+            if backend not in calls:
+                continue
+            if time_left() <= 0:
+                raise DeadlineExceeded(f"the turn's deadline passed before {route} was served")
+            breaker = self.breaker(backend)
+            if not breaker.allow():
+                skipped = True
+                continue
+            if error is not None or skipped:
+                FAILOVERS.inc(route=route, backend=backend)
+            try:
+                result = await run(backend, calls[backend])
+            except BackendBusy as e:
+                breaker.release()
+                FAILURES.inc(backend=backend, reason="busy")
+                error = e
+                continue
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except TimeoutError as e:
+                if time_left() > 0:
+                    breaker.failure()  # the attempt timed out, the turn has time left
+                    FAILURES.inc(backend=backend, reason="deadline")
+                    logger.warning("%s call to %s failed: %s", route, backend, e)
+                    error = e
+                    continue
+                breaker.release()  # the turn ran out of time, which says nothing about the backend
+                FAILURES.inc(backend=backend, reason="turn_deadline")
+                raise
+            except Exception as e:
+                breaker.failure()
+                FAILURES.inc(backend=backend, reason="error")
+                logger.warning("%s call to %s failed: %s", route, backend, e)
+                error = e
+                continue
+            breaker.success()
+            return backend, result
+        raise error or NoBackendAvailable(f"no backend with a closed circuit for {route}")
+
+    async def call(self, route: str, calls: dict):
+        """Result of the first backend of the route that answers; raises the last error if none does."""
+        _, result = await self._route(route, calls, lambda backend, attempt: self._hedged(route, backend, attempt))
+        return result
+
+    async def stream(self, route: str, calls: dict):
+        """
+        Streaming counterpart of call(): each value returns an async chunk generator. Hedging,
+        failover and the attempt timeout apply until the first chunk arrives; after that
+        the stream stays with its backend and is bounded by the call deadline.
+        """
+        async def start(backend, open_stream):
+            return await self._hedged(f"{route} stream", backend, lambda: first_chunk(open_stream()), discard=lambda started: started[1].aclose())
+
+        backend, (chunk, chunks) = await self._route(route, calls, start)
+        try:
+            yield chunk
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            if isinstance(e, TimeoutError) and time_left() <= 0:
+                FAILURES.inc(backend=backend, reason="turn_deadline")  # not the backend's fault
+            else:
+                self.breaker(backend).failure()
+                FAILURES.inc(backend=backend, reason="deadline" if isinstance(e, TimeoutError) else "error")
+            raise
+        finally:
+            await chunks.aclose()
+
+
+router = BackendRouter()
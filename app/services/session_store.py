@@ -0,0 +1,354 @@
+"""
+Per-session state for the WebSocket service.
+
+Each dictation session keeps its own state (currently the chat history) under a session id,
+instead of sharing one module-level string across every connection.
+
+- InMemorySessionStore: bounded LRU with idle-TTL eviction and a memory cap (single worker).
+- DurableSessionStore: InMemorySessionStore that logs every change to a local op log
+  (oplog.py), so sessions survive restarts, and checkpoints DB sessions to the DB service.
+- RedisSessionStore: shared backend so several uvicorn workers see the same sessions.
+- create_session_store() picks one based on SESSION_STORE_URL and SESSION_LOG_DIR.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from document import Document, diff_ops
+from oplog import OpLog
+from telemetry import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "memory://")
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))  # max sessions kept in memory
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))  # idle time before a session is evicted
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))  # approximate memory cap for all sessions
+# op log of memory:// sessions, next to this module unless set; empty disables it
+SESSION_LOG_DIR = os.getenv("SESSION_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_log"))
+SESSION_CHECKPOINT_INTERVAL = float(os.getenv("SESSION_CHECKPOINT_INTERVAL", "60"))  # seconds between DB checkpoints; 0 disables them
+DB_SERVICE_URL = os.getenv("DB_SERVICE_URL", "http://localhost:9000")
+
+CHECKPOINTS = registry.counter("session_checkpoints_total", "Session states written to the DB service", ("outcome",))
+
+
+async def fetch_session(http: aiohttp.ClientSession, session_id: str, db_url: str = DB_SERVICE_URL) -> dict | None:
+    """The DB service's record of a session, None if it has none. Raises on other errors."""
+    async with http.get(f"{db_url}/sessions/{session_id}") as response:
+        if response.status == 404:
+            return None
+        response.raise_for_status()
+        return await response.json()
+
+
+def state_size(state: dict) -> int:
+    """Approximate memory used by a session state (dominated by its strings)."""
+    return sys.getsizeof(state) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in state.items())
+
+
+class SessionStore:
+    """
+    Interface for session state backends. State is a JSON-serializable dict.
+    """
+
+    async def get(self, session_id: str) -> dict:
+        """Return the state for session_id, or an empty dict if there is none."""
+        raise NotImplementedError
+
+    async def set(self, session_id: str, state: dict):
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def claim(self, session_id: str, user_id: int) -> bool:
+        """
+        Whether user_id may use the DB session session_id: only if the DB service has it
+        and it belongs to that user.
+        """
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as http:
+                session = await fetch_session(http, session_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("Looking up session %s on the DB service failed: %s", session_id, e)
+            return False
+        return session is not None and session.get("user_id") == user_id
+
+    async def start(self):
+        """Loads persisted sessions; called once before the service takes connections."""
+
+    async def close(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    LRU session store bounded by session count, idle TTL and total size.
+
+    Entries are kept in access order, so idle sessions are always at the front and
+    eviction only ever pops from that end.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_COUNT, ttl: float = SESSION_TTL_SECONDS, max_bytes: int = SESSION_MAX_BYTES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # session_id -> (state, last_access, size)
+
+    def evicted(self, session_id: str, state: dict):
+        """Called with the state of a session dropped for being idle or over the limits."""
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, session_id: str) -> dict:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return {}
+        state, last_access, size = entry
+        if time.monotonic() - last_access > self.ttl:
+            self._remove(session_id)
+            self.evicted(session_id, state)
+            return {}
+        self._entries[session_id] = (state, time.monotonic(), size)
+        self._entries.move_to_end(session_id)
+        return state
+
+    async def set(self, session_id: str, state: dict):
+        self._remove(session_id)
+        size = state_size(state)
+        self._entries[session_id] = (state, time.monotonic(), size)
+        self.total_bytes += size
+        self._evict(keep=session_id)
+
+    async def delete(self, session_id: str):
+        self._remove(session_id)
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def _evict(self, keep: str):
+        now = time.monotonic()
+        while self._entries:
+            oldest_id, (state, last_access, _) = next(iter(self._entries.items()))
+            over_limit = len(self._entries) > self.max_sessions or self.total_bytes > self.max_bytes
+            if oldest_id == keep or not (over_limit or now - last_access > self.ttl):
+                break
+            self._remove(oldest_id)
+            self.evictions += 1
+            self.evicted(oldest_id, state)
+
+
+class DurableSessionStore(InMemorySessionStore):
+    """
+    InMemorySessionStore backed by an OpLog in `directory`: start() rebuilds the sessions
+    from it after a restart. A change that moves a session to its next version is logged as
+    the edit ops from the previous text, anything else as the whole state.
+
+    Sessions with a numeric id are DB sessions. claim() checks that the DB service has
+    one and that it belongs to the caller, and loads it from the session's context if it
+    is not in memory. Only claimed sessions are written back: every `checkpoint_interval`
+    seconds, and on shutdown, each one that changed is merged into the session's current
+    context on the DB service (PATCH /sessions/{id} with the whole context, which the DB
+    service replaces). A session that the DB service no longer has, that changed owner, or
+    whose write it rejects is dropped from the checkpoints. Evicted sessions are
+    checkpointed, then dropped from the log.
+    """
+
+    def __init__(self, directory: str = SESSION_LOG_DIR, checkpoint_interval: float = SESSION_CHECKPOINT_INTERVAL, db_url: str = DB_SERVICE_URL, **limits):
+        super().__init__(**limits)
+        self.log = OpLog(directory)
+        self.checkpoint_interval = checkpoint_interval
+        self.db_url = db_url
+        self.dirty = {}  # DB session id -> state not checkpointed yet
+        self.owners = {}  # claimed DB session id -> user_id
+        self.checkpointing = {}  # DB session id -> state being written by the running checkpoint
+        self._http = None
+        self._tasks = []
+        self._snapshot = None
+        registry.gauge("session_log_bytes", "Size of the current session log generation", function=lambda: self.log.offset)
+
+    async def start(self):
+        states = await asyncio.to_thread(self.log.recover)
+        for session_id, state in states.items():
+            await super().set(session_id, state)
+        loop = asyncio.get_running_loop()
+        if self.log.sync_interval > 0:
+            self._tasks.append(loop.create_task(self._sync_forever()))
+        if self.checkpoint_interval > 0:
+            self._tasks.append(loop.create_task(self._checkpoint_forever()))
+
+    @staticmethod
+    def record(session_id: str, previous: dict | None, state: dict) -> dict:
+        if previous is not None and state.get("version") == previous.get("version", 0) + 1:
+            rest = {key: value for key, value in state.items() if key not in ("history", "version")}
+            if rest == {key: value for key, value in previous.items() if key not in ("history", "version")}:
+                ops = diff_ops(previous.get("history", ""), state.get("history", ""))
+                return {"t": "ops", "s": session_id, "b": previous.get("version", 0), "v": state["version"], "ops": ops}
+        return {"t": "set", "s": session_id, "state": state}
+
+    def client(self) -> aiohttp.ClientSession:
+        if self._http is None:
+            self._http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8), timeout=aiohttp.ClientTimeout(total=30))
+        return self._http
+
+    async def claim(self, session_id: str, user_id: int) -> bool:
+        resident = session_id in self._entries
+        # evicted but not checkpointed yet: the pending state is newer than the DB's
+        pending = self.dirty.get(session_id) or self.checkpointing.get(session_id)
+        owner = self.owners.get(session_id)
+        session = None
+        if owner is None or not (resident or pending):
+            try:
+                session = await fetch_session(self.client(), session_id, self.db_url)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning("Loading session %s from the DB service failed: %s", session_id, e)
+                return False
+            if session is None:
+                return False
+            owner = session.get("user_id")
+        if owner is None or owner != user_id:
+            return False
+        self.owners[session_id] = owner
+        if session_id not in self._entries:  # checked again, another claim may have loaded it meanwhile
+            pending = self.dirty.get(session_id) or self.checkpointing.get(session_id)
+            state = pending or Document.from_state(session.get("context") or {}).to_state()
+            self.log.append({"t": "set", "s": session_id, "state": state})
+            await super().set(session_id, state)
+        return True
+
+    async def set(self, session_id: str, state: dict):
+        entry = self._entries.get(session_id)
+        self.log.append(self.record(session_id, entry[0] if entry else None, state))
+        await super().set(session_id, state)
+        if session_id in self.owners:
+            self.dirty[session_id] = state
+        if self.log.needs_compaction() and (self._snapshot is None or self._snapshot.done()):
+            generation = self.log.rotate()
+            states = {key: entry[0] for key, entry in self._entries.items()}
+            self._snapshot = asyncio.get_running_loop().create_task(self._write_snapshot(states, generation))
+
+    async def delete(self, session_id: str):
+        self.log.append({"t": "del", "s": session_id})
+        self.dirty.pop(session_id, None)
+        self.owners.pop(session_id, None)
+        await super().delete(session_id)
+
+    def evicted(self, session_id: str, state: dict):
+        self.log.append({"t": "del", "s": session_id})
+        if session_id in self.owners:
+            self.dirty[session_id] = state
+
+    async def _write_snapshot(self, states: dict, generation: int):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.log.write_snapshot, states, generation)
+        except Exception:
+            logger.exception("Writing the session snapshot failed")  # the logs are kept, recovery still works
+            return
+        logger.info("Wrote a snapshot of %d sessions in %.1f ms", len(states), (time.perf_counter() - start) * 1000)
+
+    async def _sync_forever(self):
+        while True:
+            await asyncio.sleep(self.log.sync_interval)
+            self.log.sync()
+
+    async def _checkpoint_forever(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.checkpoint()
+
+    async def _checkpoint_one(self, session_id: str, state: dict):
+        owner = self.owners.get(session_id)
+        try:
+            session = await fetch_session(self.client(), session_id, self.db_url)
+            if session is None or session.get("user_id") != owner:
+                outcome = "dropped"  # deleted or handed to another user since it was claimed
+            else:
+                # the DB service replaces the context, so keep the keys this service does not own
+                context = {**(session.get("context") or {}), **state}
+                async with self.client().patch(f"{self.db_url}/sessions/{session_id}?user_id={owner}", json={"context": context}) as response:
+                    outcome = "ok" if response.status < 300 else "dropped" if response.status < 500 else "failed"
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            outcome = "failed"
+        CHECKPOINTS.inc(outcome=outcome)
+        if outcome == "failed":
+            self.dirty.setdefault(session_id, state)  # retried with the next checkpoint
+        elif outcome == "dropped":
+            logger.warning("The DB service refused the checkpoint of session %s, it is no longer written back", session_id)
+            self.owners.pop(session_id, None)
+            self.dirty.pop(session_id, None)
+        elif session_id not in self._entries and session_id not in self.dirty:
+            self.owners.pop(session_id, None)
+
+    async def checkpoint(self):
+        """Writes the state of every DB session changed since the last checkpoint to the DB service."""
+        pending, self.dirty = self.dirty, {}
+        if not pending:
+            return
+        self.checkpointing = pending
+        try:
+            await asyncio.gather(*(self._checkpoint_one(session_id, state) for session_id, state in pending.items()))
+        finally:
+            self.checkpointing = {}
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._snapshot is not None:
+            await self._snapshot
+        if self.checkpoint_interval > 0:
+            await self.checkpoint()
+        if self._http is not None:
+            await self._http.close()
+        self.log.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store shared across workers through Redis. Requires the optional `redis` package.
+    Idle sessions expire through Redis key TTLs.
+    """
+
+    def __init__(self, url: str, ttl: float = SESSION_TTL_SECONDS, prefix: str = "speakwrite:session:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE_URL points at Redis but the 'redis' package is not installed") from e
+        self.client = redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def get(self, session_id: str) -> dict:
+        raw = await self.client.getex(self.prefix + session_id, ex=self.ttl)
+        return json.loads(raw) if raw else {}
+
+    async def set(self, session_id: str, state: dict):
+        await self.client.set(self.prefix + session_id, json.dumps(state), ex=self.ttl)
+
+    async def delete(self, session_id: str):
+        await self.client.delete(self.prefix + session_id)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_session_store(url: str = SESSION_STORE_URL, log_dir: str = SESSION_LOG_DIR) -> SessionStore:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    if log_dir:
+        return DurableSessionStore(log_dir)
+    return InMemorySessionStore()
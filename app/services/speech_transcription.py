@@ -2,25 +2,48 @@
 Speech Transcription system:
 
 - recognize_speech() to listen with default Microphone
+- recognize_speech_locally() to transcribe while listening, offline (SPEECH_ENGINE=local)
 - generate_response() to generate SLM response to recognized speech
 - main() calls each method alternatively to simulate a conversation in the console (STRICTLY FOR DEMO PURPOSES)
 """
 
-import speech_recognition as sr
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
 import os
+from typing import TYPE_CHECKING
+from lazy import Lazy
+
+if TYPE_CHECKING:
+    from conversation import ConversationEngine
 
 # avoid logging about parallelism (not sure what it is)
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# load the Hugging Face model + tokenizer
 model_name = "microsoft/DialoGPT-medium"  # SLM with 355M parameters
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_name)
+DIALOGPT_HISTORY_TOKENS = int(os.getenv("DIALOGPT_HISTORY_TOKENS", "512"))  # sliding window over earlier turns
+DIALOGPT_MAX_NEW_TOKENS = int(os.getenv("DIALOGPT_MAX_NEW_TOKENS", "100"))
+DIALOGPT_THREADS = int(os.getenv("DIALOGPT_THREADS", "0")) or None  # torch default if unset
+SPEECH_ENGINE = os.getenv("SPEECH_ENGINE", "google")  # "local" streams the microphone through streaming_asr
+
+
+def load_model():
+    """Load the Hugging Face tokenizer + model (downloads on first run)."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name), AutoModelForCausalLM.from_pretrained(model_name)
+
+
+def load_recognizer():
+    import speech_recognition as sr
+    return sr.Recognizer()
+
+
+# built on first use (or by warm_up) so importing this module is cheap and offline-safe
+dialogpt = Lazy(load_model)
+speech_recognizer = Lazy(load_recognizer)
+
+
+def warm_up():
+    dialogpt.get()
+    speech_recognizer.get()
 
-# initialize Speech Recognizer
-recognizer = sr.Recognizer()
 
 def recognize_speech(mic_index: int = None, timeout: float = 10.0) -> str | None:
     """
@@ -33,6 +56,11 @@ def recognize_speech(mic_index: int = None, timeout: float = 10.0) -> str | None
     Returns:
     - str | None: The recognized text or None if recognition fails.
     """
+    if SPEECH_ENGINE == "local":
+        return recognize_speech_locally(mic_index, timeout)
+
+    import speech_recognition as sr
+    recognizer = speech_recognizer.get()
     with sr.Microphone(device_index=mic_index) as source:
         print("Listening...")
         recognizer.adjust_for_ambient_noise(source)
@@ -51,20 +79,55 @@ def recognize_speech(mic_index: int = None, timeout: float = 10.0) -> str | None
         return None
 
 
-def generate_response(input_text: str, chat_history_ids=None):
+def recognize_speech_locally(mic_index: int = None, timeout: float = 10.0) -> str | None:
+    """
+    Like recognize_speech, but decodes on this machine while the speaker is still talking,
+    printing words as they stabilize, and returns as soon as the utterance ends.
+    """
+    import time
+    import speech_recognition as sr
+    from streaming_asr import StreamingTranscriber, create_recognizer, SAMPLE_RATE
+
+    transcriber = StreamingTranscriber(create_recognizer(SAMPLE_RATE), SAMPLE_RATE)
+    with sr.Microphone(device_index=mic_index, sample_rate=SAMPLE_RATE) as source:
+        print("Listening...")
+        deadline = time.monotonic() + timeout
+        while True:
+            for event in transcriber.feed(source.stream.read(source.CHUNK)):
+                if event["type"] == "final":
+                    return event["data"]
+                print(f"... {event['data']}")
+            if not transcriber.in_speech and time.monotonic() > deadline:
+                print("No input detected. Please try again.")
+                return None
+
+
+def new_conversation() -> "ConversationEngine":
+    """Start a conversation that keeps the model's KV cache between turns."""
+    from conversation import ConversationEngine
+    tokenizer, model = dialogpt.get()
+    return ConversationEngine(
+        model,
+        tokenizer,
+        max_history_tokens=DIALOGPT_HISTORY_TOKENS,
+        max_new_tokens=DIALOGPT_MAX_NEW_TOKENS,
+        num_threads=DIALOGPT_THREADS,
+    )
+
+
+def generate_response(input_text: str, conversation: "ConversationEngine | None" = None):
     """
     Generate model's response to the input text.
+    Pass the returned conversation back in on the next turn to continue it.
     """
-    new_user_input_ids = tokenizer.encode(input_text + tokenizer.eos_token, return_tensors='pt')
-    bot_input_ids = torch.cat([chat_history_ids, new_user_input_ids], dim=-1) if chat_history_ids is not None else new_user_input_ids
-    chat_history_ids = model.generate(bot_input_ids, max_length=1000, pad_token_id=tokenizer.eos_token_id)
-    response = tokenizer.decode(chat_history_ids[:, bot_input_ids.shape[-1]:][0], skip_special_tokens=True)
-    return response, chat_history_ids
+    conversation = conversation or new_conversation()
+    response = conversation.respond(input_text)
+    return response, conversation
 
 
 def main():
     print("Start talking! Say 'exit' or 'quit' to end the conversation.")
-    chat_history_ids = None
+    conversation = None
     
     while True:
         # get speech input
@@ -78,7 +141,7 @@ def main():
                 break
 
             # generate and print the model's response
-            response, chat_history_ids = generate_response(user_input, chat_history_ids)
+            response, conversation = generate_response(user_input, conversation)
             print(f"Model: {response}")
 
 if __name__ == "__main__":
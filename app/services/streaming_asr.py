@@ -0,0 +1,284 @@
+"""
+Streaming speech recognition for audio sent over the WebSocket.
+
+Audio arrives as mono 16-bit samples in frames of any size (see audio_stream.py for the
+wire format). It is written into a per-connection ring buffer and read back as fixed
+VAD frames; a voice activity detector finds where each utterance starts (keeping a
+short pre-roll so the first syllable is not lost) and where it ends (ENDPOINT_SILENCE_MS
+of silence). While the speaker is talking, audio is decoded incrementally in CHUNK_MS
+chunks by an offline CPU engine (Vosk), and words are reported in "partial" events once
+PARTIAL_AGREEMENT consecutive hypotheses agree on them. The endpoint produces a "final"
+event with the full text.
+
+Every event carries "audio_ms" (stream position when it was produced) and "start_ms"
+(where the utterance started), so callers can measure recognition latency.
+"""
+
+import os
+import json
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from lazy import Lazy
+from audio_stream import AudioRingBuffer
+
+load_dotenv()
+
+SAMPLE_RATE = int(os.getenv("ASR_SAMPLE_RATE", "16000"))
+ASR_ENGINE = os.getenv("ASR_ENGINE", "vosk")
+ASR_VAD = os.getenv("ASR_VAD", "energy")  # "energy" (numpy) or "webrtc" (needs webrtcvad)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+ASR_WORKER_THREADS = int(os.getenv("ASR_WORKER_THREADS", "8"))
+
+VAD_FRAME_MS = 30
+CHUNK_MS = int(os.getenv("ASR_CHUNK_MS", "200"))  # audio per incremental decode
+ENDPOINT_SILENCE_MS = int(os.getenv("ASR_ENDPOINT_SILENCE_MS", "600"))
+PARTIAL_AGREEMENT = int(os.getenv("ASR_PARTIAL_AGREEMENT", "2"))
+PREROLL_MS = 300
+BUFFER_MS = int(os.getenv("ASR_BUFFER_MS", "600"))  # per-connection ring buffer; at least pre-roll + a chunk
+SPEECH_START_FRAMES = 3  # consecutive voiced frames before an utterance starts
+MAX_UTTERANCE_MS = 30000
+
+# decoding is CPU-bound; keep it off the event loop and away from the LLM threads
+asr_executor = ThreadPoolExecutor(max_workers=ASR_WORKER_THREADS, thread_name_prefix="asr")
+
+
+class EnergyVAD:
+    """A frame is speech when its RMS is well above the noise floor tracked over silent frames."""
+
+    def __init__(self, threshold_ratio: float = 3.0, min_rms: float = 300.0, floor_alpha: float = 0.05):
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.floor_alpha = floor_alpha
+        self.noise_floor = None
+        self._values = np.zeros(0, dtype=np.float32)
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        if len(self._values) != len(frame):
+            self._values = np.zeros(len(frame), dtype=np.float32)
+        np.copyto(self._values, frame, casting="unsafe")
+        rms = math.sqrt(np.dot(self._values, self._values) / len(frame)) if len(frame) else 0.0
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        speech = rms > max(self.min_rms, self.noise_floor * self.threshold_ratio)
+        if not speech:
+            self.noise_floor += self.floor_alpha * (rms - self.noise_floor)
+        return speech
+
+
+class WebRtcVAD:
+    def __init__(self, sample_rate: int, aggressiveness: int = 2):
+        import webrtcvad
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        return self.vad.is_speech(frame.tobytes(), self.sample_rate)
+
+
+def create_vad(sample_rate: int = SAMPLE_RATE, name: str = ASR_VAD):
+    if name == "webrtc":
+        return WebRtcVAD(sample_rate)
+    return EnergyVAD()
+
+
+class SpeechRecognizer:
+    """One utterance at a time: accept() audio chunks, then finish() for the final text."""
+
+    def accept(self, pcm: bytes) -> str:
+        """Decode another chunk and return the current hypothesis for the utterance so far."""
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        """Return the final text and get ready for the next utterance."""
+        raise NotImplementedError
+
+
+def load_vosk_model():
+    from vosk import Model, SetLogLevel
+    SetLogLevel(-1)
+    if not os.path.isdir(VOSK_MODEL_PATH):
+        raise RuntimeError(f"Vosk model not found at {VOSK_MODEL_PATH}; set VOSK_MODEL_PATH")
+    return Model(VOSK_MODEL_PATH)
+
+
+vosk_model = Lazy(load_vosk_model)  # shared by every connection's recognizer
+
+
+class VoskRecognizer(SpeechRecognizer):
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        from vosk import KaldiRecognizer
+        self.recognizer = KaldiRecognizer(vosk_model.get(), sample_rate)
+        self.segments = []  # text of pieces Vosk already closed on its own inside this utterance
+
+    def accept(self, pcm: bytes) -> str:
+        if self.recognizer.AcceptWaveform(pcm):
+            self.segments.append(json.loads(self.recognizer.Result())["text"])
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult())["partial"]
+        return " ".join(filter(None, [*self.segments, partial]))
+
+    def finish(self) -> str:
+        text = json.loads(self.recognizer.FinalResult())["text"]  # also resets the recognizer
+        result = " ".join(filter(None, [*self.segments, text]))
+        self.segments = []
+        return result
+
+
+def create_recognizer(sample_rate: int = SAMPLE_RATE, name: str = ASR_ENGINE) -> SpeechRecognizer:
+    if name == "vosk":
+        return VoskRecognizer(sample_rate)
+    raise ValueError(f"Unknown ASR engine: {name}")
+
+
+class PartialStabilizer:
+    """Words count as stable once the last `agreement` hypotheses all start with them."""
+
+    def __init__(self, agreement: int = PARTIAL_AGREEMENT):
+        self.recent = deque(maxlen=agreement)
+        self.stable = []
+
+    def update(self, hypothesis: str) -> list | None:
+        """Returns the stable words when they grew with this hypothesis, else None."""
+        self.recent.append(hypothesis.split())
+        if len(self.recent) < self.recent.maxlen:
+            return None
+        prefix = []
+        for words in zip(*self.recent):
+            if any(word != words[0] for word in words):
+                break
+            prefix.append(words[0])
+        if len(prefix) <= len(self.stable):
+            return None
+        self.stable = prefix
+        return prefix
+
+    def reset(self):
+        self.recent.clear()
+        self.stable = []
+
+
+class StreamingTranscriber:
+    """
+    Per-connection pipeline: feed() mono int16 samples, get back "partial" and "final" events.
+    Audio is held in a preallocated ring buffer; VAD frames, pre-roll and decode chunks are
+    views into it. Not thread-safe; feed one connection's audio in order.
+    """
+
+    def __init__(
+            self,
+            recognizer: SpeechRecognizer,
+            sample_rate: int = SAMPLE_RATE,
+            vad=None,
+            chunk_ms: int = CHUNK_MS,
+            endpoint_silence_ms: int = ENDPOINT_SILENCE_MS,
+            agreement: int = PARTIAL_AGREEMENT,
+            buffer_ms: int = BUFFER_MS,
+        ):
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.vad = vad or create_vad(sample_rate)
+        self.frame_samples = sample_rate * VAD_FRAME_MS // 1000
+        self.chunk_samples = sample_rate * chunk_ms // 1000
+        self.preroll_samples = PREROLL_MS // VAD_FRAME_MS * self.frame_samples
+        self.endpoint_frames = max(1, endpoint_silence_ms // VAD_FRAME_MS)
+        self.max_samples = sample_rate * MAX_UTTERANCE_MS // 1000
+        self.stabilizer = PartialStabilizer(agreement)
+        # room for the pre-roll, a chunk waiting to be decoded and a frame being filled;
+        # a whole number of frames, so a frame never wraps around the end
+        frames = -(-max(sample_rate * buffer_ms // 1000, self.preroll_samples + self.chunk_samples + 2 * self.frame_samples) // self.frame_samples)
+        self.buffer = AudioRingBuffer(frames * self.frame_samples)
+
+        self.position = 0  # samples consumed by the VAD
+        self.in_speech = False
+        self._idle_since = 0  # end of the last utterance; pre-roll never reaches back past it
+        self._start = 0  # where the current utterance started
+        self._decoded = 0  # speech before this position has been sent to the recognizer
+        self._voiced_run = 0
+        self._silent_run = 0
+
+    def _ms(self, samples: int) -> int:
+        return samples * 1000 // self.sample_rate
+
+    def _pinned(self) -> int:
+        """Oldest position still needed: undecoded speech, or the pre-roll while waiting for speech."""
+        if self.in_speech:
+            return self._decoded
+        return max(self._idle_since, self.position - self.preroll_samples)
+
+    def feed(self, samples) -> list:
+        """Accepts an int16 array or 16-bit little-endian PCM bytes at self.sample_rate."""
+        if not isinstance(samples, np.ndarray):
+            samples = np.frombuffer(samples, dtype="<i2")
+        events = []
+        offset = 0
+        while offset < len(samples):
+            room = self.buffer.capacity - (self.buffer.written - self._pinned())
+            count = min(room, len(samples) - offset)
+            self.buffer.write(samples[offset:offset + count])
+            offset += count
+            while self.buffer.written - self.position >= self.frame_samples:
+                self._frame(events)
+        return events
+
+    def flush(self) -> list:
+        """End of stream: close any utterance that is still open."""
+        events = []
+        if self.in_speech:
+            self._endpoint(events)
+        return events
+
+    def _frame(self, events: list):
+        frame = self.buffer.views(self.position, self.position + self.frame_samples)[0]
+        self.position += self.frame_samples
+        speech = self.vad.is_speech(frame)
+        if not self.in_speech:
+            self._voiced_run = self._voiced_run + 1 if speech else 0
+            if self._voiced_run >= SPEECH_START_FRAMES:
+                self.in_speech = True
+                self._start = self._decoded = max(self._idle_since, self.position - self.preroll_samples)
+                self._silent_run = 0
+                self._decode(events)
+            return
+
+        self._silent_run = 0 if speech else self._silent_run + 1
+        if self._silent_run >= self.endpoint_frames or self.position - self._start >= self.max_samples:
+            self._endpoint(events)
+        else:
+            self._decode(events)
+
+    def _decode(self, events: list, force: bool = False):
+        if self.position - self._decoded < self.chunk_samples and not (force and self.position > self._decoded):
+            return
+        hypothesis = self.recognizer.accept(self.buffer.bytes(self._decoded, self.position))
+        self._decoded = self.position
+        stable = self.stabilizer.update(hypothesis)
+        if stable is not None:
+            words = hypothesis.split()
+            events.append({
+                "type": "partial",
+                "data": " ".join(stable),
+                "tail": " ".join(words[len(stable):]),  # newest words, may still change
+                "start_ms": self._ms(self._start),
+                "audio_ms": self._ms(self.position),
+            })
+
+    def _endpoint(self, events: list):
+        self._decode(events, force=True)
+        text = self.recognizer.finish().strip()
+        if text:
+            events.append({
+                "type": "final",
+                "data": text,
+                "start_ms": self._ms(self._start),
+                "audio_ms": self._ms(self.position),
+            })
+        self.in_speech = False
+        self._idle_since = self.position
+        self._voiced_run = 0
+        self.stabilizer.reset()
@@ -1,128 +1,378 @@
 import os
-import google.generativeai as genai
-import requests
-import google.auth
-from google.auth.transport.requests import Request
+import time
+import asyncio
+import logging
+from command_detector import detector
+from context_window import speech_context, command_context, splice, COMMAND_OUTPUT_TOKENS
+from llm_cache import response_cache
+from llm_http import llm_http, google_auth
+from prompts import TRANSCRIBE, EDIT_COMMAND, CLASSIFY
+from mistral_inference import apply_prompt_template, generate_mistral_response
+from concurrency import backend_limiter, llm_executor, BackendBusy, STAGE_SECONDS, record_tokens, SpeculationBudget, Speculative, SpeculativeStream
+from router import router
+from telemetry import span, timed
+
+logger = logging.getLogger(__name__)
 
-# Replace with your actual access token
-access_token = os.getenv("GCLOUD_ACCESS_TOKEN")
 model_region = os.getenv("TRAINED_MODEL_LOCATION")
 project_id = os.getenv("PROJECT_ID")
 endpoint_id = os.getenv("ENDPOINT_ID")
 
-credentials = google.auth.default()[0]
-credentials.refresh(Request())
-# print(credentials.token)
-url = f"https://{model_region}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{model_region}/endpoints/{endpoint_id}:generateContent"
-
-headers = {
-    "Authorization": f"Bearer {credentials.token}",
-    "Content-Type": "application/json; charset=utf-8"
-}
-
+endpoint_url = os.getenv("VERTEX_ENDPOINT_URL") or f"https://{model_region}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{model_region}/endpoints/{endpoint_id}"
+url = f"{endpoint_url}:generateContent"
+stream_url = f"{endpoint_url}:streamGenerateContent?alt=sse"
 
 # Configure your API key
 gemini_key = os.getenv("GEMINI_KEY")
-genai.configure(api_key=gemini_key)  # Replace with your actual API key
-
-# Model Selection
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-
-def transcribe_speech(user_input, file_content, tone = "friendly"):
-    tone_instructions = {
-        "friendly": {
-            "description": "warm, conversational, and approachable. Could be funny as well, if appropriate.",
-            "style_guide": "Use casual language, contractions, and a personal touch. Write as if speaking to a friend. It can look like a text message.",
-            "example": "Hey there! I've put together some notes about the project we discussed...want to take a look?"
-        },
-        "professional": {
-            "description": "formal, clear, and business-appropriate",
-            "style_guide": "Use precise language, complete sentences, and a structured format. Avoid contractions and colloquialisms. Use professional jargon and complex diction where appropriate.",
-            "example": "Please find below the key points regarding the project requirements. This refers to the aforemntioned project."
-        },
-        "technical": {
-            "description": "analytical, detailed, and methodical",
-            "style_guide": "Use domain-specific terminology, logical structure, and precise descriptions. Include relevant technical details. Can use indentations to create list format if appropriate. Can break larger idea into smaller step like sections.",
-            "example": "The system architecture implements a three-tier model with the following components:\n      1) Presentation Layer: User Interface\n     2) Application Layer: Business Logic\n      3) Data Layer: Database Management."
-        },
-        "summary": {
-            "description": "concise, focused, and essential",
-            "style_guide": "Extract only key information, eliminate redundancy, and prioritize critical points.",
-            "example": "Main takeaways: 1) Project deadline extended to June 15, 2) Budget approved for additional resources."
-        }
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta")
+gemini_url = f"{GEMINI_API_URL}/models/{GEMINI_MODEL}:generateContent"
+gemini_stream_url = f"{GEMINI_API_URL}/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+
+# detector score from which an input left to the remote classifier is guessed to be a command
+SPECULATION_COMMAND_SCORE = float(os.getenv("SPECULATION_COMMAND_SCORE", "0.5"))
+speculation_budget = SpeculationBudget()
+
+# shortest Mistral output accepted, relative to the text it replaces: dictation only adds
+# text, commands may shorten it
+SPEECH_MIN_RATIO = 1.0
+COMMAND_MIN_RATIO = float(os.getenv("MISTRAL_COMMAND_MIN_RATIO", "0.5"))
+
+# stage and backend of the downstream call for each classification
+DOWNSTREAM = {"command": ("execute", "vertex"), "speech": ("transcribe", "gemini")}
+
+
+async def vertex_headers():
+    return {
+        "Authorization": f"Bearer {await google_auth.token()}",
+        "Content-Type": "application/json; charset=utf-8"
     }
 
-    tone_data = tone_instructions.get(tone, {})
-    tone_description = tone_data.get("description", "No specific tone description available.")
-    tone_style_guide = tone_data.get("style_guide", "No specific style guide available.")
-    tone_example = tone_data.get("example", "No example available.")
-    prompt = (
-        "You are a transcription assistant. Transcribe the incoming user input in a refined manner, ignoring natural mistakes such as 'sorry' or 'uh' or 'hmm' and "
-        "append it to the File content provided below, returning the updated text with no commentary. If you don't hear any speech, then return the File Content as it is.\n\n"
-        "Follow the following tone guidelines when transcribing new text or making any changes, paraphrase the new text to match the tone and tone guidelines:\n"
-        f"Selected tone: {tone}\n"
-        f"Tone description: {tone_description}\n"
-        f"Style guide: {tone_style_guide}\n"
-        f"Example: {tone_example}\n\n"
-        "File content: " + file_content 
+
+def gemini_headers():
+    return {"x-goog-api-key": gemini_key} if gemini_key else {}
+
+
+def gemini_payload(contents):
+    return {"contents": [{"role": "user", "parts": [{"text": text} for text in contents]}]}
+
+
+def candidate_text(response_json):
+    """Text of the first candidate in a generateContent response or stream event, None if it has none."""
+    parts = response_json.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+    texts = [part["text"] for part in parts if part.get("text")]
+    return "".join(texts) if texts else None
+
+
+def check_finished(backend, response_json):
+    """Raises if the model stopped at its output token limit: the text is cut off and must not replace the window."""
+    if response_json.get("candidates", [{}])[0].get("finishReason") == "MAX_TOKENS":
+        raise ValueError(f"{backend} output was cut off at maxOutputTokens")
+
+
+def record_usage(backend, response_json):
+    usage = response_json.get("usageMetadata", {})
+    record_tokens(backend, usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+
+async def warm_up():
+    """Fetches Google credentials (and starts their background refresh) ahead of the first request."""
+    await google_auth.token()
+
+
+async def close():
+    await google_auth.stop()
+    await llm_http.aclose()
+
+
+async def generate(backend, url, payload, headers):
+    """One generateContent call through the backend's limiter; returns the text, raises on failure."""
+    async with backend_limiter.aslot(backend):
+        response_json = await llm_http.post_json(url, payload, headers)
+    logger.debug("%s response: %s", backend, response_json)
+    record_usage(backend, response_json)
+    check_finished(backend, response_json)
+    text = candidate_text(response_json)
+    if text is None:
+        raise ValueError(f"No response from {backend}")
+    return text
+
+
+async def stream_generate(backend, url, payload, headers):
+    """Yields text chunks of a streamGenerateContent call as they arrive; raises at the end if the output was cut off."""
+    async with backend_limiter.aslot(backend):
+        event = {}
+        async for event in llm_http.stream_events(url, payload, headers):
+            text = candidate_text(event)
+            if text:
+                yield text
+        record_usage(backend, event)  # the last event carries the totals and the finish reason
+        check_finished(backend, event)
+
+
+@response_cache.cached("gemini", key=lambda contents: [GEMINI_MODEL, contents])
+async def gemini_generate(contents):
+    """Calls Gemini and returns the response text. Raises on failure so errors are never cached."""
+    return await generate("gemini", gemini_url, gemini_payload(contents), gemini_headers())
+
+
+# samples at temperature=1 (see command_payload), so only cached when "vertex" is listed in LLM_CACHE_BACKENDS
+@response_cache.cached("vertex", key=lambda payload: [endpoint_url, payload])
+async def vertex_generate(payload):
+    """Calls the Vertex endpoint and returns the first candidate's text. Raises on failure."""
+    return await generate("vertex", url, payload, await vertex_headers())
+
+
+async def mistral_generate(file_content, user_input, tone, min_ratio):
+    """
+    Applies user_input to file_content with the Mistral backend, on a worker thread. The
+    start of file_content dropped to fit Mistral's budget is kept as is. Mistral's output
+    is short (max_new_tokens), so an answer shorter than min_ratio times the text it
+    replaces is taken to be cut off and raises instead.
+    """
+    trimmed = apply_prompt_template(file_content, user_input, tone).trimmed
+    loop = asyncio.get_running_loop()
+    text = (await loop.run_in_executor(llm_executor, generate_mistral_response, file_content[trimmed:], user_input, tone)).strip()
+    if len(text) < min_ratio * len(file_content[trimmed:].strip()):
+        raise ValueError(f"Mistral returned {len(text)} characters for {len(file_content) - trimmed}")
+    return file_content[:trimmed] + text
+
+
+def summary_note(summary):
+    """Prompt text describing the parts of the document that were left out of File content."""
+    if not summary:
+        return ""
+    return (
+        "File content is only part of a longer document. For context, the rest of the document covers "
+        "(do not include this summary in your answer):\n" + summary + "\n\n"
     )
+
+
+def fit_prompt(template, context, **fields):
+    """
+    Renders template for context's window. When the window had to be trimmed to fit the
+    backend's token budget, the returned context starts where the prompt's window does,
+    so the trimmed text is kept as is when the output is spliced back in.
+    """
+    prompt = template.render(file_content=context.window, summary=summary_note(context.summary), **fields)
+    return prompt, context.shifted(prompt.trimmed)
+
+
+async def transcribe_speech(prompt, file_content, user_input="", tone="friendly"):
+    """
+    Appends the prompt's user input to its file content with Gemini, or the backends after
+    it on the transcribe route; file_content is returned on errors.
+    """
+    calls = {
+        "gemini": lambda: gemini_generate(prompt.contents),
+        "vertex": lambda: vertex_generate(command_payload(prompt)),
+        "mistral": lambda: mistral_generate(file_content, user_input, tone, SPEECH_MIN_RATIO),
+    }
     try:
-        response = model.generate_content([
-            f"User input: {user_input}",
-            prompt
-        ])
-        return response.text.strip()
+        return (await router.call("transcribe", calls)).strip()
+    except BackendBusy:
+        raise
     except Exception as e:
-        print(f"Transcription error: {e}")
+        logger.warning("Transcription error: %s", e)
         return file_content
 
 
-def execute_command(user_input, file_content):
-    payload = {
+def stream_transcribe_speech(prompt):
+    """Yields the updated file content in chunks as Gemini (or the next healthy backend) generates it."""
+    return router.stream("transcribe", {
+        "gemini": lambda: stream_generate("gemini", gemini_stream_url, gemini_payload(prompt.contents), gemini_headers()),
+        "vertex": lambda: stream_vertex(command_payload(prompt)),
+    })
+
+
+def command_payload(prompt):
+    """Builds the Vertex request body for an edit_command prompt."""
+    return {
         "contents": [
             {
                 "role": "USER",
-                "parts": [
-                    { "text": f"User input: {user_input}" },
-                    { "text":  "Instruction: You are an advanced text-editing assistant. If the User input is a text-editing command, apply it to the File content provided below and return the updated text (with no explanations and no commentary). If the command is not possible, leave the file content as is.\n\n" }, 
-                    { "text": f"File content: {file_content}" }
-                ]
-                    
+                "parts": [{ "text": text } for text in prompt.contents]
             }
         ],
         "generation_config": {
             "temperature":1,
             "topP": 0.5,
             "topK": 3,
-            "maxOutputTokens": 1000
+            "maxOutputTokens": COMMAND_OUTPUT_TOKENS  # command windows are sized to fit (see context_window.py)
         }
     }
+
+
+async def execute_command(prompt, file_content, user_input="", tone="friendly"):
+    """
+    Applies the prompt's editing command with Vertex, or the backends after it on the
+    execute route; file_content is returned on errors.
+    """
+    calls = {
+        "vertex": lambda: vertex_generate(command_payload(prompt)),
+        "gemini": lambda: gemini_generate(prompt.contents),
+        "mistral": lambda: mistral_generate(file_content, user_input, tone, COMMAND_MIN_RATIO),
+    }
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response_json = response.json()
-        print(response_json)
-        return response_json.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "No response").strip()
+        return (await router.call("execute", calls)).strip()
+    except BackendBusy:
+        raise
     except Exception as e:
-        print(f"Transcription error: {e}")
+        logger.warning("Command execution error: %s", e)
         return file_content
 
 
-def classify_input(chat_history, user_input, tone = "friendly"):
-    """Sends audio to Gemini and returns the text response."""
+async def stream_vertex(payload):
+    async for chunk in stream_generate("vertex", stream_url, payload, await vertex_headers()):
+        yield chunk
+
+
+def stream_execute_command(prompt):
+    """Yields the edited file content in chunks from Vertex's (or the next healthy backend's) event stream."""
+    return router.stream("execute", {
+        "vertex": lambda: stream_vertex(command_payload(prompt)),
+        "gemini": lambda: stream_generate("gemini", gemini_stream_url, gemini_payload(prompt.contents), gemini_headers()),
+    })
+
+
+async def remote_classify(user_input):
+    """Asks Gemini whether the input is a command or speech."""
     try:
-        response = model.generate_content([
-            f"User input: {user_input}"
-            "Determine if the following user input is a text-editing command or normal speech. Return only one word: 'command' if it is a text-editing command, or 'speech' if it is normal speech.",
-        ])
-        classification = response.text.lower().strip()
+        contents = CLASSIFY.render(user_input=user_input).contents
+        response_text = await router.call("classify", {"gemini": lambda: gemini_generate(contents)})
+        return response_text.lower().strip()
+    except BackendBusy:
+        raise
     except Exception as e:
-        print(f"Classification error: {e}")
-        classification = "speech"  # default to speech if something goes wrong
-    
+        logger.warning("Classification error: %s", e)
+        return "speech"  # default to speech if something goes wrong
+
+
+async def classify(user_input, on_remote=None):
+    """
+    The local detector answers clear-cut inputs; only ambiguous ones are sent to Gemini.
+    on_remote, if given, is called just before the remote call, to start work meanwhile.
+    Returns "command" or "speech"; any other answer counts as speech.
+    """
+    start = time.perf_counter()
+    backend = "local"
+    with span("classify") as recorded:
+        classification = detector.classify(user_input)
+        if classification is None:
+            backend = "gemini"
+            if on_remote is not None:
+                on_remote()
+            classification = await remote_classify(user_input)
+        if recorded is not None:
+            recorded.set_attribute("backend", backend)
+            recorded.set_attribute("classification", classification)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="classify", backend=backend)
+    if classification not in DOWNSTREAM:
+        logger.debug("Unknown classification %r, treating the input as speech", classification)
+        classification = "speech"
+    return classification
+
+
+def guess(user_input):
+    """
+    Likelier classification of an input the detector could not decide, for starting its
+    downstream call speculatively; None when speculation is disabled or over budget.
+    """
+    if not speculation_budget.allow():
+        return None
+    return "command" if detector.score(user_input) >= SPECULATION_COMMAND_SCORE else "speech"
+
+
+def plan(classification, chat_history, user_input, tone = "friendly"):
+    """Prompt and context for applying user_input to chat_history as classification."""
     if classification == "command":
-        chat_history = execute_command(user_input, chat_history)
-    elif classification == "speech":
-        chat_history =  transcribe_speech(user_input, chat_history, tone) 
-    
-    return chat_history
\ No newline at end of file
+        return fit_prompt(EDIT_COMMAND, command_context(chat_history, user_input), user_input=user_input)
+    return fit_prompt(TRANSCRIBE, speech_context(chat_history), user_input=user_input, tone=tone)
+
+
+async def run_downstream(classification, prompt, context, user_input, tone):
+    """Returns the model's version of the context window."""
+    stage, backend = DOWNSTREAM[classification]
+    with timed(STAGE_SECONDS, stage, stage=stage, backend=backend):
+        if classification == "command":
+            return await execute_command(prompt, context.window, user_input, tone)
+        return await transcribe_speech(prompt, context.window, user_input, tone)
+
+
+def stream_downstream(classification, prompt):
+    if classification == "command":
+        return stream_execute_command(prompt)
+    return stream_transcribe_speech(prompt)
+
+
+async def classify_input(chat_history, user_input, tone = "friendly"):
+    """
+    Classifies the input as a command or speech and applies it to chat_history.
+    Only a window of chat_history is sent to the model and the result is spliced back in.
+    While the remote classifier runs, the likelier downstream call may be started
+    speculatively (see guess); it is dropped if the classification disagrees.
+    """
+    started = []
+
+    def speculate():
+        guessed = guess(user_input)
+        if guessed is not None:
+            prompt, context = plan(guessed, chat_history, user_input, tone)
+            started.append((guessed, context, Speculative(run_downstream(guessed, prompt, context, user_input, tone))))
+
+    try:
+        classification = await classify(user_input, on_remote=speculate)
+    except BaseException:
+        for _, _, call in started:
+            call.drop()
+        raise
+    for guessed, context, call in started:
+        if guessed == classification:
+            return splice(context, await call.result())
+        call.drop()
+
+    prompt, context = plan(classification, chat_history, user_input, tone)
+    return splice(context, await run_downstream(classification, prompt, context, user_input, tone))
+
+
+async def stream_classify_input(chat_history, user_input, tone = "friendly", on_window = None):
+    """
+    Streaming variant of classify_input: yields chunks of the updated chat history.
+    With on_window, only the model's version of the window is yielded: on_window(context)
+    is called before the first chunk, and the caller splices the result in itself.
+    Errors are raised to the caller, which should keep chat_history unchanged.
+    """
+    started = []
+
+    def speculate():
+        guessed = guess(user_input)
+        if guessed is not None:
+            prompt, context = plan(guessed, chat_history, user_input, tone)
+            started.append((guessed, context, SpeculativeStream(stream_downstream(guessed, prompt))))
+
+    try:
+        classification = await classify(user_input, on_remote=speculate)
+    except BaseException:
+        for _, _, call in started:
+            call.drop()
+        raise
+    chunks = None
+    for guessed, speculated_context, call in started:
+        if guessed == classification:
+            context, chunks = speculated_context, call
+        else:
+            call.drop()
+    if chunks is None:
+        prompt, context = plan(classification, chat_history, user_input, tone)
+        chunks = stream_downstream(classification, prompt)
+
+    stage, backend = DOWNSTREAM[classification]
+    if on_window is not None:
+        on_window(context)
+    elif context.prefix:
+        yield context.prefix
+    with timed(STAGE_SECONDS, stage, stage=stage, backend=backend):
+        async for chunk in chunks:
+            yield chunk
+    if on_window is None and context.suffix:
+        yield context.suffix
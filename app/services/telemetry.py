@@ -0,0 +1,364 @@
+"""
+Metrics and tracing shared by the gateway and the WebSocket service.
+
+Metrics are kept in process and rendered in the Prometheus text format by `registry.render()`,
+which both apps serve on GET /metrics. Metric objects are thread-safe, so stages running in
+executor threads record into them directly. Declaring a metric that already exists returns
+the existing one, so modules can each declare what they record.
+
+Spans are exported only when OTEL_EXPORTER_OTLP_ENDPOINT is set (e.g. a local OpenTelemetry
+collector at http://127.0.0.1:4318): finished spans are queued and a background thread posts
+them in batches as OTLP/JSON, so the event loop never waits on the collector. When the queue
+is full, spans are dropped. TRACE_SAMPLE_RATE picks the share of root spans that are recorded.
+
+Only the standard library is used, so importing this module is cheap in both apps.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+import urllib.request
+from bisect import bisect_left
+from contextlib import contextmanager
+
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")  # unset: no span export
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))  # seconds between batches
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Counters and gauges either hold their values or read them from `function` at scrape time."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), function=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function  # returns a value, or {label values tuple: value}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) for every series."""
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [("", key if isinstance(key, tuple) else (key,), "", value) for key, value in values.items()]
+        with self._lock:
+            return [("", key, "", value) for key, value in self._values.items()]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{label_text(self.labels, key, extra)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", key, f'le="{"+Inf" if bound == float("inf") else f"{bound:g}"}"', cumulative))
+            samples.append(("_sum", key, "", total))
+            samples.append(("_count", key, "", count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: tuple = (), function=None) -> Counter:
+        return self._get_or_create(Counter, name, help, labels, function)
+
+    def gauge(self, name: str, help: str, labels: tuple = (), function=None) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labels, function)
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        """W3C trace context header value, to continue this trace in another service."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"] = {"code": 2, "message": self.error}
+        return span
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """Posts finished spans to an OTLP/HTTP collector from a daemon thread."""
+
+    def __init__(self, endpoint: str, service_name: str, max_queue: int = TRACE_QUEUE_SIZE, interval: float = TRACE_EXPORT_INTERVAL, max_batch: int = 512):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.interval = interval
+        self.max_batch = max_batch
+        self.spans = queue.Queue(maxsize=max_queue)
+        self.dropped = registry.counter("trace_spans_dropped_total", "Spans dropped because the export queue was full or the collector failed")
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self.spans.put_nowait(span)
+        except queue.Full:
+            self.dropped.inc()
+
+    def _run(self):
+        while True:
+            batch = [self.spans.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self.spans.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._post(batch)
+
+    def _post(self, batch: list):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": [span.to_otlp() for span in batch]}],
+        }]}
+        request = urllib.request.Request(self.url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception:
+            self.dropped.inc(len(batch))
+
+
+exporter = None
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def configure_tracing(service_name: str, endpoint: str = OTEL_EXPORTER_OTLP_ENDPOINT):
+    """Starts span export for this process; a no-op unless an endpoint is configured."""
+    global exporter
+    if endpoint and exporter is None:
+        exporter = SpanExporter(endpoint, os.getenv("OTEL_SERVICE_NAME", service_name))
+
+
+def parse_traceparent(header: str | None) -> tuple:
+    """(trace id, parent span id) from a W3C traceparent header, or (None, None)."""
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+@contextmanager
+def span(name: str, traceparent: str | None = None, **attributes):
+    """
+    Records the enclosed block as a span, a child of the current one. Yields the Span, or
+    None when tracing is off or this trace was not sampled. Exceptions mark the span failed.
+    """
+    parent = current_span.get()
+    if exporter is None or (parent is None and random.random() >= TRACE_SAMPLE_RATE and not traceparent):
+        yield None
+        return
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = parse_traceparent(traceparent)
+        trace_id = trace_id or "%032x" % random.getrandbits(128)
+    recorded = Span(name, trace_id, parent_id, attributes)
+    token = current_span.set(recorded)
+    try:
+        yield recorded
+    except BaseException as error:
+        recorded.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        current_span.reset(token)
+        recorded.end = time.time_ns()
+        exporter.export(recorded)
+
+
+@contextmanager
+def timed(histogram: Histogram, span_name: str | None = None, **labels):
+    """Observes the block's duration in histogram and, with span_name, traces it too."""
+    start = time.perf_counter()
+    try:
+        if span_name is None:
+            yield
+        else:
+            with span(span_name, **labels):
+                yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+HTTP_REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "Time to handle an HTTP request, until the response body is sent", ("method", "route", "status"))
+HTTP_IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests being handled")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request by route template (not raw path, to keep
+    label values bounded) and tracing it as a root span that continues an incoming traceparent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        headers = dict(scope.get("headers") or ())
+        try:
+            with span(f"{scope['method']} {scope['path']}", traceparent=headers.get(b"traceparent", b"").decode() or None) as recorded:
+                await self.app(scope, receive, send_wrapper)
+                if recorded is not None:
+                    recorded.name = f"{scope['method']} {getattr(scope.get('route'), 'path', scope['path'])}"
+                    recorded.set_attribute("http.status_code", status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=getattr(route, "path", "unmatched"), status=status)
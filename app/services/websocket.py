@@ -1,15 +1,66 @@
+import os
+import json
+import time
 import uvicorn
-import traceback
+import logging
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 
 # import the speech transcription function and Mistral response generator.
-from summarizer import classify_input
-from mistral_inference import generate_mistral_response
+from summarizer import classify_input, stream_classify_input, warm_up as warm_up_summarizer, close as close_summarizer
+from mistral_inference import generate_mistral_response, warm_up as warm_up_mistral
+from session_store import create_session_store
+from auth import bearer_token, verify_token
+from document import Document
+from context_window import splice
+from concurrency import llm_executor, turn_slots, session_locks, BackendBusy, Utterance, UtteranceQueue, STAGE_SECONDS
+from router import turn_deadline
+from streaming_asr import StreamingTranscriber, create_recognizer, asr_executor, ASR_ENGINE
+from telemetry import registry, timed, configure_tracing, MetricsMiddleware, CONTENT_TYPE
+from logs import setup_logging, stop_logging
+from audio_stream import AudioDecoder, AudioFormatError, parse_frame, FLAG_END_OF_UTTERANCE
 
-app = FastAPI() # create a seperate WebSocket service
+setup_logging("websocket")
+logger = logging.getLogger("websocket")
+
+# chat history for every active session, keyed by session id
+session_store = create_session_store()
+
+WARM_UP = os.getenv("WARM_UP", "1") == "1"  # load LLM clients in the background at startup
+
+ACTIVE_CONNECTIONS = registry.gauge("websocket_connections", "Open dictation WebSocket connections")
+
+
+async def warm_up():
+    """Fetches credentials and builds the lazily loaded LLM clients so the first utterance does not pay for them."""
+    loop = asyncio.get_running_loop()
+    hooks = (("summarizer", warm_up_summarizer), ("mistral", lambda: loop.run_in_executor(llm_executor, warm_up_mistral)))
+    for name, hook in hooks:
+        try:
+            await hook()
+        except Exception as e:
+            logger.warning("Warm-up of %s failed: %s", name, e)  # retried lazily on first use
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_tracing("websocket")
+    await session_store.start()  # rebuilds sessions from the session log after a restart
+    # don't hold up startup; a request that arrives first waits on the same lazy loads
+    warming = asyncio.create_task(warm_up()) if WARM_UP else None
+    yield
+    if warming is not None:
+        warming.cancel()
+    await close_summarizer()
+    await session_store.close()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan) # create a seperate WebSocket service
 
 #Allowed addresses
 origins = [
@@ -25,10 +76,147 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+BUSY_RETRY_SECONDS = 1.0  # pause before retrying an utterance that hit a busy backend
+DEFAULT_SESSION_ID = "default"  # session updated by /chat_history requests without a session_id
+
+
+async def stream_chunks(websocket: WebSocket, chunks, window: list | None = None) -> str:
+    """
+    Forward each chunk of an async chunk generator to the client as a "delta" message
+    while generation is still running. Once window holds the turn's context (diff mode),
+    deltas carry the offset and length of the text the streamed window replaces.
+    Returns the concatenated text; errors raised by the generator are re-raised here.
+    """
+    parts = []
+    async for chunk in chunks:
+        parts.append(chunk)
+        message = {"type":"delta", "data": chunk}
+        if window:
+            message["offset"], message["length"] = window[0].start, len(window[0].window.rstrip())
+        await websocket.send_json(message)
+    return "".join(parts)
+
+
+def apply_update(document: Document, new_text: str, message_type: str) -> dict:
+    """
+    Move the document to new_text and build the diff-mode message for the change.
+    An unchanged document still gets an empty ops message so the client knows the turn is done.
+    """
+    message = document.update(new_text) or {"base": document.version, "version": document.version, "ops": []}
+    message["type"] = message_type
+    return message
+
+async def handle_turn(websocket: WebSocket, session_id: str, utterance: Utterance, diff_mode: bool):
+    """
+    Apply one (possibly merged) utterance to the session's chat history and send the result.
+    Its model calls share one deadline (TURN_DEADLINE), after which the document is kept as is.
+    """
+    STAGE_SECONDS.observe(time.monotonic() - utterance.received, stage="queue", backend="")
+    with timed(STAGE_SECONDS, "turn", stage="turn", backend=""), turn_deadline():
+        await run_turn(websocket, session_id, utterance, diff_mode)
+
+
+async def run_turn(websocket: WebSocket, session_id: str, utterance: Utterance, diff_mode: bool):
+    # the session stays locked while the model runs, so updates made meanwhile wait instead of being overwritten
+    async with session_locks(session_id):
+        await apply_utterance(websocket, session_id, utterance, diff_mode)
+
 
-ERROR_LOG_FILE = "error.log"
+async def apply_utterance(websocket: WebSocket, session_id: str, utterance: Utterance, diff_mode: bool):
+    state = await session_store.get(session_id)
+    document = Document.from_state(state)
+    chat_history = document.text
+    if utterance.stream:
+        # in diff mode only the window is streamed; the ops in the commit cover the rest
+        window = [] if diff_mode else None
+        try:
+            streamed = await stream_chunks(
+                websocket, stream_classify_input(chat_history, utterance.content, utterance.tone, on_window=window.append if diff_mode else None), window
+            )
+        except Exception:
+            # tell the client to drop the partial output before reporting the error
+            await websocket.send_json(apply_update(document, chat_history, "commit") if diff_mode else {"type":"commit", "data": chat_history})
+            raise
+        if window:
+            updated_chat_history = splice(window[0], streamed.strip()) if streamed.strip() else chat_history
+        else:
+            updated_chat_history = streamed.strip() or chat_history
+        message = apply_update(document, updated_chat_history, "commit")
+        await session_store.set(session_id, {**state, **document.to_state()})
+        await websocket.send_json(message if diff_mode else {"type":"commit", "data": updated_chat_history})
+    else:
+        # Apply the recognized speech or command to the current chat history.
+        updated_chat_history = await classify_input(chat_history, utterance.content, utterance.tone)
+        # Update the session's chat history with the new result.
+        message = apply_update(document, updated_chat_history, "ops")
+        await session_store.set(session_id, {**state, **document.to_state()})
+
+        await websocket.send_json(message if diff_mode else {"type":"content", "data": updated_chat_history})
+
+
+async def process_utterances(websocket: WebSocket, session_id: str, pending: UtteranceQueue, diff_mode: bool, user_id: int | None = None):
+    """
+    Worker task of one connection: takes queued utterances (merged where possible) and
+    handles them one turn at a time, within the global limit on in-flight turns.
+    A DB session (user_id set) is claimed again before each turn, which reloads it if it
+    was evicted, and the connection is closed once it no longer belongs to the user.
+    """
+    while True:
+        utterance = await pending.get()
+        if user_id is not None and not await session_store.claim(session_id, user_id):
+            await websocket.send_json({"type":"error", "data": f"Session {session_id} is no longer available."})
+            await websocket.close(code=1008)
+            return
+        if turn_slots.locked():
+            await websocket.send_json({"type":"busy", "data": "Waiting for a free model slot."})
+
+        retry = False
+        async with turn_slots:
+            try:
+                await handle_turn(websocket, session_id, utterance, diff_mode)
+            except BackendBusy:
+                await websocket.send_json({"type":"busy", "data": "The model is busy, retrying shortly."})
+                pending.requeue(utterance)
+                retry = True
+            except Exception:
+                # the record (with traceback) is written to stdout and ERROR_LOG_FILE off the event loop
+                logger.exception("Error processing input", extra={"session_id": session_id, "input": utterance.content})
+                await websocket.send_json({"type":"content", "data": "An error occurred processing your message. It has been logged."})
+        if retry:
+            await asyncio.sleep(BUSY_RETRY_SECONDS)
+
+
+def open_transcriber() -> StreamingTranscriber:
+    return StreamingTranscriber(create_recognizer())
+
+
+def transcribe_frame(transcriber: StreamingTranscriber, decoder: AudioDecoder, data: bytes) -> list:
+    """Decode one binary audio frame into the connection's ring buffer and run recognition on it."""
+    frame = parse_frame(data)
+    with STAGE_SECONDS.time(stage="recognize", backend=ASR_ENGINE):
+        events = transcriber.feed(decoder.decode(frame))
+        if frame.flags & FLAG_END_OF_UTTERANCE:
+            events += transcriber.flush()
+    return events
+
+
+async def submit(websocket: WebSocket, pending: UtteranceQueue, utterances: list) -> bool:
+    """Queue the utterances for the worker. Returns False when the user ended the conversation."""
+    for utterance in utterances:
+        if not utterance.content:
+            continue
+        logger.debug("Recognized speech: %s", utterance.content)
+
+        if utterance.content.lower() in ["exit", "quit"]:
+            await websocket.send_json({"type":"content", "data":"Conversation ended."})
+            return False
+
+        if not pending.put(utterance):
+            await websocket.send_json({"type":"busy", "data": "Too much input is pending, please slow down."})
+    return True
 
-chat_history = ""
 
 # @app.websocket("/ws") for local use
 @app.websocket("/websockets/ws")
@@ -37,81 +225,150 @@ async def websocket_endpoint(websocket: WebSocket):
     WebSocket endpoint that continuously listens to microphone input,
     generates an AI response, and sends it to the client in real time.
 
+    Messages with "stream": true get the new chat history as a series of "delta" messages
+    while the model is generating, followed by a "commit" message with the final text.
+
+    Chat history is kept per session: clients pass ?session_id=... to resume a session,
+    otherwise the connection gets its own session, which is announced in a "session" message
+    and dropped on disconnect. A numeric session_id is a DB session: it is only used with an
+    access token of its owner (an "Authorization: Bearer" header or ?token=), otherwise the
+    client gets an "error" message and its own session instead.
+
+    Clients connecting with ?diff=1 get a "snapshot" message first and afterwards only the
+    edit operations for each turn ("ops" messages, or ops in the "commit" message when
+    streaming; see document.py). Their "delta" messages carry only the edited window, with
+    the "offset" and "length" of the text it replaces. Sending {"type": "resync"} returns a fresh snapshot.
+
+    Clients can also send speech as binary frames: a small header followed by PCM16 or
+    Opus audio (see audio_stream.py). It is recognized on the server: "partial" messages
+    carry words as they stabilize, a "final" message the text of each utterance, which is
+    then handled like a text message with the connection's ?tone= and ?stream= settings.
+    A frame flagged end-of-utterance, or {"type": "audio_end"}, closes an open utterance.
+
+    Input is queued per connection and handled by a worker task, one turn at a time;
+    speech that arrives while a turn is running is merged into the next turn. When the
+    backlog is full or the models are saturated the client gets a "busy" message.
+
     In case of an error, it saves the input text, generated response (if any),
     and error details to a local file.
     """
     await websocket.accept()
-    # Use an initial chat history (could be an empty string)
 
-    global chat_history
+    session_id = websocket.query_params.get("session_id")
+    user_id = None
+    if session_id is not None and session_id.isdigit():
+        user_id = verify_token(bearer_token(websocket.headers, websocket.query_params))
+        if user_id is None or not await session_store.claim(session_id, user_id):
+            logger.warning("Refused DB session %s to a caller that is not its owner", session_id)
+            await websocket.send_json({"type":"error", "data": f"Session {session_id} needs an access token of its owner, using a new session."})
+            session_id, user_id = None, None
+    ephemeral = session_id is None
+    if ephemeral:
+        session_id = uuid.uuid4().hex
+        await websocket.send_json({"type":"session", "data": session_id})
+
+    diff_mode = websocket.query_params.get("diff") in ("1", "true")
+    audio_tone = websocket.query_params.get("tone", "")
+    audio_stream = websocket.query_params.get("stream") in ("1", "true")
+    transcriber = None  # created on the first audio frame; False if recognition is unavailable
+    decoder = None
+    loop = asyncio.get_running_loop()
+    pending = UtteranceQueue()
+    worker = asyncio.create_task(process_utterances(websocket, session_id, pending, diff_mode, user_id))
+    ACTIVE_CONNECTIONS.inc()
 
     try:
+        if diff_mode:
+            document = Document.from_state(await session_store.get(session_id))
+            await websocket.send_json(document.snapshot())
+
         while True:
-            # Get speech input in a separate thread.
-            # user_input = await websocket.receive_text()
-            data = await websocket.receive_json()
-            user_input = data.get("content", "")
-            user_tone = data.get("tone", "")
-            # user_input = await asyncio.to_thread(recognize_speech)
-            if user_input:
-                print(f"Recognized speech: {user_input}")
-
-                if user_input.lower() in ["exit", "quit"]:
-                    await websocket.send_json({"type":"content", "data":"Conversation ended."})
-                    break
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
 
+            if message.get("bytes") is not None:
+                if transcriber is None:
+                    try:
+                        transcriber = await loop.run_in_executor(asr_executor, open_transcriber)
+                        decoder = AudioDecoder(transcriber.sample_rate)
+                    except Exception as asr_error:
+                        logger.warning("Speech recognition unavailable: %s", asr_error)
+                        await websocket.send_json({"type":"error", "data": "Speech recognition is unavailable, send text instead."})
+                        transcriber = False
+                if not transcriber:
+                    continue
                 try:
-                    # Generate the Mistral response based on current chat history and recognized speech.
-                    updated_chat_history = await asyncio.to_thread(
-                        classify_input, chat_history, user_input, user_tone
-                    )
-                    # Update the active chat history with the new result.
-                    chat_history = updated_chat_history
-
-                    await websocket.send_json({"type":"content", "data": updated_chat_history})
-                except Exception as gen_error:
-
-                    # store error details locally, store response as well if it exists.
-                    error_details = (
-                        f"Error processing input:\n"
-                        f"Input: {user_input}\n"
-                        f"Response: None"
-                        f"Error: {str(gen_error)}\n"
-                        f"Traceback: {traceback.format_exc()}\n"
-                        "-----------------------------\n"
-                    )
-                    with open(ERROR_LOG_FILE, "a") as f:
-                        f.write(error_details)
-                    await websocket.send_json({"type":"content", "data": "An error occurred processing your message. It has been logged."})
+                    events = await loop.run_in_executor(asr_executor, transcribe_frame, transcriber, decoder, message["bytes"])
+                except AudioFormatError as format_error:
+                    await websocket.send_json({"type":"error", "data": f"Bad audio frame: {format_error}"})
+                    continue
             else:
-                # No input detected; wait a moment before trying again.
-                await asyncio.sleep(0.2)
+                data = json.loads(message["text"])
+                if data.get("type") == "resync":
+                    if user_id is not None:
+                        await session_store.claim(session_id, user_id)  # reloads the session if it was evicted
+                    document = Document.from_state(await session_store.get(session_id))
+                    await websocket.send_json(document.snapshot())
+                    continue
+                if data.get("type") == "audio_end":
+                    events = await loop.run_in_executor(asr_executor, transcriber.flush) if transcriber else []
+                else:
+                    events = []
+                    # user_input = await asyncio.to_thread(recognize_speech)
+                    if not await submit(websocket, pending, [Utterance(data.get("content", ""), data.get("tone", ""), bool(data.get("stream")))]):
+                        break
+
+            for event in events:
+                await websocket.send_json(event)
+            if not await submit(websocket, pending, [Utterance(event["data"], audio_tone, audio_stream) for event in events if event["type"] == "final"]):
+                break
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
-    except Exception as global_error:
+        logger.info("WebSocket disconnected", extra={"session_id": session_id})
+    except Exception:
         # Global error handling for the WebSocket endpoint.
-        error_details = (
-            f"Global WebSocket Error:\n"
-            f"Error: {str(global_error)}\n"
-            f"Traceback: {traceback.format_exc()}\n"
-            "-----------------------------\n"
-        )
-        with open(ERROR_LOG_FILE, "a") as f:
-            f.write(error_details)
+        logger.exception("Global WebSocket error", extra={"session_id": session_id})
+    finally:
+        worker.cancel()
+        pending.clear()
+        ACTIVE_CONNECTIONS.dec()
+        if ephemeral:
+            await session_store.delete(session_id)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 
 @app.router.post("/chat_history")
 async def update_chat_history(request: Request):
     """
-    Update the global chat history with new content.
+    Update the chat history of one session with new content.
     This function can be called from other parts of the application.
+    A DB session (numeric session_id) needs an access token of its owner.
     """
     raw_data = await request.json()
-    print(f"Raw data received: {raw_data}")
-    print(f"Updating chat history with: {raw_data.get('history', '')}")
-    global chat_history
-    chat_history = raw_data.get("history", chat_history)
-    print(f"Chat history updated: {chat_history}")
+    logger.debug("Raw data received: %s", raw_data)
+    session_id = raw_data.get("session_id")
+    if session_id is None:
+        logger.warning("POST /chat_history without a session_id is deprecated; updating the %r session", DEFAULT_SESSION_ID)
+        session_id = DEFAULT_SESSION_ID
+    session_id = str(session_id)
+    user_id = None
+    if session_id.isdigit():
+        user_id = verify_token(bearer_token(request.headers, request.query_params))
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+    async with session_locks(session_id):  # waits for a turn of the session that is running
+        if user_id is not None and not await session_store.claim(session_id, user_id):
+            raise HTTPException(status_code=403, detail="Not the owner of this session")
+        state = await session_store.get(session_id)
+        document = Document.from_state(state)
+        chat_history = raw_data.get("history", document.text)
+        logger.debug("Updating chat history of session %s with: %s", session_id, chat_history)
+        document.update(chat_history)  # bumps the version so diff-mode clients resync
+        await session_store.set(session_id, {**state, **document.to_state()})
     return {"message": "Chat history updated successfully."}
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))  # 0 disables the cache
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))  # re-verify cached tokens at least this often
+
+
+def token_key(token: str) -> bytes:
+    """Tokens are kept only as hashes, so a memory dump does not leak usable credentials."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    """
+    Bounded LRU of tokens whose signature was already verified, mapped to what the check
+    produced (the user id). Entries are dropped when the token's exp passes, after `ttl`
+    seconds, or when the token is revoked. Revocations are remembered until the token
+    would have expired anyway.
+
+    State is per process; with several workers a revoked token stays valid on the others
+    until it leaves their caches (at most `ttl` seconds).
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, exp, cached_until)
+        self.revoked_keys = {}  # key -> exp
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        """The cached value, or None when the token must be verified (again)."""
+        key = token_key(token)
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, exp, cached_until = entry
+            if time.time() < min(exp, cached_until):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, value, exp: float | None):
+        if self.max_size <= 0:
+            return
+        now = time.time()
+        exp = float(exp) if exp is not None else now + self.ttl
+        if exp <= now:
+            return
+        key = token_key(token)
+        self.entries[key] = (value, exp, now + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def revoked(self, token: str) -> bool:
+        return token_key(token) in self.revoked_keys
+
+    def revoke(self, token: str, exp: float | None = None):
+        key = token_key(token)
+        entry = self.entries.pop(key, None)
+        if exp is None:
+            exp = entry[1] if entry is not None else time.time() + self.ttl
+        now = time.time()
+        self.revoked_keys = {k: e for k, e in self.revoked_keys.items() if e > now}
+        self.revoked_keys[key] = float(exp)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "revoked": len(self.revoked_keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+token_cache = TokenCache()
@@ -0,0 +1,205 @@
+"""
+Batched chat inserts and write-behind session updates for the gateway.
+
+create_chat hands its chat to `chat_writer` and waits only for the batch it lands in:
+chats submitted within CHAT_BATCH_MAX_DELAY_MS of each other (up to CHAT_BATCH_MAX_SIZE)
+go to the DB service as one POST /chats/bulk. The session-context PATCH that follows a
+chat is not awaited at all; it waits up to SESSION_UPDATE_DELAY_MS, so a dictation burst
+collapses into one merged PATCH per session. Everything still pending is written on
+graceful shutdown (`close()`). Session updates are therefore eventually consistent, and
+lost if the gateway crashes first; with CHAT_AWAIT_SESSION_UPDATE=1, create_chat waits
+for its merged PATCH and reports a failed one instead.
+
+POST /chats/bulk is only used with CHAT_BULK_INSERT=1, for DB services that have it (the
+benchmark stub does); otherwise, or once it answers 404/405, chats are inserted with
+concurrent single POSTs.
+"""
+
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+from db_client import db
+from read_cache import read_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "100"))  # chats per bulk insert; a full batch flushes at once
+CHAT_BATCH_MAX_DELAY_MS = float(os.getenv("CHAT_BATCH_MAX_DELAY_MS", "10"))  # max wait before a pending write is flushed
+SESSION_UPDATE_DELAY_MS = float(os.getenv("SESSION_UPDATE_DELAY_MS", "250"))  # max wait before a session update is sent
+SESSION_UPDATE_RETRIES = int(os.getenv("SESSION_UPDATE_RETRIES", "3"))  # failed flushes before a session update is dropped
+CHAT_BULK_INSERT = os.getenv("CHAT_BULK_INSERT", "0") == "1"  # the DB service has POST /chats/bulk
+CHAT_AWAIT_SESSION_UPDATE = os.getenv("CHAT_AWAIT_SESSION_UPDATE", "0") == "1"  # create_chat waits for its session PATCH
+
+
+class ChatWriter:
+    def __init__(self, client=db, max_batch: int = CHAT_BATCH_MAX_SIZE, max_delay_ms: float = CHAT_BATCH_MAX_DELAY_MS,
+                 session_delay_ms: float = SESSION_UPDATE_DELAY_MS, retries: int = SESSION_UPDATE_RETRIES, bulk: bool = CHAT_BULK_INSERT):
+        self.client = client
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000
+        self.session_delay = session_delay_ms / 1000
+        self.retries = retries
+        self.bulk_supported = bulk
+        self.chats = []  # (user_id, chat, future) in submission order
+        self.session_updates = {}  # (user_id, session_id) -> merged context fields
+        self.failures = {}  # (user_id, session_id) -> failed attempts so far
+        self.waiters = {}  # (user_id, session_id) -> futures resolved when the pending update is written (True) or dropped (False)
+        self.closing = False
+        # one flush of each kind at a time, so writes reach the DB service in order
+        self._chats_lock = asyncio.Lock()
+        self._sessions_lock = asyncio.Lock()
+        self._timers = {}  # flush method -> pending TimerHandle
+        self._tasks = set()
+        self.inserted = 0
+        self.batches = 0
+        self.updates = 0
+        self.patches = 0
+        self.dropped = 0
+
+    async def create_chat(self, user_id: int, chat: dict) -> dict | None:
+        """Queues a chat insert and returns the created chat once its batch is written, or None on a DB error."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())  # the request may be gone
+        self.chats.append((user_id, chat, future))
+        self._schedule(self.flush_chats, self.max_delay, len(self.chats) >= self.max_batch)
+        return await asyncio.shield(future)
+
+    def update_session(self, user_id: int, session_id: int, data: dict) -> asyncio.Future:
+        """
+        Queues a session PATCH; later fields win over earlier ones. The returned future
+        resolves to whether the update was written, for callers that choose to wait.
+        """
+        key = (user_id, session_id)
+        self.session_updates[key] = {**self.session_updates.get(key, {}), **data}
+        self.updates += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, []).append(future)
+        self._schedule(self.flush_sessions, self.session_delay)
+        return future
+
+    def _schedule(self, flush, delay: float, now: bool = False):
+        if self.closing:
+            return  # close() drains everything itself
+        timer = self._timers.get(flush)
+        if now:
+            if timer is not None:
+                timer.cancel()
+            self._start_flush(flush)
+        elif timer is None:
+            self._timers[flush] = asyncio.get_running_loop().call_later(delay, self._start_flush, flush)
+
+    def _start_flush(self, flush):
+        self._timers.pop(flush, None)
+        task = asyncio.ensure_future(flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush_chats(self):
+        """Inserts the chats pending once the previous flush finished."""
+        async with self._chats_lock:
+            chats, self.chats = self.chats, []
+            for start in range(0, len(chats), self.max_batch):
+                await self._insert(chats[start:start + self.max_batch])
+        if self.chats:
+            self._schedule(self.flush_chats, self.max_delay, len(self.chats) >= self.max_batch)
+
+    async def flush_sessions(self):
+        """Sends one PATCH per session with pending updates; failed ones are retried on the next flush."""
+        async with self._sessions_lock:
+            updates, self.session_updates = self.session_updates, {}
+            waiters, self.waiters = self.waiters, {}
+            if updates:
+                await self._update_sessions(updates, waiters)
+        if self.session_updates:
+            self._schedule(self.flush_sessions, self.session_delay)
+
+    async def flush(self):
+        await self.flush_chats()
+        await self.flush_sessions()
+
+    async def _insert(self, batch: list):
+        try:
+            created = None
+            if self.bulk_supported:
+                response = await self.client.post("/chats/bulk", json=[{"user_id": user_id, "chat": chat} for user_id, chat, _ in batch])
+                if response.status_code in (404, 405):
+                    self.bulk_supported = False
+                elif response.status_code == 200:
+                    created = response.json()
+                else:
+                    created = [None] * len(batch)
+            if created is None:
+                responses = await asyncio.gather(*(self.client.post(f"/chats?user_id={user_id}", json=chat) for user_id, chat, _ in batch))
+                created = [response.json() if response.status_code == 200 else None for response in responses]
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        for (_, _, future), chat in zip(batch, created):
+            self.inserted += chat is not None
+            if not future.done():
+                future.set_result(chat)
+        for user_id in {user_id for user_id, _, _ in batch}:
+            read_cache.invalidate(user_id, "/chats")
+
+    @staticmethod
+    def _resolve(futures: list, written: bool):
+        for future in futures:
+            if not future.done():
+                future.set_result(written)
+
+    async def _update_sessions(self, updates: dict, waiters: dict):
+        keys = list(updates)
+        results = await asyncio.gather(
+            *(self.client.patch(f"/sessions/{session_id}?user_id={user_id}", json=updates[(user_id, session_id)]) for user_id, session_id in keys),
+            return_exceptions=True,
+        )
+        for key, result in zip(keys, results):
+            user_id, session_id = key
+            self.patches += 1
+            read_cache.invalidate(user_id, "/sessions", f"/sessions/{session_id}")
+            if not isinstance(result, Exception) and result.status_code == 200:
+                self.failures.pop(key, None)
+                self._resolve(waiters.get(key, []), True)
+                continue
+            attempts = self.failures.get(key, 0) + 1
+            if attempts > self.retries:
+                self.failures.pop(key, None)
+                self.dropped += 1
+                self._resolve(waiters.get(key, []), False)
+                logger.error("Dropping context update of session %s after %d failed attempts: %s", session_id, attempts, result)
+                continue
+            self.failures[key] = attempts
+            self.session_updates[key] = {**updates[key], **self.session_updates.get(key, {})}  # newer fields still win
+            self.waiters[key] = waiters.get(key, []) + self.waiters.get(key, [])
+
+    async def close(self):
+        """Flushes all pending writes; call on shutdown before the DB client is closed."""
+        self.closing = True
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self.chats or self.session_updates:
+            await self.flush()
+        self.closing = False
+
+    def stats(self) -> dict:
+        return {
+            "pending_chats": len(self.chats),
+            "pending_session_updates": len(self.session_updates),
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "session_updates": self.updates,
+            "session_patches": self.patches,
+            "dropped": self.dropped,
+            "bulk_supported": self.bulk_supported,
+        }
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,119 @@
+"""
+Real-time factor and latency benchmark for the streaming speech recognizer.
+
+Replays 16-bit mono WAV fixtures through StreamingTranscriber in 20 ms frames, as a
+client streaming over the WebSocket would, as fast as the CPU allows. Reports per file:
+
+- rtf: processing time / audio duration (below 1 keeps up with live audio)
+- first_partial_ms: audio from the start of an utterance until its first partial result,
+  plus the processing time spent in that stretch (what a live speaker would wait)
+- final_ms: the same for the final result, measured from the end of speech (so it
+  includes the ENDPOINT_SILENCE_MS of silence the endpointer waits for)
+- the recognized text
+
+--engine vosk needs VOSK_MODEL_PATH pointing at an unpacked Vosk model. --engine vad runs
+the same pipeline with a recognizer that decodes nothing, to show the framing and VAD
+overhead on its own. Without --wav, every *.wav in benchmarks/data/audio is used.
+
+Usage:
+    python benchmarks/bench_asr.py --engine vosk --wav speech1.wav speech2.wav
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import wave
+import bisect
+import argparse
+import statistics
+
+from common import APP_DIR, BENCH_DIR
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from streaming_asr import StreamingTranscriber, SpeechRecognizer, create_recognizer, ENDPOINT_SILENCE_MS
+
+FRAME_MS = 20
+FIXTURE_DIR = os.path.join(BENCH_DIR, "data", "audio")
+
+
+class NullRecognizer(SpeechRecognizer):
+    def accept(self, pcm: bytes) -> str:
+        return ""
+
+    def finish(self) -> str:
+        return ""
+
+
+def read_wav(path: str) -> tuple:
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16-bit mono PCM")
+        return wav.readframes(wav.getnframes()), wav.getframerate()
+
+
+def bench_file(path: str, engine: str) -> dict:
+    pcm, sample_rate = read_wav(path)
+    recognizer = NullRecognizer() if engine == "vad" else create_recognizer(sample_rate, engine)
+    transcriber = StreamingTranscriber(recognizer, sample_rate)
+    frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+
+    processing = 0.0
+    timeline = [(0, 0.0)]  # (audio ms fed so far, processing seconds so far)
+    events = []  # (event, processing seconds when it was produced)
+    for offset in range(0, len(pcm), frame_bytes):
+        start = time.perf_counter()
+        produced = transcriber.feed(pcm[offset:offset + frame_bytes])
+        processing += time.perf_counter() - start
+        timeline.append(((offset + frame_bytes) * 1000 // 2 // sample_rate, processing))
+        events.extend((event, processing) for event in produced)
+    start = time.perf_counter()
+    produced = transcriber.flush()
+    processing += time.perf_counter() - start
+    events.extend((event, processing) for event in produced)
+
+    def processing_at(audio_ms: int) -> float:
+        """Processing seconds spent before the stream reached audio_ms."""
+        index = bisect.bisect_right(timeline, (audio_ms, float("inf"))) - 1
+        return timeline[max(0, index)][1]
+
+    def latency_ms(since_ms: int, event: dict, spent: float) -> float:
+        """Audio between since_ms and the event plus the processing it took, as a live speaker would wait."""
+        return event["audio_ms"] - since_ms + (spent - processing_at(since_ms)) * 1000
+
+    first_partials, finals, started = [], [], set()
+    for event, spent in events:
+        if event["type"] == "partial" and event["start_ms"] not in started:
+            started.add(event["start_ms"])
+            first_partials.append(latency_ms(event["start_ms"], event, spent))
+        elif event["type"] == "final":
+            finals.append(latency_ms(max(event["start_ms"], event["audio_ms"] - ENDPOINT_SILENCE_MS), event, spent))
+
+    audio_seconds = len(pcm) / 2 / sample_rate
+    return {
+        "audio_s": round(audio_seconds, 2),
+        "rtf": round(processing / audio_seconds, 4) if audio_seconds else 0.0,
+        "utterances": len(finals),
+        "first_partial_ms": round(statistics.mean(first_partials), 1) if first_partials else None,
+        "final_ms": round(statistics.mean(finals), 1) if finals else None,
+        "text": " | ".join(event["data"] for event, _ in events if event["type"] == "final"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["vosk", "vad"], default="vosk")
+    parser.add_argument("--wav", nargs="+", default=None)
+    args = parser.parse_args()
+
+    paths = args.wav or sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.wav")))
+    if not paths:
+        sys.exit(f"no WAV fixtures: pass --wav or add 16-bit mono recordings to {FIXTURE_DIR}")
+    results = {os.path.basename(path): bench_file(path, args.engine) for path in paths}
+    json.dump({"engine": args.engine, "files": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Memory and throughput benchmark for binary audio ingestion with many concurrent speakers.
+
+Simulates --clients connections, each sending --seconds of audio as 20 ms binary frames
+(audio_stream header + PCM16 at --rate Hz), interleaved round-robin as they would arrive
+on the server. Every frame goes through header parsing, resampling to 16 kHz, VAD framing,
+pre-roll and chunking up to the recognizer boundary (recognition itself is stubbed out).
+
+Two pipelines are compared:
+- naive: frames sliced into bytes, converted per frame, buffered in bytearrays/deques
+- ring: AudioDecoder + StreamingTranscriber (views, scratch arrays, per-connection ring buffer)
+
+Reports frames/s, how many real-time speakers one core keeps up with, the transient bytes
+allocated per frame (tracemalloc peak while handling a frame) and the memory each
+connection holds between frames once audio is flowing.
+
+Usage:
+    python benchmarks/bench_audio_ingest.py --clients 200 --seconds 10 --rate 48000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from common import APP_DIR
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from audio_stream import AudioDecoder, parse_frame, encode_frame, HEADER
+from streaming_asr import StreamingTranscriber, SpeechRecognizer, EnergyVAD, SAMPLE_RATE, VAD_FRAME_MS, CHUNK_MS, PREROLL_MS
+
+FRAME_MS = 20
+
+
+class NullRecognizer(SpeechRecognizer):
+    def accept(self, pcm: bytes) -> str:
+        return ""
+
+    def finish(self) -> str:
+        return ""
+
+
+class NaiveIngest:
+    """Bytes are sliced, converted and concatenated at every step."""
+
+    def __init__(self):
+        self.frame_bytes = SAMPLE_RATE * VAD_FRAME_MS // 1000 * 2
+        self.chunk_bytes = SAMPLE_RATE * CHUNK_MS // 1000 * 2
+        self.pending = bytearray()
+        self.preroll = deque(maxlen=PREROLL_MS // VAD_FRAME_MS)
+        self.chunk = bytearray()
+        self.recognizer = NullRecognizer()
+        self.noise_floor = None
+
+    def feed(self, data: bytes):
+        header, payload = data[:HEADER.size], data[HEADER.size:]
+        rate = HEADER.unpack(header)[4]
+        samples = np.frombuffer(payload, dtype=np.int16).astype(np.float32)
+        count = len(samples) * SAMPLE_RATE // rate
+        resampled = np.interp(np.arange(count) * (rate / SAMPLE_RATE), np.arange(len(samples)), samples)
+        self.pending += resampled.astype(np.int16).tobytes()
+        while len(self.pending) >= self.frame_bytes:
+            frame = bytes(self.pending[:self.frame_bytes])
+            del self.pending[:self.frame_bytes]
+            values = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+            rms = float(np.sqrt(np.mean(values * values)))
+            self.noise_floor = rms if self.noise_floor is None else self.noise_floor
+            self.preroll.append(frame)
+            self.chunk += frame
+            if len(self.chunk) >= self.chunk_bytes:
+                self.recognizer.accept(bytes(self.chunk))
+                self.chunk.clear()
+
+
+class RingIngest:
+    def __init__(self):
+        self.decoder = AudioDecoder(SAMPLE_RATE)
+        self.transcriber = StreamingTranscriber(NullRecognizer(), SAMPLE_RATE, vad=EnergyVAD())
+
+    def feed(self, data: bytes):
+        self.transcriber.feed(self.decoder.decode(parse_frame(data)))
+
+
+PIPELINES = {"naive": NaiveIngest, "ring": RingIngest}
+
+
+def speech_like(rate: int, seconds: float) -> np.ndarray:
+    """Voiced bursts separated by quiet noise, so the VAD opens and closes utterances."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    voiced = (np.sin(2 * np.pi * 1.5 * t) > 0).astype(np.float32)
+    signal = voiced * (np.sin(2 * np.pi * 180 * t) * 4000 + np.sin(2 * np.pi * 360 * t) * 1500)
+    return (signal + rng.normal(0, 60, len(t))).astype(np.int16)
+
+
+def frames_for(audio: np.ndarray, rate: int, clients: int) -> list:
+    """Per client, its frames with headers; clients start at different offsets in the audio."""
+    samples = rate * FRAME_MS // 1000
+    per_client = []
+    for client in range(clients):
+        shifted = np.roll(audio, client * samples * 7)
+        per_client.append([encode_frame(shifted[i:i + samples].tobytes(), rate, n) for n, i in enumerate(range(0, len(shifted) - samples + 1, samples))])
+    return per_client
+
+
+def run(name: str, per_client: list, seconds: float) -> dict:
+    connections = [PIPELINES[name]() for _ in per_client]
+    order = [(connection, frame) for frames in zip(*per_client) for connection, frame in zip(connections, frames)]
+
+    start = time.perf_counter()
+    for connection, frame in order:
+        connection.feed(frame)
+    elapsed = time.perf_counter() - start
+
+    # memory: a fresh set of connections, traced while handling a sample of frames
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    traced = [PIPELINES[name]() for _ in per_client]
+    transient = []
+    for index, frames in enumerate(per_client):
+        for frame in frames[:100]:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            traced[index].feed(frame)
+            transient.append(tracemalloc.get_traced_memory()[1] - current)
+    held = tracemalloc.get_traced_memory()[0] - baseline  # buffers each connection keeps between frames
+    tracemalloc.stop()
+
+    return {
+        "frames_per_s": round(len(order) / elapsed),
+        "realtime_speakers_per_core": round(len(per_client) * seconds / elapsed),
+        "transient_bytes_per_frame": round(sum(transient) / len(transient)),
+        "held_bytes_per_connection": round(held / len(per_client)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--rate", type=int, default=48000, help="client sample rate")
+    parser.add_argument("--pipelines", nargs="+", choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    args = parser.parse_args()
+
+    per_client = frames_for(speech_like(args.rate, args.seconds), args.rate, args.clients)
+    results = {name: run(name, per_client, args.seconds) for name in args.pipelines}
+    json.dump({"clients": args.clients, "seconds": args.seconds, "rate": args.rate, "pipelines": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
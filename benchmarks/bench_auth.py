@@ -0,0 +1,56 @@
+"""
+Auth overhead per request for the gateway's get_current_user dependency.
+
+Calls the dependency the way every /sessions and /chats request does, for --tokens
+distinct clients each making --requests requests, once with the verified-token cache
+disabled (full jwt.decode with signature check every time) and once with it enabled.
+
+Usage:
+    python benchmarks/bench_auth.py --tokens 100 --requests 200
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import timedelta
+
+from common import APP_DIR
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+sys.path.insert(0, APP_DIR)
+from routers import user
+from token_cache import TokenCache
+
+
+async def measure(tokens: list, requests: int) -> float:
+    """Mean microseconds per get_current_user call."""
+    order = [token for _ in range(requests) for token in tokens]
+    start = time.perf_counter()
+    for token in order:
+        await user.get_current_user(token)
+    return (time.perf_counter() - start) / len(order) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="requests per token")
+    args = parser.parse_args()
+
+    tokens = [user.create_access_token({"sub": str(i)}, timedelta(minutes=60)) for i in range(args.tokens)]
+    results = {}
+    for name, size in (("no_cache", 0), ("cache", args.tokens * 2)):
+        user.token_cache = TokenCache(max_size=size)
+        results[name] = {"us_per_request": round(asyncio.run(measure(tokens, args.requests)), 2), **user.token_cache.stats()}
+    results["speedup"] = round(results["no_cache"]["us_per_request"] / results["cache"]["us_per_request"], 1)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
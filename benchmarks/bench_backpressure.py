@@ -0,0 +1,134 @@
+"""
+Load test for the WebSocket LLM worker path with a fake slow backend.
+
+Simulates many dictation clients that each send an utterance every --interval seconds to a
+fake LLM taking --llm-ms per call, and compares:
+- baseline: the old per-connection loop, one `asyncio.to_thread` call per utterance on the
+  default executor, no limits.
+- limited: UtteranceQueue coalescing, BackendLimiter (--backend-concurrency slots) and the
+  dedicated llm_executor, as used by websocket.py.
+
+Reports LLM calls made, utterance-to-result latency percentiles, busy messages and the
+worst per-client backlog.
+
+Usage:
+    python benchmarks/bench_backpressure.py --clients 100 --interval 0.5 --llm-ms 800
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from common import APP_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from concurrency import BackendLimiter, BackendBusy, Utterance, UtteranceQueue, llm_executor
+
+SENTENCES = ["We met with the design team today.", "The budget review is next week.", "Sales were up in March."]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.calls = 0
+        self.busy = 0
+        self.max_backlog = 0
+
+
+async def baseline_client(client: int, args, results: Results):
+    backlog = asyncio.Queue()
+
+    async def talk():
+        for i in range(args.utterances):
+            backlog.put_nowait(time.monotonic())
+            results.max_backlog = max(results.max_backlog, backlog.qsize())
+            await asyncio.sleep(args.interval)
+
+    async def process():
+        for _ in range(args.utterances):
+            sent = await backlog.get()
+            await asyncio.to_thread(time.sleep, args.llm_ms / 1000)
+            results.calls += 1
+            results.latencies.append(time.monotonic() - sent)
+
+    await asyncio.gather(talk(), process())
+
+
+async def limited_client(client: int, args, results: Results, limiter: BackendLimiter):
+    loop = asyncio.get_running_loop()
+    pending = UtteranceQueue()
+    handled = dropped = 0
+
+    def fake_llm():
+        with limiter.slot("fake"):
+            time.sleep(args.llm_ms / 1000)
+
+    async def talk():
+        nonlocal dropped
+        for i in range(args.utterances):
+            if not pending.put(Utterance(SENTENCES[i % len(SENTENCES)], "friendly")):
+                results.busy += 1
+                dropped += 1
+            results.max_backlog = max(results.max_backlog, len(pending))
+            await asyncio.sleep(args.interval)
+
+    async def process():
+        nonlocal handled
+        while handled + dropped < args.utterances:
+            utterance = await pending.get()
+            try:
+                await loop.run_in_executor(llm_executor, fake_llm)
+            except BackendBusy:
+                results.busy += 1
+                pending.requeue(utterance)
+                await asyncio.sleep(0.2)
+                continue
+            results.calls += 1
+            merged = utterance.content.count(".")  # every test sentence has exactly one period
+            handled += merged
+            # latency of a merged turn is measured from its oldest utterance
+            results.latencies.extend([time.monotonic() - utterance.received] * merged)
+
+    await asyncio.gather(talk(), process())
+
+
+async def run(args, mode: str) -> dict:
+    results = Results()
+    start = time.monotonic()
+    if mode == "baseline":
+        await asyncio.gather(*(baseline_client(c, args, results) for c in range(args.clients)))
+    else:
+        limiter = BackendLimiter({"fake": {"concurrency": args.backend_concurrency, "rate": args.backend_rate}}, timeout=args.queue_timeout)
+        await asyncio.gather(*(limited_client(c, args, results, limiter) for c in range(args.clients)))
+    return {
+        "utterances": args.clients * args.utterances,
+        "llm_calls": results.calls,
+        "busy_messages": results.busy,
+        "max_backlog": results.max_backlog,
+        "p50_s": round(percentile(results.latencies, 50), 2),
+        "p95_s": round(percentile(results.latencies, 95), 2),
+        "elapsed_s": round(time.monotonic() - start, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--utterances", type=int, default=10, help="utterances per client")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between utterances")
+    parser.add_argument("--llm-ms", type=float, default=800, help="fake backend latency per call")
+    parser.add_argument("--backend-concurrency", type=int, default=32)
+    parser.add_argument("--backend-rate", type=float, default=100.0)
+    parser.add_argument("--queue-timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    results = {mode: asyncio.run(run(args, mode)) for mode in ("baseline", "limited")}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Chat-write throughput against the stub DB service.
+
+--clients dictation clients each create --chats chats in their own session, back to back,
+the way create_chat is hit during live dictation. Two write paths are compared:
+- direct: what create_chat did before, a POST /chats and then an awaited session PATCH
+- write_behind: the gateway's ChatWriter (bulk inserts, merged and deferred PATCHes)
+
+Reports chats/s, create_chat latency, how many requests reached the DB service and how
+many chats it holds after the writer was closed (every chat must be stored).
+
+Usage:
+    python benchmarks/bench_chat_writes.py --clients 100 --chats 50 --latency-ms 5
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from common import APP_DIR, BENCH_DIR, start_process, summarize
+
+sys.path.insert(0, APP_DIR)
+from db_client import DBClient
+from write_behind import ChatWriter
+
+STUB_PORT = 9000
+STUB_URL = f"http://127.0.0.1:{STUB_PORT}"
+
+
+class CountingClient(DBClient):
+    def __init__(self, pool_size: int):
+        super().__init__(STUB_URL, pool_size, 30, 5, 60)
+        self.calls = 0
+
+    async def request(self, method: str, url: str, **kwargs):
+        self.calls += 1
+        return await super().request(method, url, **kwargs)
+
+
+async def direct_writes(client: CountingClient):
+    async def create(user_id: int, chat: dict):
+        response = await client.post(f"/chats?user_id={user_id}", json=chat)
+        await client.patch(f"/sessions/{chat['session_id']}?user_id={user_id}", json={"message": chat["message"]})
+        return response.json()
+
+    async def close():
+        pass
+
+    return create, close
+
+
+async def write_behind_writes(client: CountingClient, max_batch: int, max_delay_ms: float):
+    writer = ChatWriter(client, max_batch=max_batch, max_delay_ms=max_delay_ms, bulk=True)  # the stub has /chats/bulk
+
+    async def create(user_id: int, chat: dict):
+        created = await writer.create_chat(user_id, chat)
+        writer.update_session(user_id, chat["session_id"], {"message": chat["message"]})
+        return created
+
+    return create, writer.close
+
+
+async def run(mode: str, clients: int, chats: int, max_batch: int, max_delay_ms: float) -> dict:
+    client = CountingClient(pool_size=clients)
+    sessions = []
+    for user_id in range(1, clients + 1):
+        sessions.append((await client.post(f"/sessions?user_id={user_id}", json={"session_name": mode, "context": {}})).json()["session_id"])
+    before = len((await client.get("/chats")).json())
+    client.calls = 0
+
+    if mode == "direct":
+        create, close = await direct_writes(client)
+    else:
+        create, close = await write_behind_writes(client, max_batch, max_delay_ms)
+    latencies = []
+
+    async def dictate(user_id: int, session_id: int):
+        for n in range(chats):
+            start = time.perf_counter()
+            await create(user_id, {"session_id": session_id, "sender": str(user_id), "message": f"utterance {n}"})
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(dictate(user_id, session_id) for user_id, session_id in zip(range(1, clients + 1), sessions)))
+    await close()
+    elapsed = time.perf_counter() - start
+    db_requests = client.calls
+
+    stored = len((await client.get("/chats")).json()) - before
+    await client.aclose()
+    result = summarize(latencies, elapsed)
+    result["chats_per_s"] = result.pop("rps")
+    return {**result, "db_requests": db_requests, "stored": stored}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=50, help="chats per client")
+    parser.add_argument("--latency-ms", type=float, default=5, help="artificial stub DB latency")
+    parser.add_argument("--batch", type=int, default=100, help="CHAT_BATCH_MAX_SIZE")
+    parser.add_argument("--delay-ms", type=float, default=10, help="CHAT_BATCH_MAX_DELAY_MS")
+    args = parser.parse_args()
+
+    process = start_process(["stub_db_service.py"], BENCH_DIR, STUB_PORT, {"STUB_DB_LATENCY_MS": str(args.latency_ms)})
+    try:
+        results = {mode: asyncio.run(run(mode, args.clients, args.chats, args.batch, args.delay_ms)) for mode in ("direct", "write_behind")}
+    finally:
+        process.terminate()
+        process.wait()
+
+    json.dump({"clients": args.clients, "chats_per_client": args.chats, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Classification latency benchmark for the local command detector.
+
+Replays a recorded utterance corpus (JSON lines with "text" and "label") through
+`command_detector.CommandDetector` and reports the fast-path hit rate, the accuracy of
+fast-path decisions, and the classification latency per turn compared with always
+calling the remote classifier (simulated with --remote-ms, since it needs credentials).
+
+Usage:
+    python benchmarks/bench_classifier.py --corpus benchmarks/data/utterances.jsonl --remote-ms 450
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from common import APP_DIR, BENCH_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from command_detector import CommandDetector, load_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "data", "utterances.jsonl"))
+    parser.add_argument("--remote-ms", type=float, default=450, help="assumed latency of the remote classifier call")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--model", default=None, help="optional pickled classifier, see COMMAND_MODEL_PATH")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    detector = CommandDetector(model=load_model(args.model))
+    decided = correct = 0
+    turn_latencies = []
+    local_latencies = []
+    for item in corpus:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            detector.score(item["text"])
+        local = (time.perf_counter() - start) / args.repeat
+        local_latencies.append(local)
+
+        label = detector.classify(item["text"])
+        if label is None:
+            turn_latencies.append(local + args.remote_ms / 1000)
+        else:
+            turn_latencies.append(local)
+            decided += 1
+            correct += label == item["label"]
+
+    result = {
+        "utterances": len(corpus),
+        "fast_path_hit_rate": round(detector.hit_rate(), 3),
+        "fast_path_accuracy": round(correct / decided, 3) if decided else None,
+        "stats": detector.stats,
+        "local_p50_us": round(percentile(local_latencies, 50) * 1e6, 1),
+        "local_p99_us": round(percentile(local_latencies, 99) * 1e6, 1),
+        "remote_only_mean_ms": args.remote_ms,
+        "with_fast_path_mean_ms": round(sum(turn_latencies) / len(turn_latencies) * 1000, 1),
+        "with_fast_path_p50_ms": round(percentile(turn_latencies, 50) * 1000, 2),
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Prompt-size benchmark for bounded-context prompting.
+
+For documents of increasing size, compares the characters of document text that would be
+sent to the model per turn (whole file_content vs. window + summary) and the local cost
+of building the context, for dictation turns and for editing commands.
+
+Usage:
+    python benchmarks/bench_context.py --sizes 1000 10000 100000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+from common import APP_DIR
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from context_window import speech_context, command_context
+
+WORDS = "the project team met on monday to review budget timeline risks and next steps for launch".split()
+COMMANDS = ["delete the last sentence", "make that more formal", "replace monday with tuesday", "capitalize the title"]
+
+
+def random_document(length: int) -> str:
+    paragraphs = []
+    while sum(len(p) + 2 for p in paragraphs) < length:
+        sentences = [" ".join(random.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(random.randint(2, 6))]
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)[:length]
+
+
+def measure(build, turns: int) -> tuple:
+    sent = 0
+    start = time.perf_counter()
+    for turn in range(turns):
+        context = build(turn)
+        sent += len(context.window) + len(context.summary)
+    return sent // turns, (time.perf_counter() - start) / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = {}
+    for size in args.sizes:
+        document = random_document(size)
+        speech_chars, speech_seconds = measure(lambda turn: speech_context(document), args.turns)
+        command_chars, command_seconds = measure(lambda turn: command_context(document, COMMANDS[turn % len(COMMANDS)]), args.turns)
+        results[str(size)] = {
+            "full_chars_per_turn": len(document),
+            "speech_chars_per_turn": speech_chars,
+            "command_chars_per_turn": command_chars,
+            "speech_context_us": round(speech_seconds * 1e6, 1),
+            "command_context_us": round(command_seconds * 1e6, 1),
+        }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Per-turn latency benchmark for multi-turn DialoGPT-style conversations on CPU, fully offline.
+
+Runs a randomly initialised GPT-2 (ByteTokenizer vocabulary) through --turns user turns
+twice: once the way generate_response used to work (concatenate the whole history and call
+model.generate on it every turn) and once through ConversationEngine (KV cache kept across
+turns, sliding window over history). Reports latency at a few points in the conversation;
+the engine's should stay flat while the baseline's grows with the history.
+
+Usage:
+    python benchmarks/bench_conversation.py --turns 50 --window 512
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+import torch
+
+from common import APP_DIR
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from local_inference import ByteTokenizer, tiny_model
+from conversation import ConversationEngine
+
+WORDS = "could you remind me what we decided about the budget review and the launch timeline next week".split()
+
+
+def user_turns(count: int) -> list:
+    return [" ".join(random.choice(WORDS) for _ in range(random.randint(6, 14))) for _ in range(count)]
+
+
+@torch.inference_mode()
+def baseline(model, tokenizer, turns: list, max_new_tokens: int) -> list:
+    """The old generate_response loop: whole history re-encoded by model.generate each turn."""
+    eos = tokenizer.eos_token_id
+    max_positions = model.config.n_positions
+    history = torch.zeros(1, 0, dtype=torch.long)
+    latencies = []
+    for text in turns:
+        start = time.perf_counter()
+        new_ids = torch.tensor([tokenizer.encode(text) + [eos]])
+        # only cut when the model's position limit forces it (the old code just stopped answering)
+        bot_input_ids = torch.cat([history, new_ids], dim=-1)[:, -(max_positions - max_new_tokens):]
+        history = model.generate(
+            bot_input_ids,
+            attention_mask=torch.ones_like(bot_input_ids),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=eos,
+            eos_token_id=eos,
+        )
+        tokenizer.decode(history[0, bot_input_ids.shape[-1]:].tolist(), skip_special_tokens=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def engine(model, tokenizer, turns: list, max_new_tokens: int, window: int, threads: int) -> tuple:
+    conversation = ConversationEngine(model, tokenizer, max_history_tokens=window, max_new_tokens=max_new_tokens, num_threads=threads)
+    latencies = []
+    for text in turns:
+        start = time.perf_counter()
+        conversation.respond(text)
+        latencies.append(time.perf_counter() - start)
+    return latencies, conversation
+
+
+def report(latencies: list) -> dict:
+    checkpoints = sorted({1, 10, len(latencies) // 2, len(latencies)})
+    result = {f"turn_{n}_ms": round(latencies[n - 1] * 1000, 1) for n in checkpoints if n >= 1}
+    result["mean_ms"] = round(statistics.mean(latencies) * 1000, 1)
+    result["last10_mean_ms"] = round(statistics.mean(latencies[-10:]) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=32, help="max new tokens per reply")
+    parser.add_argument("--window", type=int, default=512, help="engine history window in tokens")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = tiny_model(n_layer=args.layers, n_embd=args.hidden)
+    tokenizer = ByteTokenizer()
+    turns = user_turns(args.turns)
+
+    engine_latencies, conversation = engine(model, tokenizer, turns, args.tokens, args.window, args.threads)
+    results = {
+        "baseline": report(baseline(model, tokenizer, turns, args.tokens)),
+        "engine": {**report(engine_latencies), "prefills": conversation.prefills, "history_tokens": conversation.history_length},
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
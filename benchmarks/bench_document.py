@@ -0,0 +1,80 @@
+"""
+Wire-size benchmark for WebSocket document updates.
+
+For documents of several sizes, replays a mix of dictation turns (appending a sentence)
+and editing turns (replacing a word somewhere in the text) and compares the bytes sent
+per turn as full "content" messages against diff-mode "ops" messages.
+
+Usage:
+    python benchmarks/bench_document.py --sizes 1000 10000 100000 --turns 50
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+from common import APP_DIR
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from document import Document
+
+WORDS = "the project team met on monday to review budget timeline risks and next steps for launch".split()
+
+
+def random_text(length: int) -> str:
+    sentences = []
+    while sum(len(s) + 1 for s in sentences) < length:
+        sentences.append(" ".join(random.choice(WORDS) for _ in range(12)).capitalize() + ".")
+        if random.random() < 0.2:
+            sentences[-1] += "\n\n"
+    return " ".join(sentences)[:length]
+
+
+def next_turn(text: str, turn: int) -> str:
+    if turn % 2 == 0:  # dictation appends a sentence
+        return text + " " + " ".join(random.choice(WORDS) for _ in range(10)).capitalize() + "."
+    position = random.randrange(len(text))  # a command edits one word
+    start = text.rfind(" ", 0, position) + 1
+    end = text.find(" ", position)
+    end = len(text) if end == -1 else end
+    return text[:start] + random.choice(WORDS).upper() + text[end:]
+
+
+def bench_size(size: int, turns: int) -> dict:
+    text = random_text(size)
+    document = Document(text)
+    full_bytes = diff_bytes = 0
+    diff_seconds = 0.0
+    for turn in range(turns):
+        text = next_turn(text, turn)
+        full_bytes += len(json.dumps({"type": "content", "data": text}).encode())
+        start = time.perf_counter()
+        message = document.update(text)
+        diff_seconds += time.perf_counter() - start
+        diff_bytes += len(json.dumps(message).encode())
+    return {
+        "full_bytes_per_turn": full_bytes // turns,
+        "diff_bytes_per_turn": diff_bytes // turns,
+        "reduction": round(full_bytes / diff_bytes, 1),
+        "diff_us_per_turn": round(diff_seconds / turns * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = {str(size): bench_size(size, args.turns) for size in args.sizes}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
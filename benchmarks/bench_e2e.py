@@ -0,0 +1,242 @@
+"""
+End-to-end load test of the gateway and the WebSocket service against local stand-ins.
+
+Starts the stub DB service, two stub LLM APIs (Gemini and Vertex, see stub_llm_service.py,
+answering after --llm-ms and generating at --tokens-per-s), the gateway (app/main.py) and
+the WebSocket service (app/services/websocket.py) wired to them, then runs:
+- gateway: --requests calls from --concurrency clients through the gateway, as
+  `bench_gateway.py gateway` does (with a chat write every --write-every requests)
+- websocket: --sessions simulated dictation clients, each sending --turns utterances from
+  the corpus, waiting for the result and pausing --think-ms; a share --stream-share of the
+  turns asks for streamed output
+
+Reports throughput, latency percentiles, busy/error/timeout counts, model calls made and the
+resident memory of every service. The JSON goes to stdout and to --output. With --baseline
+(an earlier --output), latencies or memory more than --tolerance above it, or throughput
+more than --tolerance below it, are listed under "regressions" and the exit status is 1.
+Extra settings for the WebSocket service go in --ws-env KEY=VALUE.
+
+Usage:
+    python benchmarks/bench_e2e.py --sessions 50 --turns 10 --output e2e.json
+    python benchmarks/bench_e2e.py --sessions 50 --turns 10 --baseline e2e.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import aiohttp
+
+from common import APP_DIR, BENCH_DIR, percentile, start_process
+from bench_gateway import BENCH_ENV, GATEWAY_PORT, STUB_PORT, STUB_URL, bench_gateway
+
+GEMINI_PORT = 9100
+VERTEX_PORT = 9101
+WEBSOCKET_PORT = 8002
+WEBSOCKET_URL = f"http://127.0.0.1:{WEBSOCKET_PORT}"
+WEBSOCKET_ENV = {
+    "DB_SERVICE_URL": STUB_URL,
+    "GEMINI_API_URL": f"http://127.0.0.1:{GEMINI_PORT}/v1beta",
+    "GEMINI_KEY": "bench",
+    "VERTEX_ENDPOINT_URL": f"http://127.0.0.1:{VERTEX_PORT}/v1/endpoints/bench",
+    "GOOGLE_ACCESS_TOKEN": "bench",
+    "LLM_CACHE_BACKENDS": "",  # every turn reaches the stubs
+    "LOG_LEVEL": "WARNING",
+}
+
+# result keys compared against the baseline, and whether higher is better
+HIGHER_IS_BETTER = ("rps", "turns_per_s")
+LOWER_IS_BETTER = ("_ms", "rss_mb")
+
+
+def memory(pid: int) -> dict:
+    """Resident and peak resident memory of a process in MB (Linux only, empty elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return {}
+    return {"rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1), "peak_rss_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1)}
+
+
+class DictationResults:
+    def __init__(self):
+        self.turns = []
+        self.streamed = []
+        self.first_deltas = []
+        self.busy = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def summary(self, elapsed: float) -> dict:
+        completed = len(self.turns) + len(self.streamed)
+        return {
+            "turns": completed,
+            "turns_per_s": round(completed / elapsed, 2) if elapsed else 0.0,
+            "turn_p50_ms": round(percentile(self.turns, 50) * 1000, 1),
+            "turn_p95_ms": round(percentile(self.turns, 95) * 1000, 1),
+            "turn_p99_ms": round(percentile(self.turns, 99) * 1000, 1),
+            "stream_first_delta_p50_ms": round(percentile(self.first_deltas, 50) * 1000, 1),
+            "stream_first_delta_p95_ms": round(percentile(self.first_deltas, 95) * 1000, 1),
+            "stream_commit_p95_ms": round(percentile(self.streamed, 95) * 1000, 1),
+            "busy_messages": self.busy,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+        }
+
+
+async def dictation_client(client: aiohttp.ClientSession, corpus: list, rng: random.Random, args, results: DictationResults):
+    async with client.ws_connect("/websockets/ws") as ws:
+        await ws.receive_json()  # the "session" message
+        for _ in range(args.turns):
+            stream = rng.random() < args.stream_share
+            start = time.perf_counter()
+            first_delta = None
+            await ws.send_json({"content": rng.choice(corpus)["text"], "stream": stream})
+            try:
+                while True:
+                    message = await ws.receive_json(timeout=args.turn_timeout)
+                    if message["type"] == "delta" and first_delta is None:
+                        first_delta = time.perf_counter() - start
+                    elif message["type"] == "busy":
+                        results.busy += 1
+                    elif message["type"] in ("content", "commit"):
+                        break
+            except asyncio.TimeoutError:
+                results.timeouts += 1
+                return
+            elapsed = time.perf_counter() - start
+            if str(message.get("data", "")).startswith("An error occurred"):
+                results.errors += 1
+            elif stream:
+                results.streamed.append(elapsed)
+                if first_delta is not None:
+                    results.first_deltas.append(first_delta)
+            else:
+                results.turns.append(elapsed)
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms) if args.think_ms else 0)
+
+
+async def bench_websocket(corpus: list, args) -> dict:
+    results = DictationResults()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(WEBSOCKET_URL, connector=connector) as client:
+        async def start_client(i: int):
+            await asyncio.sleep(args.ramp * i / max(1, args.sessions))
+            await dictation_client(client, corpus, random.Random(i), args, results)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(start_client(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+    return results.summary(elapsed)
+
+
+async def llm_calls() -> dict:
+    calls = {}
+    async with aiohttp.ClientSession() as client:
+        for name, port in (("gemini", GEMINI_PORT), ("vertex", VERTEX_PORT)):
+            async with client.get(f"http://127.0.0.1:{port}/calls") as response:
+                calls[name] = await response.json()
+    return calls
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than the baseline by more than tolerance (a fraction)."""
+    found = []
+    current = flatten(results)
+    for key, before in flatten(baseline).items():
+        after = current.get(key)
+        if after is None or not before:
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            worse = after < before * (1 - tolerance)
+        elif key.endswith(LOWER_IS_BETTER):
+            worse = after > before * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            found.append({"metric": key, "baseline": before, "current": after, "change": f"{(after - before) / before:+.0%}"})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phases", nargs="+", choices=["gateway", "websocket"], default=["gateway", "websocket"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--write-every", type=int, default=20)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a result and the next utterance")
+    parser.add_argument("--ramp", type=float, default=2, help="seconds over which the dictation clients connect")
+    parser.add_argument("--stream-share", type=float, default=0.5)
+    parser.add_argument("--turn-timeout", type=float, default=60)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stub LLM latency (to the first token with --tokens-per-s)")
+    parser.add_argument("--tokens-per-s", type=float, default=200)
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "data", "utterances.jsonl"))
+    parser.add_argument("--ws-env", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    llm_env = {"STUB_LLM_LATENCY_MS": str(args.llm_ms), "STUB_LLM_TOKENS_PER_S": str(args.tokens_per_s)}
+    ws_env = {**WEBSOCKET_ENV, **dict(item.split("=", 1) for item in args.ws_env)}
+
+    processes = {
+        "stub_db": start_process(["stub_db_service.py"], BENCH_DIR, STUB_PORT, {"STUB_DB_LATENCY_MS": str(args.db_latency_ms)}),
+        "stub_gemini": start_process(["stub_llm_service.py"], BENCH_DIR, GEMINI_PORT, {**llm_env, "STUB_LLM_PORT": str(GEMINI_PORT)}),
+        "stub_vertex": start_process(["stub_llm_service.py"], BENCH_DIR, VERTEX_PORT, {**llm_env, "STUB_LLM_PORT": str(VERTEX_PORT)}),
+    }
+    results = {}
+    try:
+        processes["gateway"] = start_process(["-m", "uvicorn", "main:app", "--port", str(GATEWAY_PORT), "--log-level", "warning"], APP_DIR, GATEWAY_PORT, BENCH_ENV)
+        processes["websocket"] = start_process(["-m", "uvicorn", "websocket:app", "--port", str(WEBSOCKET_PORT), "--log-level", "warning"], os.path.join(APP_DIR, "services"), WEBSOCKET_PORT, ws_env)
+        idle = {name: memory(processes[name].pid) for name in ("gateway", "websocket")}
+        if "gateway" in args.phases:
+            results["gateway"] = asyncio.run(bench_gateway(args.requests, args.concurrency, args.write_every))
+            results["gateway"].pop("read_cache", None)
+        if "websocket" in args.phases:
+            results["websocket"] = asyncio.run(bench_websocket(corpus, args))
+            results["websocket"]["llm_calls"] = asyncio.run(llm_calls())
+        results["memory"] = {name: {**memory(processes[name].pid), "idle_rss_mb": idle[name].get("rss_mb")} for name in ("gateway", "websocket")}
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.wait()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "corpus")},
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = regressions(results, json.load(f)["results"], args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Gateway throughput benchmark against the stub DB service.
+
+Two modes:
+- clients: compares the old per-call `requests` pattern (fresh connection, blocking a
+  40-thread pool like Starlette's default) with the gateway's shared pooled `DBClient`,
+  hitting the stub DB service directly.
+- gateway: starts the stub DB service and app/main.py and drives GET /sessions through
+  the gateway (with --write-every N, every Nth request posts a chat instead). Run it on
+  two commits with different --label values to compare.
+
+Usage:
+    python benchmarks/bench_gateway.py clients --requests 2000 --concurrency 100
+    python benchmarks/bench_gateway.py gateway --requests 2000 --concurrency 100 --label after
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+
+from common import APP_DIR, BENCH_DIR, start_process, summarize
+
+sys.path.insert(0, APP_DIR)
+
+STUB_PORT = 9000
+GATEWAY_PORT = 8001
+STUB_URL = f"http://127.0.0.1:{STUB_PORT}"
+GATEWAY_URL = f"http://127.0.0.1:{GATEWAY_PORT}"
+BENCH_ENV = {
+    "DB_SERVICE_URL": STUB_URL,
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "CHAT_BULK_INSERT": "1",  # the stub has /chats/bulk
+}
+
+
+async def drive(send, total: int, concurrency: int) -> dict:
+    """Issue `total` calls to `send` with at most `concurrency` in flight."""
+    latencies = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def bench_clients(total: int, concurrency: int) -> dict:
+    loop = asyncio.get_running_loop()
+    threadpool = ThreadPoolExecutor(max_workers=40)
+
+    async def send_requests():
+        await loop.run_in_executor(threadpool, lambda: requests.get(f"{STUB_URL}/sessions?user_id=1"))
+
+    from db_client import DBClient
+    client = DBClient(STUB_URL, concurrency, 30, 5, 60)
+
+    async def send_pooled():
+        await client.get("/sessions?user_id=1")
+
+    before = await drive(send_requests, total, concurrency)
+    after = await drive(send_pooled, total, concurrency)
+    await client.aclose()
+    threadpool.shutdown()
+    return {"requests_per_call": before, "pooled_async": after}
+
+
+async def bench_gateway(total: int, concurrency: int, write_every: int = 0) -> dict:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(GATEWAY_URL, connector=connector) as client:
+        credentials = {"username": "bench", "email": "bench@example.com", "password": "bench"}
+        async with client.post("/auth/signup", json=credentials) as response:
+            headers = {"Authorization": f"Bearer {(await response.json())['access_token']}"}
+        async with client.post("/sessions", json={"session_name": "bench"}, headers=headers) as response:
+            session_id = (await response.json())["session_id"]
+        sent = 0
+
+        async def send():
+            nonlocal sent
+            sent += 1
+            if write_every and sent % write_every == 0:  # a chat message invalidates the cached lists
+                chat = {"session_id": session_id, "sender": "bench", "message": f"message {sent}"}
+                async with client.post("/chats", json=chat, headers=headers) as response:
+                    await response.read()
+                return
+            async with client.get("/sessions", headers=headers) as response:
+                await response.read()
+
+        result = await drive(send, total, concurrency)
+        async with client.get("/cache/stats") as response:
+            if response.status == 200:
+                result["read_cache"] = (await response.json())["reads"]
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["clients", "gateway"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5, help="artificial stub DB latency")
+    parser.add_argument("--label", default="current")
+    parser.add_argument("--write-every", type=int, default=0, help="make every Nth request a chat write")
+    args = parser.parse_args()
+
+    processes = [start_process(["stub_db_service.py"], BENCH_DIR, STUB_PORT, {"STUB_DB_LATENCY_MS": str(args.latency_ms)})]
+    try:
+        if args.mode == "clients":
+            result = asyncio.run(bench_clients(args.requests, args.concurrency))
+        else:
+            processes.append(start_process(["-m", "uvicorn", "main:app", "--port", str(GATEWAY_PORT), "--log-level", "warning"], APP_DIR, GATEWAY_PORT, BENCH_ENV))
+            result = {args.label: asyncio.run(bench_gateway(args.requests, args.concurrency, args.write_every))}
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    json.dump({"mode": args.mode, "concurrency": args.concurrency, "results": result}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark for the WebSocket service and the gateway.
+
+Each run starts a fresh interpreter, so nothing is cached in sys.modules. For each
+process it reports the time to import the app module and the time until uvicorn
+accepts connections. Warm-up is disabled so the numbers show what importing costs,
+not how long model clients take to build.
+
+Usage:
+    python benchmarks/bench_import.py --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+from common import APP_DIR, start_process
+
+TARGETS = {
+    "websocket": {"cwd": os.path.join(APP_DIR, "services"), "module": "websocket", "port": 8100},
+    "gateway": {"cwd": APP_DIR, "module": "main", "port": 8101},
+}
+BENCH_ENV = {
+    "WARM_UP": "0",
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+}
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def import_seconds(target: dict) -> float:
+    """Seconds spent importing the module in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=target["module"])],
+        cwd=target["cwd"],
+        env={**os.environ, **BENCH_ENV},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def listen_seconds(target: dict) -> float:
+    """Seconds from spawning uvicorn until the port accepts connections."""
+    start = time.perf_counter()
+    process = start_process(
+        ["-m", "uvicorn", f"{target['module']}:app", "--port", str(target["port"]), "--log-level", "warning"],
+        target["cwd"], target["port"], BENCH_ENV,
+    )
+    elapsed = time.perf_counter() - start
+    process.terminate()
+    process.wait()
+    return elapsed
+
+
+def bench_target(target: dict, runs: int) -> dict:
+    try:
+        imports = [import_seconds(target) for _ in range(runs)]
+        listens = [listen_seconds(target) for _ in range(runs)]
+    except (RuntimeError, TimeoutError) as e:
+        return {"error": str(e)}
+    return {
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "listen_ms": round(statistics.median(listens) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    args = parser.parse_args()
+
+    results = {name: bench_target(TARGETS[name], args.runs) for name in args.targets}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Concurrent Gemini/Vertex calls: worker threads with a new connection per call vs the
+shared async client.
+
+Starts benchmarks/stub_llm_service.py (a fake generateContent API with --latency-ms per
+call) and has --sessions dictation sessions each make --calls calls back to back:
+- threads: the old path, `requests.post` without a session run on a pool of
+  LLM_WORKER_THREADS threads (one TCP connection per call, concurrency capped by threads)
+- async: summarizer.generate over llm_http's pooled keep-alive client, on the event loop
+
+Reports calls per second, per-call latency percentiles and the peak thread count.
+
+Usage:
+    python benchmarks/bench_llm_http.py --sessions 200 --calls 5 --latency-ms 400
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import APP_DIR, BENCH_DIR, percentile, start_process
+
+STUB_LLM_PORT = 9100
+STUB_LLM_URL = f"http://127.0.0.1:{STUB_LLM_PORT}/v1beta/models/fake:generateContent"
+
+# the limiter is not what is being measured
+os.environ.setdefault("LLM_MAX_CONCURRENCY_GEMINI", "100000")
+os.environ.setdefault("LLM_RATE_GEMINI", "100000")
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+import summarizer
+from llm_http import llm_http
+from concurrency import LLM_WORKER_THREADS
+
+PAYLOAD = summarizer.gemini_payload(["Transcribe this.", "File content: The budget review moved to Friday.", "User input: and lunch is at noon"])
+
+
+async def run(mode: str, sessions: int, calls: int) -> dict:
+    latencies = []
+    peak_threads = threading.active_count()
+    executor = ThreadPoolExecutor(max_workers=LLM_WORKER_THREADS) if mode == "threads" else None
+    loop = asyncio.get_running_loop()
+
+    def blocking_call():
+        response = requests.post(STUB_LLM_URL, json=PAYLOAD)
+        return summarizer.candidate_text(response.json())
+
+    async def session():
+        nonlocal peak_threads
+        for _ in range(calls):
+            start = time.perf_counter()
+            if executor is not None:
+                await loop.run_in_executor(executor, blocking_call)
+            else:
+                await summarizer.generate("gemini", STUB_LLM_URL, PAYLOAD, {})
+            latencies.append(time.perf_counter() - start)
+            peak_threads = max(peak_threads, threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    if executor is not None:
+        executor.shutdown()
+    await llm_http.aclose()
+    return {
+        "calls_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "peak_threads": peak_threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    args = parser.parse_args()
+
+    stub = start_process(["stub_llm_service.py"], BENCH_DIR, STUB_LLM_PORT, {"STUB_LLM_LATENCY_MS": str(args.latency_ms), "STUB_LLM_PORT": str(STUB_LLM_PORT)})
+    try:
+        results = {mode: asyncio.run(run(mode, args.sessions, args.calls)) for mode in ("threads", "async")}
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    json.dump({"sessions": args.sessions, "calls": args.calls, "latency_ms": args.latency_ms, "worker_threads": LLM_WORKER_THREADS, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
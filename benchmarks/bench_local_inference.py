@@ -0,0 +1,81 @@
+"""
+Throughput benchmark for the local continuous-batching backend, fully offline.
+
+Runs a randomly initialised GPT-2 (ByteTokenizer vocabulary) on CPU and has --users
+concurrent callers each generate --tokens tokens, once with batching disabled
+(max batch size 1, i.e. one forward pass per request per token) and once per requested
+batch size.
+
+Usage:
+    python benchmarks/bench_local_inference.py --users 16 --batch-sizes 1 4 16
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+import torch
+
+from common import APP_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from local_inference import ContinuousBatcher, ByteTokenizer, tiny_model
+
+PROMPT = "[INST] Append this to the notes: the budget review moved to Friday. [/INST]"
+
+
+class NoEosTokenizer(ByteTokenizer):
+    """A random model can emit end-of-sequence at any point; never stopping keeps runs comparable."""
+    eos_token_id = -1
+
+
+def run(model, batch_size: int, users: int, tokens: int, threads: int) -> dict:
+    batcher = ContinuousBatcher(model, NoEosTokenizer(), max_batch_size=batch_size, max_new_tokens=tokens, do_sample=False, num_threads=threads)
+    latencies = []
+    generated = []
+
+    def user():
+        start = time.perf_counter()
+        request = batcher.submit(PROMPT)
+        while request.tokens.get() is not None:
+            pass
+        latencies.append(time.perf_counter() - start)
+        generated.append(len(request.generated))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=user) for _ in range(users)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "tokens_per_s": round(sum(generated) / elapsed, 1),
+        "forward_passes": batcher.steps,
+        "p50_s": round(percentile(latencies, 50), 2),
+        "p95_s": round(percentile(latencies, 95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = tiny_model(n_layer=args.layers, n_embd=args.hidden)
+    results = {str(size): run(model, size, args.users, args.tokens, args.threads) for size in args.batch_sizes}
+    json.dump({"users": args.users, "tokens": args.tokens, "batch_size": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
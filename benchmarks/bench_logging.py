@@ -0,0 +1,135 @@
+"""
+Event-loop lag caused by logging on the hot path.
+
+--workers coroutines each handle a turn every --interval-ms and log a 200-character
+record for it. Every 50th turn also logs an error with a traceback. Meanwhile a monitor
+task sleeps 1 ms at a time and records how late it wakes up.
+
+stdout is a pipe drained at --sink-kbps, like a terminal or a log shipper that cannot keep
+up. The comparison:
+- print: print() to stdout and an open/append/close of error.log per error (the old code)
+- queue: logs.setup_logging, JSON records written by the listener thread, with throttling
+- queue_unthrottled: the same pipeline with throttling and sampling switched off
+
+Usage:
+    python benchmarks/bench_logging.py --workers 200 --seconds 5 --sink-kbps 256
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+
+from common import APP_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+import logs
+
+MESSAGE = "Recognized speech: " + "lorem ipsum dolor sit amet " * 7
+
+
+class SlowSink:
+    """A pipe whose reader drains at most kbps kilobytes per second."""
+
+    def __init__(self, kbps: float):
+        read_fd, write_fd = os.pipe()
+        self.stream = os.fdopen(write_fd, "w", buffering=1)
+        self.received = 0
+        self._read = os.fdopen(read_fd, "rb", buffering=0)
+        self._kbps = kbps
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        while chunk := self._read.read(4096):
+            self.received += len(chunk)
+            time.sleep(len(chunk) / (self._kbps * 1024))
+
+
+def fail():
+    raise RuntimeError("model call failed")
+
+
+async def run(mode: str, workers: int, seconds: float, interval: float, sink: SlowSink, error_file: str) -> dict:
+    logger = logging.getLogger("bench")
+    if mode != "print":
+        throttle = logs.Throttle(rate=float("inf"), sample_rate=1.0) if mode == "queue_unthrottled" else logs.Throttle()
+        logs.setup_logging("bench", stream=sink.stream, error_file=error_file, throttle=throttle)
+
+    def log_turn(n: int):
+        if mode == "print":
+            print(f"{MESSAGE} ({n})", file=sink.stream)
+        else:
+            logger.info("%s (%d)", MESSAGE, n)
+        if n % 50 == 0:
+            try:
+                fail()
+            except RuntimeError as error:
+                if mode == "print":
+                    with open(error_file, "a") as f:
+                        f.write(f"Error processing input:\nInput: {MESSAGE}\nError: {error}\n-----------------------------\n")
+                else:
+                    logger.exception("Error processing input", extra={"input": MESSAGE})
+
+    lags = []
+    logged = 0
+    deadline = time.perf_counter() + seconds
+
+    async def monitor():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def worker(offset: int):
+        nonlocal logged
+        n = offset
+        await asyncio.sleep(interval * offset / workers)
+        while time.perf_counter() < deadline:
+            log_turn(n)
+            logged += 1
+            n += workers
+            await asyncio.sleep(interval)
+
+    start = time.perf_counter()
+    await asyncio.gather(monitor(), *(worker(i) for i in range(workers)))
+    elapsed = time.perf_counter() - start
+    stats = logs.stats() if mode != "print" else {}
+    logs.stop_logging()
+    return {
+        "records_per_s": round(logged / elapsed),
+        "loop_lag_p50_ms": round(percentile(lags, 50) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags) * 1000, 2),
+        "overrun_s": round(elapsed - seconds, 2),
+        **{key: value for key, value in stats.items() if key != "queued"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--interval-ms", type=float, default=50, help="time between turns of one worker")
+    parser.add_argument("--sink-kbps", type=float, default=256, help="how fast stdout is drained")
+    parser.add_argument("--modes", nargs="+", default=["print", "queue", "queue_unthrottled"])
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            sink = SlowSink(args.sink_kbps)
+            results[mode] = asyncio.run(run(mode, args.workers, args.seconds, args.interval_ms / 1000, sink, os.path.join(directory, f"{mode}.log")))
+            results[mode]["stdout_kb_drained"] = round(sink.received / 1024)
+            sink.stream.close()
+
+    json.dump({"workers": args.workers, "sink_kbps": args.sink_kbps, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency and gateway memory for listing a long chat history.
+
+Seeds one user with --chats chats in the stub DB service, then reads them all through the
+gateway three ways, each against a freshly started gateway (read cache disabled):
+- full: GET /chats, the whole list in one JSON response
+- pages: GET /chats?limit=N, following next_cursor until the end
+- ndjson: GET /chats?format=ndjson, one streamed response
+
+Reports time to first byte, total time and the gateway's peak RSS growth over its peak
+after startup (from /proc, so Linux only).
+
+Usage:
+    python benchmarks/bench_pagination.py --chats 20000 --message-chars 500 --page 500
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import aiohttp
+
+from common import APP_DIR, BENCH_DIR, start_process
+from bench_gateway import STUB_PORT, STUB_URL, GATEWAY_PORT, GATEWAY_URL, BENCH_ENV
+
+
+def memory_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+async def seed(chats: int, message_chars: int) -> dict:
+    async with aiohttp.ClientSession() as client:
+        credentials = {"username": "history", "email": "history@example.com", "password": "history"}
+        async with client.post(f"{GATEWAY_URL}/auth/signup", json=credentials) as response:
+            token = (await response.json())["access_token"]
+        async with client.post(f"{GATEWAY_URL}/sessions", json={"session_name": "history"}, headers={"Authorization": f"Bearer {token}"}) as response:
+            session_id = (await response.json())["session_id"]
+        async with client.post(f"{STUB_URL}/auth/login", json=credentials) as response:
+            user_id = (await response.json())["id"]
+        message = "x" * message_chars
+        for start in range(0, chats, 1000):
+            batch = [{"user_id": user_id, "chat": {"session_id": session_id, "sender": str(user_id), "message": message}} for _ in range(start, min(chats, start + 1000))]
+            async with client.post(f"{STUB_URL}/chats/bulk", json=batch) as response:
+                await response.read()
+        return {"Authorization": f"Bearer {token}"}
+
+
+async def read_all(mode: str, headers: dict, page: int) -> dict:
+    received = 0
+    first_byte = None
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(GATEWAY_URL, timeout=aiohttp.ClientTimeout(total=600)) as client:
+        if mode == "pages":
+            cursor = None
+            while True:
+                params = {"limit": page, **({"after": cursor} if cursor is not None else {})}
+                async with client.get("/chats", params=params, headers=headers) as response:
+                    body = await response.json()
+                first_byte = first_byte or time.perf_counter()
+                received += len(body["items"])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+        elif mode == "ndjson":
+            async with client.get("/chats", params={"format": "ndjson"}, headers=headers) as response:
+                async for _ in response.content:
+                    first_byte = first_byte or time.perf_counter()
+                    received += 1
+        else:
+            async with client.get("/chats", headers=headers) as response:
+                body = await response.read()
+                first_byte = time.perf_counter()
+                received = len(json.loads(body))
+    return {"items": received, "first_byte_ms": round((first_byte - start) * 1000, 1), "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--message-chars", type=int, default=500)
+    parser.add_argument("--page", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=5, help="artificial stub DB latency")
+    args = parser.parse_args()
+
+    stub = start_process(["stub_db_service.py"], BENCH_DIR, STUB_PORT, {"STUB_DB_LATENCY_MS": str(args.latency_ms)})
+    env = {**BENCH_ENV, "READ_CACHE_SIZE": "0"}
+    results = {}
+    try:
+        headers = None
+        for mode in ("full", "pages", "ndjson"):
+            gateway = start_process(["-m", "uvicorn", "main:app", "--port", str(GATEWAY_PORT), "--log-level", "warning"], APP_DIR, GATEWAY_PORT, env)
+            try:
+                headers = headers or asyncio.run(seed(args.chats, args.message_chars))
+                idle = memory_kb(gateway.pid, "VmHWM")
+                results[mode] = asyncio.run(read_all(mode, headers, args.page))
+                results[mode]["peak_rss_growth_mb"] = round((memory_kb(gateway.pid, "VmHWM") - idle) / 1024, 1)
+            finally:
+                gateway.terminate()
+                gateway.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    json.dump({"chats": args.chats, "message_chars": args.message_chars, "page": args.page, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Time to first token of the local backend with and without reuse of the prompt prefix.
+
+Renders Mistral edit prompts for --prompts different chat histories (cycling through the
+tones) with prompts.MISTRAL_EDIT, counting tokens with the model's tokenizer, and submits
+them one at a time to a ContinuousBatcher running a randomly initialised GPT-2 on CPU:
+- full: the whole prompt is prefilled for every request
+- prefix: the static prefix's KV cache is reused, only the dynamic part is prefilled
+
+Also reports how long rendering and budget checking take per prompt.
+
+Usage:
+    python benchmarks/bench_prompts.py --prompts 50 --history-chars 600
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+import torch
+
+from common import APP_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from local_inference import ContinuousBatcher, ByteTokenizer, tiny_model
+from prompts import MISTRAL_EDIT, TONES, prompts
+
+WORDS = "the meeting notes budget review moved to friday please add action items for design and testing".split()
+
+
+def run(batcher: ContinuousBatcher, rendered: list, reuse: bool) -> dict:
+    latencies = []
+    for prompt in rendered:
+        start = time.perf_counter()
+        request = batcher.submit(prompt.text, max_new_tokens=1, prefix=prompt.prefix if reuse else "")
+        while request.tokens.get() is not None:
+            pass
+        latencies.append(time.perf_counter() - start)
+    return {
+        "first_token_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "first_token_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--history-chars", type=int, default=600)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    random.seed(0)
+    batcher = ContinuousBatcher(tiny_model(n_layer=args.layers, n_embd=args.hidden, n_positions=2048), ByteTokenizer(), max_new_tokens=1)
+    prompts.set_tokenizer("mistral", batcher.tokenizer, budget=batcher.max_positions - batcher.max_new_tokens)
+
+    tones = list(TONES)
+    start = time.perf_counter()
+    rendered = []
+    for i in range(args.prompts):
+        history = " ".join(random.choice(WORDS) for _ in range(args.history_chars // 5))[:args.history_chars]
+        rendered.append(MISTRAL_EDIT.render(tones[i % len(tones)], chat_history=history, user_prompt="add a line about the budget"))
+    render_ms = (time.perf_counter() - start) * 1000 / args.prompts
+
+    prefix_tokens = MISTRAL_EDIT.prefix_tokens(tones[0])
+    results = {"full": run(batcher, rendered, reuse=False), "prefix": run(batcher, rendered, reuse=True)}
+    results["prefix"]["prefix_hits"] = batcher.prefix_hits
+    json.dump({
+        "prompts": args.prompts,
+        "prompt_tokens_avg": round(sum(prompt.tokens for prompt in rendered) / len(rendered)),
+        "prefix_tokens": prefix_tokens,
+        "render_ms_per_prompt": round(render_ms, 3),
+        "results": results,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
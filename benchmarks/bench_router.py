@@ -0,0 +1,123 @@
+"""
+Tail latency of model calls through the backend router, against stub Gemini/Vertex APIs.
+
+Starts two benchmarks/stub_llm_service.py instances and sends --calls calls from
+--clients concurrent tasks through summarizer.transcribe_speech / execute_command:
+- tail: Gemini answers in about --latency-ms, but a share --slow-rate of calls takes
+  --slow-ms. Compares the router without hedging to hedging at HEDGE_PERCENTILE.
+- outage: Vertex hangs on every call and commands fail over to Gemini. Compares waiting
+  out --attempt-timeout on every call (breaker never opens) to the circuit breaker.
+
+Reports latency percentiles, calls that came back unchanged (failed) and the router's
+hedge and failover counts.
+
+Usage:
+    python benchmarks/bench_router.py --calls 400 --clients 16 --slow-rate 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from common import APP_DIR, BENCH_DIR, percentile, start_process
+
+GEMINI_PORT = 9100
+VERTEX_PORT = 9101
+
+# the limiter is not what is being measured
+for backend in ("GEMINI", "VERTEX"):
+    os.environ.setdefault(f"LLM_MAX_CONCURRENCY_{backend}", "100000")
+    os.environ.setdefault(f"LLM_RATE_{backend}", "100000")
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+import summarizer
+from llm_http import llm_http
+from router import BackendRouter, HEDGES, FAILOVERS
+
+DOCUMENT = "The budget review moved to Friday. Design and testing need action items."
+
+
+async def no_auth():
+    return {}
+
+
+def counts(counter) -> dict:
+    return {",".join(labels): value for _, labels, _, value in counter.samples()}
+
+
+async def run(scenario: str, router: BackendRouter, args) -> dict:
+    summarizer.router = router
+    classification, call = ("speech", summarizer.transcribe_speech) if scenario == "tail" else ("command", summarizer.execute_command)
+    user_input = "and lunch is at noon" if scenario == "tail" else "replace Friday with Monday"
+    prompt, context = summarizer.plan(classification, DOCUMENT, user_input)
+    hedges, failovers = counts(HEDGES), counts(FAILOVERS)
+    latencies = []
+    unchanged = 0
+    remaining = iter(range(args.calls))
+
+    async def client():
+        nonlocal unchanged
+        for _ in remaining:
+            start = time.perf_counter()
+            text = await call(prompt, context.window, user_input, "friendly")
+            latencies.append(time.perf_counter() - start)
+            unchanged += text == context.window
+
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    await llm_http.aclose()
+    after_hedges, after_failovers = counts(HEDGES), counts(FAILOVERS)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "unchanged": unchanged,
+        "hedges": {key: value - hedges.get(key, 0) for key, value in after_hedges.items() if value - hedges.get(key, 0)},
+        "failovers": {key: value - failovers.get(key, 0) for key, value in after_failovers.items() if value - failovers.get(key, 0)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of Gemini calls taking --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=4000)
+    parser.add_argument("--attempt-timeout", type=float, default=3, help="LLM_ATTEMPT_TIMEOUT")
+    parser.add_argument("--hedges-per-minute", type=float, default=100000)
+    args = parser.parse_args()
+
+    summarizer.gemini_url = f"http://127.0.0.1:{GEMINI_PORT}/v1beta/models/stub:generateContent"
+    summarizer.url = f"http://127.0.0.1:{VERTEX_PORT}/v1/endpoints/stub:generateContent"
+    summarizer.vertex_headers = no_auth
+    summarizer.response_cache.backends = set()  # every call goes to the stubs
+
+    stubs = [
+        start_process(["stub_llm_service.py"], BENCH_DIR, GEMINI_PORT, {"STUB_LLM_PORT": str(GEMINI_PORT), "STUB_LLM_LATENCY_MS": str(args.latency_ms), "STUB_LLM_SLOW_RATE": str(args.slow_rate), "STUB_LLM_SLOW_MS": str(args.slow_ms)}),
+        start_process(["stub_llm_service.py"], BENCH_DIR, VERTEX_PORT, {"STUB_LLM_PORT": str(VERTEX_PORT), "STUB_LLM_SLOW_RATE": "1", "STUB_LLM_SLOW_MS": "60000"}),
+    ]
+    try:
+        results = {
+            "tail": {
+                "no_hedging": asyncio.run(run("tail", BackendRouter(hedges_per_minute=0, attempt_timeout=args.slow_ms / 1000 + 1), args)),
+                "hedged": asyncio.run(run("tail", BackendRouter(hedges_per_minute=args.hedges_per_minute, attempt_timeout=args.slow_ms / 1000 + 1), args)),
+            },
+            "outage": {
+                "no_breaker": asyncio.run(run("outage", BackendRouter(hedges_per_minute=0, attempt_timeout=args.attempt_timeout, breaker_failures=10**9), args)),
+                "breaker": asyncio.run(run("outage", BackendRouter(hedges_per_minute=0, attempt_timeout=args.attempt_timeout), args)),
+            },
+        }
+    finally:
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+
+    json.dump({"calls": args.calls, "clients": args.clients, "latency_ms": args.latency_ms, "slow_rate": args.slow_rate, "slow_ms": args.slow_ms, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Cost of recording dictation turns in the session op log, and how fast sessions come back.
+
+Simulates --sessions sessions that each start from a --doc-chars document and take
+--turns turns (mostly appended sentences, every fifth turn an edit in the middle), stored in a
+DurableSessionStore in a temporary directory. Measures:
+- per turn: time and bytes logged as edit ops, vs a record of the whole state (what
+  writing the full document on every turn costs)
+- recovery: rebuilding all sessions from the logs alone, and from a snapshot after
+  compaction
+
+Usage:
+    python benchmarks/bench_session_log.py --sessions 200 --turns 50 --doc-chars 5000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from common import APP_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+from document import Document
+from oplog import encode
+from session_store import DurableSessionStore
+
+WORDS = "the meeting notes budget review moved to friday please add action items for design and testing".split()
+
+
+def sentence(rng: random.Random) -> str:
+    return " " + " ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "."
+
+
+async def run(directory: str, args) -> dict:
+    rng = random.Random(0)
+    store = DurableSessionStore(directory, checkpoint_interval=0, max_sessions=args.sessions * 2)
+    store.log.compact_bytes = 1 << 62  # compacted explicitly below
+    await store.start()
+    latencies = []
+    full_bytes = 0
+    for session in range(args.sessions):
+        text = "".join(sentence(rng) for _ in range(args.doc_chars // 80))
+        await store.set(f"session-{session}", Document(text, 1).to_state())
+    logged = store.log.offset
+    for turn in range(args.turns):
+        for session in range(args.sessions):
+            session_id = f"session-{session}"
+            state = await store.get(session_id)
+            document = Document.from_state(state)
+            if turn % 5 == 4:
+                middle = len(document.text) // 2
+                document.update(document.text[:middle] + sentence(rng) + document.text[middle + 40:])
+            else:
+                document.update(document.text + sentence(rng))
+            new_state = {**state, **document.to_state()}
+            full_bytes += len(encode({"t": "set", "s": session_id, "state": new_state}))
+            start = time.perf_counter()
+            await store.set(session_id, new_state)
+            latencies.append(time.perf_counter() - start)
+    turns = args.sessions * args.turns
+    ops_bytes = store.log.offset - logged
+    expected = {session_id: entry[0] for session_id, entry in store._entries.items()}
+    await store.close()
+
+    start = time.perf_counter()
+    recovered = DurableSessionStore(directory, checkpoint_interval=0).log.recover()
+    from_log_ms = (time.perf_counter() - start) * 1000
+    assert recovered == expected
+
+    store = DurableSessionStore(directory, checkpoint_interval=0, max_sessions=args.sessions * 2)
+    await store.start()
+    store.log.compact_bytes = 0
+    await store.set("session-0", {**expected["session-0"]})  # any write now triggers compaction
+    await store.close()
+    start = time.perf_counter()
+    recovered = DurableSessionStore(directory, checkpoint_interval=0).log.recover()
+    from_snapshot_ms = (time.perf_counter() - start) * 1000
+    assert recovered == expected
+
+    return {
+        "turns": turns,
+        "set_p50_us": round(percentile(latencies, 50) * 1e6, 1),
+        "set_p99_us": round(percentile(latencies, 99) * 1e6, 1),
+        "logged_bytes_per_turn": round(ops_bytes / turns),
+        "full_state_bytes_per_turn": round(full_bytes / turns),
+        "recover_from_log_ms": round(from_log_ms, 1),
+        "recover_from_snapshot_ms": round(from_snapshot_ms, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--doc-chars", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = asyncio.run(run(directory, args))
+    json.dump({"sessions": args.sessions, "doc_chars": args.doc_chars, "results": result}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
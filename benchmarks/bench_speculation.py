@@ -0,0 +1,135 @@
+"""
+Turn latency of classify_input with and without speculative execution, on fake backends.
+
+Replays the utterance corpus (JSON lines with "text" and "label") through
+summarizer.classify_input from --clients concurrent tasks, as the WebSocket service does.
+The model calls are replaced by sleeps drawn from a log-normal distribution around
+--classify-ms, --transcribe-ms and --execute-ms; the remote classifier answers with the
+corpus label. Modes:
+- serial: remote classification, then the downstream call
+- speculative: the likelier downstream call starts alongside the remote classifier
+
+Only inputs the local detector cannot decide go to the remote classifier, so by default
+few turns are affected; --remote-all sends every input there, as without the detector.
+
+Usage:
+    python benchmarks/bench_speculation.py --turns 400 --clients 8 --remote-all
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from common import APP_DIR, BENCH_DIR, percentile
+
+sys.path.insert(0, os.path.join(APP_DIR, "services"))
+import summarizer
+from command_detector import CommandDetector
+from concurrency import SpeculationBudget
+
+DOCUMENT = "\n\n".join(f"Paragraph {i}. The budget review moved to Friday and the notes need an update." for i in range(20))
+
+
+class Backends:
+    """Stands in for Gemini and Vertex; counts the calls made and how many nobody used."""
+
+    def __init__(self, args, labels: dict):
+        self.args = args
+        self.labels = labels
+        self.calls = {"classify": 0, "transcribe": 0, "execute": 0}
+
+    async def wait(self, kind: str, median_ms: float):
+        self.calls[kind] += 1
+        await asyncio.sleep(random.lognormvariate(0, self.args.sigma) * median_ms / 1000)
+
+    async def remote_classify(self, user_input):
+        await self.wait("classify", self.args.classify_ms)
+        return self.labels[user_input]
+
+    async def transcribe_speech(self, prompt, file_content, *route_args):
+        await self.wait("transcribe", self.args.transcribe_ms)
+        return file_content + " Transcribed."
+
+    async def execute_command(self, prompt, file_content, *route_args):
+        await self.wait("execute", self.args.execute_ms)
+        return file_content.replace("Friday", "Monday")
+
+
+class UndecidedDetector(CommandDetector):
+    """Scores like the real detector but never decides locally."""
+
+    def classify(self, text: str):
+        return None
+
+
+async def run(mode: str, corpus: list, args) -> dict:
+    backends = Backends(args, {item["text"]: item["label"] for item in corpus})
+    summarizer.remote_classify = backends.remote_classify
+    summarizer.transcribe_speech = backends.transcribe_speech
+    summarizer.execute_command = backends.execute_command
+    summarizer.detector = UndecidedDetector() if args.remote_all else CommandDetector()
+    summarizer.speculation_budget = SpeculationBudget(args.budget_per_minute if mode == "speculative" else 0)
+
+    turns = [corpus[i % len(corpus)]["text"] for i in range(args.turns)]
+    latencies = []
+    remote_latencies = []
+    next_turn = iter(turns)
+
+    async def client():
+        for text in next_turn:
+            remote = summarizer.detector.classify(text) is None
+            start = time.perf_counter()
+            await summarizer.classify_input(DOCUMENT, text)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            if remote:
+                remote_latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    downstream = backends.calls["transcribe"] + backends.calls["execute"]
+    result = {
+        "turn_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "turn_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "turns_per_s": round(len(latencies) / elapsed, 1),
+        "remote_classified": len(remote_latencies),
+        "model_calls": backends.calls,
+        "wasted_calls": downstream - len(latencies),
+    }
+    if remote_latencies:
+        result["remote_turn_p50_ms"] = round(percentile(remote_latencies, 50) * 1000, 1)
+        result["remote_turn_p95_ms"] = round(percentile(remote_latencies, 95) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "data", "utterances.jsonl"))
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--classify-ms", type=float, default=450)
+    parser.add_argument("--transcribe-ms", type=float, default=900)
+    parser.add_argument("--execute-ms", type=float, default=1200)
+    parser.add_argument("--sigma", type=float, default=0.3, help="spread of the log-normal call latencies")
+    parser.add_argument("--budget-per-minute", type=float, default=100000, help="SPECULATION_PER_MINUTE in speculative mode")
+    parser.add_argument("--remote-all", action="store_true", help="send every input to the remote classifier")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    results = {}
+    for mode in ("serial", "speculative"):
+        random.seed(0)
+        results[mode] = asyncio.run(run(mode, corpus, args))
+    json.dump({"turns": args.turns, "clients": args.clients, "remote_all": args.remote_all, "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
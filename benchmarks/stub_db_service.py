@@ -0,0 +1,117 @@
+"""
+Local stand-in for the DB service used by the gateway benchmarks.
+
+Keeps users, sessions and chats in memory and adds a fixed artificial latency to every
+call (STUB_DB_LATENCY_MS) so benchmarks see a realistic round trip without a real database.
+
+Run it directly:
+    STUB_DB_LATENCY_MS=5 python benchmarks/stub_db_service.py
+"""
+
+import os
+import asyncio
+import itertools
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+STUB_DB_LATENCY_MS = float(os.getenv("STUB_DB_LATENCY_MS", "5"))
+STUB_DB_PORT = int(os.getenv("STUB_DB_PORT", "9000"))
+
+app = FastAPI()
+
+users = {}
+sessions = {}
+chats = {}
+ids = itertools.count(1)
+
+
+@app.middleware("http")
+async def simulated_latency(request: Request, call_next):
+    if STUB_DB_LATENCY_MS:
+        await asyncio.sleep(STUB_DB_LATENCY_MS / 1000)
+    return await call_next(request)
+
+
+@app.post("/users")
+async def create_user(user: dict):
+    if any(u["email"] == user["email"] for u in users.values()):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user_id = next(ids)
+    users[user_id] = {**user, "id": user_id}
+    return users[user_id]
+
+
+@app.post("/auth/login")
+async def login(credentials: dict):
+    for user in users.values():
+        if user["email"] == credentials["email"] and user["password"] == credentials["password"]:
+            return user
+    raise HTTPException(status_code=400, detail="Incorrect email or password")
+
+
+def page(items, user_id: int | None, id_field: str, after: int | None, limit: int | None) -> list:
+    """Keyset page of items (kept in id order), as a DB that supports after/limit returns it."""
+    result = []
+    for item in items:
+        if (user_id is None or item["user_id"] == user_id) and (after is None or item[id_field] > after):
+            result.append(item)
+            if limit is not None and len(result) == limit:
+                break
+    return result
+
+
+@app.get("/sessions")
+async def read_sessions(user_id: int = None, after: int = None, limit: int = None):
+    return page(sessions.values(), user_id, "session_id", after, limit)
+
+
+@app.post("/sessions")
+async def create_session(session: dict, user_id: int = None):
+    session_id = next(ids)
+    sessions[session_id] = {**session, "session_id": session_id, "user_id": user_id}
+    return sessions[session_id]
+
+
+@app.get("/sessions/{session_id}")
+async def read_session(session_id: int, user_id: int = None):
+    if session_id not in sessions:
+        raise HTTPException(status_code=404)
+    return sessions[session_id]
+
+
+@app.patch("/sessions/{session_id}")
+async def update_session(session_id: int, data: dict, user_id: int = None):
+    session = sessions.setdefault(session_id, {"session_id": session_id, "user_id": user_id, "session_name": "", "context": {}})
+    if "context" in data:  # a Session body replaces the context, like the DB service does
+        session.update({key: value for key, value in data.items() if key in ("context", "session_name")})
+    else:  # bare context fields
+        session["context"] = {**session.get("context", {}), **data}
+    return session
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: int, user_id: int = None):
+    if sessions.pop(session_id, None) is None:
+        raise HTTPException(status_code=404)
+    return {"message": "Session deleted"}
+
+
+@app.get("/chats")
+async def read_chats(user_id: int = None, after: int = None, limit: int = None):
+    return page(chats.values(), user_id, "chats_id", after, limit)
+
+
+@app.post("/chats")
+async def create_chat(chat: dict, user_id: int = None):
+    chat_id = next(ids)
+    chats[chat_id] = {**chat, "chats_id": chat_id, "user_id": user_id}
+    return chats[chat_id]
+
+
+@app.post("/chats/bulk")
+async def create_chats(items: list[dict]):
+    return [await create_chat(item["chat"], item["user_id"]) for item in items]
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=STUB_DB_PORT, log_level="warning")
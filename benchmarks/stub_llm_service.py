@@ -0,0 +1,94 @@
+"""
+Local stand-in for the Gemini and Vertex generateContent APIs used by the LLM benchmarks.
+
+Answers `POST .../<model or endpoint>:generateContent` with the "File content" part of the
+request plus " Done." and `:streamGenerateContent?alt=sse` with the same text split over
+STUB_LLM_CHUNKS server-sent events. Each call takes a log-normal time around
+STUB_LLM_LATENCY_MS (spread STUB_LLM_SIGMA); a share STUB_LLM_SLOW_RATE of calls takes
+STUB_LLM_SLOW_MS instead, like a backend with a heavy tail. STUB_LLM_FAIL_RATE of calls
+return 503. With STUB_LLM_TOKENS_PER_S set, that time is only the wait for the first
+token, and the output (4 characters per token) is then generated at that rate.
+
+Run it directly:
+    STUB_LLM_LATENCY_MS=400 python benchmarks/stub_llm_service.py
+"""
+
+import os
+import json
+import random
+import asyncio
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "400"))
+STUB_LLM_SIGMA = float(os.getenv("STUB_LLM_SIGMA", "0.3"))
+STUB_LLM_SLOW_RATE = float(os.getenv("STUB_LLM_SLOW_RATE", "0"))
+STUB_LLM_SLOW_MS = float(os.getenv("STUB_LLM_SLOW_MS", "5000"))
+STUB_LLM_FAIL_RATE = float(os.getenv("STUB_LLM_FAIL_RATE", "0"))
+STUB_LLM_CHUNKS = int(os.getenv("STUB_LLM_CHUNKS", "5"))
+STUB_LLM_TOKENS_PER_S = float(os.getenv("STUB_LLM_TOKENS_PER_S", "0"))  # 0: the whole output arrives after the latency
+STUB_LLM_PORT = int(os.getenv("STUB_LLM_PORT", "9100"))
+
+app = FastAPI()
+calls = {"generate": 0, "stream": 0, "failed": 0}
+
+
+def latency() -> float:
+    if random.random() < STUB_LLM_SLOW_RATE:
+        return STUB_LLM_SLOW_MS / 1000
+    return random.lognormvariate(0, STUB_LLM_SIGMA) * STUB_LLM_LATENCY_MS / 1000
+
+
+def generation_time(text: str) -> float:
+    return len(text) / 4 / STUB_LLM_TOKENS_PER_S if STUB_LLM_TOKENS_PER_S else 0.0
+
+
+def answer(body: dict) -> str:
+    parts = [part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])]
+    file_content = next((part[len("File content: "):] for part in parts if part.startswith("File content: ")), None)
+    if file_content is None:  # the classifier prompt
+        return "command" if any("delete" in part or "replace" in part for part in parts[1:]) else "speech"
+    return file_content + " Done."
+
+
+def event(text: str, usage: bool = False) -> dict:
+    data = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+    if usage:
+        data["usageMetadata"] = {"promptTokenCount": 100, "candidatesTokenCount": max(1, len(text) // 4)}
+    return data
+
+
+@app.post("/{path:path}")
+async def generate(path: str, request: Request):
+    body = await request.json()
+    if random.random() < STUB_LLM_FAIL_RATE:
+        calls["failed"] += 1
+        await asyncio.sleep(latency() / 4)
+        return JSONResponse({"error": {"code": 503, "message": "overloaded"}}, status_code=503)
+    text = answer(body)
+    if not path.endswith(":streamGenerateContent"):
+        calls["generate"] += 1
+        await asyncio.sleep(latency() + generation_time(text))
+        return event(text, usage=True)
+
+    calls["stream"] += 1
+    first = latency()
+    size = max(1, -(-len(text) // STUB_LLM_CHUNKS))
+    pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    async def events():
+        for i, piece in enumerate(pieces):
+            wait = generation_time(piece) if STUB_LLM_TOKENS_PER_S else first / len(pieces)
+            await asyncio.sleep(wait + (first if STUB_LLM_TOKENS_PER_S and i == 0 else 0))
+            yield f"data: {json.dumps(event(piece, usage=i == len(pieces) - 1))}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/calls")
+async def read_calls():
+    return calls
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=STUB_LLM_PORT, log_level="warning")
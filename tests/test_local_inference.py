@@ -0,0 +1,53 @@
+"""
+ContinuousBatcher against a tiny random model (no download): greedy output must not depend
+on which other prompts share the batch, or on whether the prompt's prefix came from the cache.
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from local_inference import ContinuousBatcher, ByteTokenizer, tiny_model
+
+PREFIX = "You are a helpful editor. Apply the instruction to the text.\n"
+PROMPTS = [
+    "Text: the meeting moved to friday.\nInstruction: make it formal.",
+    "Text: hi\nInstruction: expand",
+    "Text: budget review, design and testing need action items for next week.\nInstruction: bullet points.",
+    "Text: ok\nInstruction: shorten it",
+]
+MAX_NEW_TOKENS = 24
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return tiny_model()
+
+
+def collect(request) -> list:
+    ids = []
+    while (token := request.tokens.get(timeout=60)) is not None:
+        ids.append(token)
+    if request.error is not None:
+        raise request.error
+    return ids
+
+
+def test_batched_greedy_output_matches_single_prompts(model):
+    single = ContinuousBatcher(model, ByteTokenizer(), max_batch_size=1, max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    expected = [collect(single.submit(prompt)) for prompt in PROMPTS]
+
+    batched = ContinuousBatcher(model, ByteTokenizer(), max_batch_size=len(PROMPTS), max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    requests = [batched.submit(prompt) for prompt in PROMPTS]  # different lengths, so rows are left-padded
+    assert [collect(request) for request in requests] == expected
+    assert batched.steps < single.steps
+
+
+def test_prefix_cached_output_matches_uncached(model):
+    batcher = ContinuousBatcher(model, ByteTokenizer(), max_batch_size=2, max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    uncached = [collect(batcher.submit(PREFIX + prompt)) for prompt in PROMPTS]
+    cached = [collect(batcher.submit(PREFIX + prompt, prefix=PREFIX)) for prompt in PROMPTS]
+    assert cached == uncached
+    assert batcher.prefix_hits >= len(PROMPTS) - 1